@@ -1,3 +1,4 @@
+import multiprocessing
 import signal
 import sys
 import click
@@ -23,11 +24,17 @@ def cli(ctx, version):
 @cli.command()
 @click.option("--port", default=8000, help="Port number for the server.")
 @click.option("--db_path", default=None, help="Path to the database.")
-def server(port, db_path):
+@click.option(
+    "--completion_cache",
+    is_flag=True,
+    help="Reuse model responses for identical temperature 0 queries.",
+)
+def server(port, db_path, completion_cache):
     """Start the theseus Agent server."""
     import uvicorn
 
     app.db_path = db_path
+    app.completion_cache = completion_cache
 
     def signal_handler(sig, frame):
         print("Received signal to terminate. Shutting down gracefully...")
@@ -52,6 +59,9 @@ cli.add_command(server)
 
 
 def main():
+    # A spawned worker (lint service, graph builder pool) starts this executable
+    # again in a PyInstaller build, this makes it run the worker instead of the CLI
+    multiprocessing.freeze_support()
     cli()
 
 
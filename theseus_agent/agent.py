@@ -1,5 +1,5 @@
-from dataclasses import dataclass
-from typing import TYPE_CHECKING
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Optional
 
 from theseus_agent.config import AgentConfig, Config
 from theseus_agent.model import (AnthropicModel, GroqModel, OllamaModel,
@@ -15,9 +15,30 @@ class Agent:
     global_config: Config
     agent_config: AgentConfig
     interrupt: str = ""
+    current_model: Any = field(default=None, repr=False)
+    current_model_key: Optional[tuple] = field(default=None, repr=False)
 
     def run(self, session: "Session", observation: str = None): ...
 
+    def _initialize_model(self): ...
+
+    def get_model(self):
+        """
+        Return the model for the current agent config, reusing the previous
+        instance unless model, key, base, prompt type or temperature changed.
+        """
+        model_key = (
+            self.agent_config.model,
+            self.agent_config.api_key,
+            self.agent_config.api_base,
+            self.agent_config.prompt_type,
+            self.agent_config.temperature,
+        )
+        if self.current_model is None or model_key != self.current_model_key:
+            self.current_model = self._initialize_model()
+            self.current_model_key = model_key
+        return self.current_model
+
 
 DEFAULT_MODELS = {
     "gpt4-o": OpenAiModel,
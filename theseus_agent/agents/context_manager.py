@@ -0,0 +1,158 @@
+from typing import Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Used when a model does not declare its context window in MODELS
+DEFAULT_CONTEXT_WINDOW = 128000
+
+# Share of the budget the editor view may take before files are hidden
+EDITOR_SHARE = 0.3
+
+# Observations larger than this are cut down once they are no longer recent
+MAX_OBSERVATION_TOKENS = 2000
+
+# Number of most recent history entries that are never truncated
+KEEP_RECENT = 6
+
+_encoding = None
+
+
+def get_encoding():
+    """
+    Shared tiktoken encoding, or None when tiktoken is missing or its encoding
+    file cannot be loaded, in which case tokens are estimated from length.
+    """
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    return _encoding or None
+
+
+class ContextManager:
+    """
+    Keeps an agent's prompt inside a token budget.
+
+    Token counts of chat history entries are tracked incrementally, so only new
+    entries are counted on each step. When the prompt would not fit, old
+    observations are shortened, then the oldest history is dropped, and
+    open editor files that were not viewed recently are hidden from the view.
+    Neither the chat history nor the editor state is modified.
+    """
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+        self._encoding = get_encoding()
+
+        self._history = None
+        self._history_tokens: List[int] = []
+
+        self._step = 0
+        self._editor_seen: Dict[str, tuple] = {}
+        self._last_viewed: Dict[str, int] = {}
+
+    @classmethod
+    def for_model(cls, model_metadata: Dict, max_tokens: Optional[int] = None):
+        """Budget from an explicit limit or from the model's context window minus its output tokens."""
+        if max_tokens is None:
+            max_tokens = model_metadata.get(
+                "context_window", DEFAULT_CONTEXT_WINDOW
+            ) - model_metadata.get("max_tokens", 4096)
+        return cls(max_tokens)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is None:
+            return len(text) // 4
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+    def _entry_text(self, entry: Dict) -> str:
+        return str(entry.get("content") or "")
+
+    def history_tokens(self, history: List[Dict]) -> List[int]:
+        """Token count per history entry, counting only entries added since the last call."""
+        if history is not self._history or len(history) < len(self._history_tokens):
+            self._history = history
+            self._history_tokens = []
+        for entry in history[len(self._history_tokens) :]:
+            self._history_tokens.append(self.count(self._entry_text(entry)))
+        return self._history_tokens
+
+    def _shorten(self, entry: Dict, tokens: int) -> Dict:
+        text = self._entry_text(entry)
+        # Keep the head and tail, errors and results usually sit at either end
+        keep = len(text) * MAX_OBSERVATION_TOKENS // (2 * tokens)
+        omitted = tokens - MAX_OBSERVATION_TOKENS
+        shortened = (
+            text[:keep] + f"\n... [{omitted} tokens of output omitted] ...\n" + text[-keep:]
+        )
+        return {**entry, "content": shortened}
+
+    def fit_history(self, history: List[Dict], budget: int) -> List[Dict]:
+        """
+        Return the newest history entries that fit in budget tokens, with old
+        oversized observations shortened and a marker where entries were dropped.
+        """
+        tokens = self.history_tokens(history)
+        fitted = []
+        used = 0
+        for index in range(len(history) - 1, -1, -1):
+            entry = history[index]
+            entry_tokens = tokens[index]
+            recent = index >= len(history) - KEEP_RECENT
+            if (
+                not recent
+                and entry["role"] == "user"
+                and entry_tokens > MAX_OBSERVATION_TOKENS
+            ):
+                entry = self._shorten(entry, entry_tokens)
+                entry_tokens = MAX_OBSERVATION_TOKENS
+            if used + entry_tokens > budget and fitted:
+                fitted.append(
+                    {
+                        "role": "user",
+                        "content": f"[{index + 1} earlier messages omitted to fit the context window]",
+                    }
+                )
+                break
+            fitted.append(entry)
+            used += entry_tokens
+        fitted.reverse()
+        return fitted
+
+    def fit_editor(self, files: Dict[str, Dict], budget: int, render) -> Dict[str, Dict]:
+        """
+        Return the editor files to show. render(path, file) must produce the
+        text that goes into the prompt for one file. Files are hidden least
+        recently viewed first, where a file counts as viewed when its page or
+        content changed.
+        """
+        self._step += 1
+        for path, file in files.items():
+            signature = (file.get("page"), hash(file.get("lines", "")))
+            if self._editor_seen.get(path) != signature:
+                self._editor_seen[path] = signature
+                self._last_viewed[path] = self._step
+        for path in list(self._editor_seen):
+            if path not in files:
+                del self._editor_seen[path]
+                del self._last_viewed[path]
+
+        sizes = {path: self.count(render(path, file)) for path, file in files.items()}
+        visible = dict(files)
+        used = sum(sizes.values())
+        for path in sorted(files, key=lambda p: self._last_viewed[p]):
+            if used <= budget or len(visible) == 1:
+                break
+            del visible[path]
+            used -= sizes[path]
+        return visible
+
+    def editor_budget(self) -> int:
+        return int(self.max_tokens * EDITOR_SHARE)
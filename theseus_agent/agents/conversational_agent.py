@@ -7,6 +7,7 @@ import litellm
 from tenacity import RetryError
 
 from theseus_agent.agent import Agent
+from theseus_agent.agents.context_manager import ContextManager
 from theseus_agent.agents.prompts.anthropic_prompts import (
     anthropic_commands_to_command_docs, anthropic_history_to_bash_history,
     conversational_agent_last_user_prompt_template_v3,
@@ -19,6 +20,7 @@ from theseus_agent.model import AnthropicModel, ModelArguments, OpenAiModel
 from theseus_agent.tools import parse_command
 from theseus_agent.tools.utils import get_cwd
 from theseus_agent.utils.config_utils import make_checkpoint
+from theseus_agent.utils.rate_limiter import RateLimited
 from theseus_agent.utils.utils import LOGGER_NAME, Hallucination
 
 if TYPE_CHECKING:
@@ -26,6 +28,9 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(LOGGER_NAME)
 
+# Minimum seconds between ModelStream events while a completion is streaming
+STREAM_INTERVAL = 0.1
+
 
 def parse_response(response):
     if "<thought>" in response:
@@ -45,6 +50,8 @@ def parse_response(response):
 
 class ConversationalAgent(Agent):
     scratchpad: str = None
+    context_manager: ContextManager = None
+    _context_manager_key: tuple = None
 
     default_models = {
         "gpt4-o": OpenAiModel,
@@ -107,6 +114,27 @@ class ConversationalAgent(Agent):
             [self._format_editor_entry(k, v, PAGE_SIZE) for k, v in editor.items()]
         )
 
+    def get_context_manager(self):
+        """
+        Context manager for the current model, rebuilt whenever get_model
+        switched to a different model.
+        """
+        model_key = (self.current_model_key, self.agent_config.max_context_tokens)
+        if self.context_manager is None or self._context_manager_key != model_key:
+            self.context_manager = ContextManager.for_model(
+                self.current_model.model_metadata, self.agent_config.max_context_tokens
+            )
+            self._context_manager_key = model_key
+        return self.context_manager
+
+    def _fit_history(self, *prompt_parts):
+        """Chat history that fits next to the given system and user prompt parts."""
+        context_manager = self.get_context_manager()
+        budget = context_manager.max_tokens - sum(
+            context_manager.count(part) for part in prompt_parts if part
+        )
+        return context_manager.fit_history(self.agent_config.chat_history, budget)
+
     def _prepare_anthropic(self, task, editor, session, scratchpad=None):
         command_docs = (
             "Custom Commands Documentation:\n"
@@ -116,8 +144,10 @@ class ConversationalAgent(Agent):
             + "\n"
         )
 
-        history = anthropic_history_to_bash_history(self.agent_config.chat_history)
         system_prompt = conversational_agent_system_prompt_template_v3(command_docs)
+        history = anthropic_history_to_bash_history(
+            self._fit_history(system_prompt, editor, scratchpad)
+        )
         last_user_prompt = conversational_agent_last_user_prompt_template_v3(
             history,
             editor,
@@ -146,12 +176,12 @@ class ConversationalAgent(Agent):
             + "\n"
         )
 
+        system_prompt = openai_conversation_agent_system_prompt_template(command_docs)
         history = [
             entry
-            for entry in self.agent_config.chat_history
+            for entry in self._fit_history(system_prompt, task, editor, scratchpad)
             if entry["role"] == "user" or entry["role"] == "assistant"
         ]
-        system_prompt = openai_conversation_agent_system_prompt_template(command_docs)
         last_user_prompt = openai_conversation_agent_last_user_prompt_template(
             task,
             editor,
@@ -169,22 +199,66 @@ class ConversationalAgent(Agent):
         messages = history + [{"role": "user", "content": last_user_prompt}]
         return messages, system_prompt
 
+    def _stream_to_subscribers(self, session: "Session"):
+        """
+        Build an on_token callback that publishes partial model output to the
+        event log's live subscribers as ModelStream events, batching tokens per
+        STREAM_INTERVAL, and a flush function that emits whatever is still
+        batched once the stream ends. The events are not appended to the log,
+        the complete output is recorded by the ModelResponse that follows.
+        """
+        buffer = []
+        last_emit = 0.0
+
+        def flush():
+            nonlocal last_emit
+            if buffer:
+                session.event_log.publish(
+                    {
+                        "type": "ModelStream",
+                        "content": "".join(buffer),
+                        "producer": self.name,
+                        "consumer": "user",
+                    }
+                )
+                buffer.clear()
+            last_emit = time.time()
+
+        def on_token(token: str):
+            buffer.append(token)
+            if time.time() - last_emit >= STREAM_INTERVAL or "\n" in token:
+                flush()
+
+        return on_token, flush
+
     def predict(
         self,
         task: str,
         observation: str,
         session: "Session",
     ) -> Tuple[str, str, str]:
-        self.current_model = self._initialize_model()
+        self.current_model = self.get_model()
 
         if self.interrupt:
             observation = observation + ". also " + "YOU HAVE BEEN **INTERRUPTED**. You got the following message :   " + self.interrupt + "   : **INTERRUPTED**"
             self.interrupt = ""
 
         try:
-            editor = self._convert_editor_to_view(
-                session.config.state["editor"]["files"], session.config.state["editor"]["PAGE_SIZE"]
+            context_manager = self.get_context_manager()
+            page_size = session.config.state["editor"]["PAGE_SIZE"]
+            editor_files = context_manager.fit_editor(
+                session.config.state["editor"]["files"],
+                context_manager.editor_budget(),
+                lambda path, file: self._format_editor_entry(path, file, page_size),
             )
+            editor = self._convert_editor_to_view(editor_files, page_size)
+            hidden = [
+                path
+                for path in session.config.state["editor"]["files"]
+                if path not in editor_files
+            ]
+            if hidden:
+                editor += f"\n[Open files hidden to fit the context window, scroll them to show them again: {', '.join(hidden)}]\n"
 
             self.agent_config.chat_history.append(
                 {"role": "user", "content": observation, "agent": self.name}
@@ -206,11 +280,20 @@ class ConversationalAgent(Agent):
             messages, system_prompt = prompts[self.agent_config.prompt_type](
                 task, editor, session, session.config.state["scratchpad"]
             )
+            on_token, flush_stream = (
+                self._stream_to_subscribers(session)
+                if self.agent_config.stream
+                else (None, None)
+            )
             output = None
             while not output:
                 try:
-                    output = self.current_model.query(messages, system_message=system_prompt)
-                except litellm.RateLimitError:
+                    output = self.current_model.query(
+                        messages, system_message=system_prompt, on_token=on_token
+                    )
+                    if flush_stream is not None:
+                        flush_stream()
+                except (litellm.RateLimitError, RateLimited):
                     session.event_log.append(
                         {
                             "type": "RateLimit",
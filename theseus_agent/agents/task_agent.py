@@ -277,7 +277,7 @@ class TaskAgent(Agent):
         observation: str,
         session: "Session",
     ) -> Tuple[str, str, str]:
-        self.current_model = self._initialize_model()
+        self.current_model = self.get_model()
 
         if self.interrupt:
             observation = observation + ". also " + self.interrupt
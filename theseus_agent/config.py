@@ -14,6 +14,8 @@ class AgentConfig(BaseModel):
     prompt_type: Optional[str] = None
     api_key: Optional[str] = None
     temperature: float = 0.0
+    stream: bool = True
+    max_context_tokens: Optional[int] = None
     chat_history: List[dict] = []
 
 class Checkpoint(BaseModel):
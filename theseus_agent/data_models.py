@@ -1,5 +1,10 @@
+import asyncio
+import atexit
 import json
+import threading
+import traceback
 
+from pydantic import BaseModel
 from sqlalchemy import Column, Integer, String, Text, delete
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
@@ -49,31 +54,230 @@ class JSONData(Base):
     value = Column(Text)
 
 
+class JSONLog(Base):
+    """
+    Append-only journal of session deltas written on top of the JSONData snapshot.
+
+    kind is one of "event_history", "chat_history", "checkpoints" or "config". For
+    the list kinds, value is a JSON list that replaces everything from offset onwards.
+    """
+
+    __tablename__ = "json_log"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    key = Column(String, index=True)
+    kind = Column(String)
+    offset = Column(Integer)
+    value = Column(Text)
+
+
+# Number of journal rows after which a session is compacted back into one snapshot
+COMPACT_EVERY = 200
+
+
+def _apply_log_entry(data, kind, offset, value):
+    if kind == "event_history":
+        data["event_history"][offset:] = value
+    elif kind == "chat_history":
+        data["config"]["agent_configs"][0]["chat_history"][offset:] = value
+    elif kind == "checkpoints":
+        data["config"]["checkpoints"][offset:] = value
+    elif kind == "config":
+        chat_history = data["config"]["agent_configs"][0].get("chat_history", [])
+        value["agent_configs"][0]["chat_history"] = chat_history
+        # Config rows leave checkpoints out, they have rows of their own
+        value.setdefault("checkpoints", data["config"].get("checkpoints", []))
+        data["config"] = value
+
+
 async def load_data(db: AsyncSession):
     result = await db.execute(select(JSONData))
     items = result.scalars().all()
     data = {item.key: json.loads(item.value) for item in items}
+
+    result = await db.execute(select(JSONLog).order_by(JSONLog.id))
+    for entry in result.scalars().all():
+        if entry.key in data:
+            _apply_log_entry(
+                data[entry.key], entry.kind, entry.offset, json.loads(entry.value)
+            )
     return data
 
 
-async def _save_data(db: AsyncSession, key, value):
-    print("Saving data for: ", key)
+async def _write_snapshot(db: AsyncSession, key, serialized):
     result = await db.execute(select(JSONData).filter_by(key=key))
     db_item = result.scalars().first()
     if db_item:
-        db_item.value = json.dumps(value)
+        db_item.value = serialized
     else:
-        db_item = JSONData(key=key, value=json.dumps(value))
+        db_item = JSONData(key=key, value=serialized)
         db.add(db_item)
+
+
+async def _save_data(db: AsyncSession, key, value):
+    print("Saving data for: ", key)
+    await _write_snapshot(db, key, json.dumps(value))
+    await db.execute(delete(JSONLog).where(JSONLog.key == key))
     await db.commit()
 
 
+async def _stage_record(db: AsyncSession, key, record):
+    """
+    Stage a record produced by SessionJournal.record: compact into a fresh
+    snapshot if it carries one, then append its delta rows.
+    """
+    if record["snapshot"] is not None:
+        await _write_snapshot(db, key, record["snapshot"])
+        await db.execute(delete(JSONLog).where(JSONLog.key == key))
+    for kind, offset, value in record["entries"]:
+        db.add(JSONLog(key=key, kind=kind, offset=offset, value=value))
+
+
+async def _save_record(db: AsyncSession, key, record):
+    await _stage_record(db, key, record)
+    await db.commit()
+
+
+async def _stage_delete(db: AsyncSession, key):
+    await db.execute(delete(JSONData).where(JSONData.key == key))
+    await db.execute(delete(JSONLog).where(JSONLog.key == key))
+
+
 async def _delete_data(db: AsyncSession, key):
     print("Deleting data for: ", key)
-    await db.execute(delete(JSONData).where(JSONData.key == key))
+    await _stage_delete(db, key)
     await db.commit()
 
 
+# Stands in for the checkpoints of callers that leave them in the config
+_NO_CHECKPOINTS = ()
+
+
+def _dump_items(items):
+    return [item.model_dump(mode="json") if isinstance(item, BaseModel) else item for item in items]
+
+
+def fingerprint(value) -> int:
+    """
+    Hash of a JSON-like value, cheap to recompute while its strings are the
+    same objects since str caches its hash.
+    """
+    if isinstance(value, dict):
+        return hash(tuple((key, fingerprint(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return hash(tuple(fingerprint(item) for item in value))
+    try:
+        return hash(value)
+    except TypeError:
+        return hash(repr(value))
+
+
+class SessionJournal:
+    """
+    Tracks what has already been persisted for one session, so each save only
+    writes the events, chat history and checkpoints appended since the last
+    one, plus the rest of the config when it changed.
+
+    A full snapshot is written on the first save, every COMPACT_EVERY rows, and
+    whenever a list was replaced or truncated (reset, revert). Callers that
+    change an already persisted item in place must invalidate the journal.
+    invalidate may be called from any thread.
+    """
+
+    def __init__(self, compact_every: int = COMPACT_EVERY):
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self._events = None
+            self._events_len = 0
+            self._history = None
+            self._history_len = 0
+            self._checkpoints = None
+            self._checkpoints_len = 0
+            self._config = None
+            self._config_hash = None
+            self._rows = 0
+
+    def _needs_snapshot(self, event_history, chat_history, checkpoints):
+        return (
+            self._events is not event_history
+            or self._history is not chat_history
+            or self._checkpoints is not checkpoints
+            or len(event_history) < self._events_len
+            or len(chat_history) < self._history_len
+            or len(checkpoints) < self._checkpoints_len
+            or self._rows >= self.compact_every
+        )
+
+    def record(
+        self,
+        config,
+        event_history: list,
+        chat_history: list,
+        checkpoints: list = None,
+        config_hash: int = None,
+    ):
+        """
+        Build the rows to persist. config must be the session config dumped
+        without agent chat history, and without checkpoints when they are
+        passed in separately, or a function returning it. With config_hash
+        that function is only called when the hash changed or a snapshot is
+        due.
+        """
+        with self._lock:
+            return self._record(config, event_history, chat_history, checkpoints, config_hash)
+
+    def _record(self, config, event_history, chat_history, checkpoints, config_hash):
+        tracks_checkpoints = checkpoints is not None
+        if not tracks_checkpoints:
+            checkpoints = _NO_CHECKPOINTS
+
+        needs_snapshot = self._needs_snapshot(event_history, chat_history, checkpoints)
+        if needs_snapshot or config_hash is None or config_hash != self._config_hash:
+            if callable(config):
+                config = config()
+            serialized_config = json.dumps(config)
+        else:
+            serialized_config = self._config
+
+        if needs_snapshot:
+            config["agent_configs"][0]["chat_history"] = list(chat_history)
+            if tracks_checkpoints:
+                config["checkpoints"] = _dump_items(checkpoints)
+            snapshot = json.dumps(
+                {"config": config, "event_history": list(event_history)}
+            )
+            entries = []
+            self._rows = 0
+        else:
+            snapshot = None
+            entries = []
+            for kind, items, written in (
+                ("event_history", event_history, self._events_len),
+                ("chat_history", chat_history, self._history_len),
+                ("checkpoints", checkpoints, self._checkpoints_len),
+            ):
+                if len(items) > written:
+                    entries.append((kind, written, json.dumps(_dump_items(items[written:]))))
+            if serialized_config != self._config:
+                entries.append(("config", 0, serialized_config))
+            self._rows += len(entries)
+
+        self._events = event_history
+        self._events_len = len(event_history)
+        self._history = chat_history
+        self._history_len = len(chat_history)
+        self._checkpoints = checkpoints
+        self._checkpoints_len = len(checkpoints)
+        self._config = serialized_config
+        self._config_hash = config_hash
+
+        return {"snapshot": snapshot, "entries": entries}
+
+
 async def _save_session_util(key, value):
     engine = SingletonEngine.get_engine()
     print()
@@ -92,6 +296,112 @@ async def _delete_session_util(key):
         await _delete_data(db_session, key)
 
 
+# Seconds between batched commits of the background writer
+FLUSH_INTERVAL = 1.0
+
+
+class PersistenceWriter:
+    """
+    Background writer shared by every session in the process.
+
+    Owns one event loop thread and one async session factory. Sessions submit
+    journal records without blocking, and pending writes are committed together
+    every flush_interval seconds, on flush(), and on shutdown.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, engine=None):
+        self.flush_interval = flush_interval
+        self.engine = engine
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._write_lock = asyncio.Lock()
+        self._session_factory = None
+        self._closed = False
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="theseus-persistence", daemon=True
+        )
+        self._thread.start()
+        self._flusher = asyncio.run_coroutine_threadsafe(
+            self._flush_periodically(), self._loop
+        )
+
+    @classmethod
+    def get(cls) -> "PersistenceWriter":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                atexit.register(cls._instance.shutdown)
+            return cls._instance
+
+    def submit(self, key, record, on_error=None):
+        """Queue a SessionJournal record. on_error is called if it failed to commit."""
+        with self._pending_lock:
+            self._pending.append(("save", key, record, on_error))
+
+    def delete(self, key):
+        with self._pending_lock:
+            self._pending.append(("delete", key, None, None))
+
+    async def _write_pending(self):
+        async with self._write_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+
+            if self._session_factory is None:
+                self._session_factory = sessionmaker(
+                    bind=self.engine or SingletonEngine.get_engine(),
+                    class_=AsyncSession,
+                    expire_on_commit=False,
+                )
+
+            try:
+                async with self._session_factory() as db_session:
+                    for op, key, record, _ in batch:
+                        if op == "save":
+                            await _stage_record(db_session, key, record)
+                        else:
+                            await _stage_delete(db_session, key)
+                    await db_session.commit()
+            except Exception:
+                traceback.print_exc()
+                # Lost deltas would corrupt the journal, force snapshots next time
+                for _, _, _, on_error in batch:
+                    if on_error:
+                        on_error()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._write_pending()
+
+    def flush(self, timeout=None):
+        """Block until everything submitted so far is committed."""
+        if self._closed:
+            return
+        asyncio.run_coroutine_threadsafe(self._write_pending(), self._loop).result(
+            timeout
+        )
+
+    def shutdown(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._flusher.cancel()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        with PersistenceWriter._instance_lock:
+            if PersistenceWriter._instance is self:
+                PersistenceWriter._instance = None
+
+
 async def save_data(db: AsyncSession, data: dict):
     for key, value in data.items():
         await _save_data(db, key, value)
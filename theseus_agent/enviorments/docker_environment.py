@@ -11,7 +11,9 @@ import docker
 
 from theseus_agent.environment import EnvironmentModule
 from theseus_agent.environments.swebenchenv import (get_container,
-                                                  read_with_timeout)
+                                                  read_container_files,
+                                                  read_with_timeout,
+                                                  write_container_file)
 
 
 @dataclass(frozen=False)
@@ -129,6 +131,12 @@ class DockerEnvironment(EnvironmentModule):
     def execute(self, input: str, timeout_duration=25):
         return self.communicate(input, timeout_duration=timeout_duration)
 
+    def read_files(self, paths, known=None):
+        return read_container_files(self.container_obj, paths, known)
+
+    def write_file(self, path, content):
+        write_container_file(self.container_obj, path, content)
+
     def teardown(self, **kwargs):
         """
         Handle environment shutdown
@@ -9,7 +9,8 @@ from typing import Dict, Optional, Tuple
 from datetime import datetime
 
 from pydantic import Field, BaseModel
-from theseus_agent.environment import EnvironmentModule
+from theseus_agent.environment import (EnvironmentModule, read_local_files,
+                                       write_local_file)
 
 class Job(BaseModel):
     named_pipe_stdout: str
@@ -58,6 +59,12 @@ class JobEnvironment(EnvironmentModule):
             os.unlink(job.named_pipe_stdout)
             os.unlink(job.named_pipe_stderr)
 
+    def read_files(self, paths, known=None):
+        return read_local_files(paths, known, self.path)
+
+    def write_file(self, path, content):
+        write_local_file(path, content, self.path)
+
     def get_cwd(self):
         return self.execute("pwd")[0].strip()
 
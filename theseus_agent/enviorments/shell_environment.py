@@ -1,78 +1,153 @@
+import codecs
 import errno
 import os
-import select
+import re
+import selectors
 import shutil
+import signal
 import subprocess
 import tempfile
 import time
 import traceback
-from typing import TYPE_CHECKING, List
+import uuid
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
 import psutil
 
 from pydantic import Field
 
-from theseus_agent.environment import EnvironmentModule
+from theseus_agent.environment import (EnvironmentModule, read_local_files,
+                                       write_local_file)
+from theseus_agent.tools.search_index import update_indexed_file
 
 if TYPE_CHECKING:
     pass
-def read_with_timeout(container, pid_func, timeout_duration, chunk_size=4096):
-    """
-    Read data from a subprocess with a timeout, yielding chunks of data.
 
-    Args:
-        container (subprocess.Popen): The subprocess container.
-        pid_func (function): A function that returns a list of process IDs (except the PID of the main process).
-        timeout_duration (int): The timeout duration in seconds.
-        chunk_size (int): The size of chunks to read at a time.
+# Printed after every command, followed by the command id and, on stdout, its
+# exit code and the shell's working directory
+SENTINEL = b"__THESEUS_DONE__"
+SENTINEL_PATTERN = re.compile(
+    re.escape(SENTINEL) + rb":([0-9a-f]+)(?::(-?[0-9]+):([^\n]*))?\n"
+)
 
-    Yields:
-        tuple: A tuple containing (stream_name, data_chunk)
+# Seconds an interrupted command gets to print its sentinel before the shell is restarted
+INTERRUPT_GRACE = 2
 
-    Raises:
-        TimeoutError: If the timeout duration is reached while reading from the subprocess.
+# Seconds to wait for the login shell's startup output, which is discarded
+STARTUP_TIMEOUT = 10
+
+READ_SIZE = 65536
+
+
+def frame_command(command: str, command_id: str) -> str:
     """
-    stdout_fd = container.stdout.fileno()
-    stderr_fd = container.stderr.fileno()
-    end_time = time.time() + timeout_duration
-
-    while time.time() < end_time:
-        pids = pid_func()
-        if not pids:
-            # No more child processes running
-            ready_to_read, _, _ = select.select([stdout_fd, stderr_fd], [], [], 0)
-            if not ready_to_read:
-                # No more data to read
-                break
-
-        ready_to_read, _, _ = select.select([stdout_fd, stderr_fd], [], [], 0.2)
-        
-        for fd in ready_to_read:
-            if fd == stdout_fd:
-                data = os.read(stdout_fd, chunk_size)
-                if data:
-                    yield ('stdout', data)
-            elif fd == stderr_fd:
-                data = os.read(stderr_fd, chunk_size)
-                if data:
-                    yield ('stderr', data)
-
-        if not ready_to_read and not pids:
-            # No more data to read and no child processes
+    Follow command with a line that prints the sentinel on stdout with the
+    exit status and working directory and on stderr, so both streams are known to be complete
+    without waiting for them to go quiet.
+    """
+    command = command if command.endswith("\n") else command + "\n"
+    return (
+        command
+        + "__theseus_rc=$?; "
+        + f"printf '%s:%s:%s:%s\\n' {SENTINEL.decode()} {command_id} \"$__theseus_rc\" \"$PWD\"; "
+        + f"printf '%s:%s\\n' {SENTINEL.decode()} {command_id} >&2\n"
+    )
+
+
+class _Stream:
+    """Output of one pipe for the running command."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.buffer = bytearray()
+        self.emitted = 0
+        self.done = False
+        self.exit_code: Optional[int] = None
+        self.cwd: Optional[str] = None
+
+    def feed(self, data: bytes, command_id: str) -> bytes:
+        """Add data, consume sentinels and return the new output that is safe to stream."""
+        self.buffer += data
+        for match in list(SENTINEL_PATTERN.finditer(self.buffer)):
+            if match.group(1).decode() != command_id:
+                # Left over from a command that timed out, drop what it printed
+                del self.buffer[: match.end()]
+                self.emitted = 0
+                return self.feed(b"", command_id)
+            if match.group(2) is not None:
+                self.exit_code = int(match.group(2))
+                self.cwd = match.group(3).decode(errors="replace")
+            self.done = True
+            del self.buffer[match.start() :]
             break
 
-        time.sleep(0.05)  # Prevents CPU hogging
+        safe_end = len(self.buffer)
+        if not self.done:
+            # Hold back a sentinel that has not fully arrived yet
+            found = self.buffer.find(SENTINEL, self.emitted)
+            if found != -1:
+                safe_end = found
+            else:
+                for size in range(min(len(SENTINEL) - 1, len(self.buffer)), 0, -1):
+                    if self.buffer.endswith(SENTINEL[:size]):
+                        safe_end = len(self.buffer) - size
+                        break
+        chunk = bytes(self.buffer[self.emitted : safe_end])
+        self.emitted = max(self.emitted, safe_end)
+        return chunk
+
+
+def run_command(
+    process: subprocess.Popen,
+    command: str,
+    timeout_duration: float,
+    on_chunk: Optional[Callable[[str, bytes], None]] = None,
+) -> Tuple[bytes, bytes, int, str]:
+    """
+    Run command in the shell process and return (stdout, stderr, exit code,
+    working directory afterwards) as soon as both sentinels arrive. on_chunk is called with the stream
+    name and each piece of output as it is read.
 
-    if container.poll() is not None:
-        raise RuntimeError("Subprocess exited unexpectedly.")
-    
-    if time.time() >= end_time:
-        raise TimeoutError("Timeout reached while reading from subprocess.")
+    Raises:
+        TimeoutError: If the sentinels did not arrive within timeout_duration.
+        RuntimeError: If the shell exited.
+    """
+    command_id = uuid.uuid4().hex
+    streams: Dict[int, _Stream] = {
+        process.stdout.fileno(): _Stream("stdout"),
+        process.stderr.fileno(): _Stream("stderr"),
+    }
+    process.stdin.write(frame_command(command, command_id))
+    process.stdin.flush()
+
+    deadline = time.monotonic() + timeout_duration
+    with selectors.DefaultSelector() as selector:
+        for fd in streams:
+            selector.register(fd, selectors.EVENT_READ)
+        while not all(stream.done for stream in streams.values()):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Timeout reached while reading from subprocess.")
+            for key, _ in selector.select(remaining):
+                data = os.read(key.fd, READ_SIZE)
+                if not data:
+                    raise RuntimeError("Subprocess exited unexpectedly.")
+                stream = streams[key.fd]
+                chunk = stream.feed(data, command_id)
+                if stream.done:
+                    selector.unregister(key.fd)
+                if chunk and on_chunk:
+                    on_chunk(stream.name, chunk)
+
+    stdout, stderr = streams.values()
+    return bytes(stdout.buffer), bytes(stderr.buffer), stdout.exit_code, stdout.cwd
 
 
 class LocalShellEnvironment(EnvironmentModule):
     path: str
     old_dir: str = Field(default=None)
     process: subprocess.Popen = Field(default=None)
+    # Working directory of the shell as of its last command
+    cwd: Optional[str] = Field(default=None)
 
     class Config:
         arbitrary_types_allowed = True
@@ -89,6 +164,9 @@ class LocalShellEnvironment(EnvironmentModule):
             print("Error changing directory", e)
 
 
+        self.start_shell()
+
+    def start_shell(self):
         self.process = subprocess.Popen(
             ["/bin/bash","-l"],
             stdin=subprocess.PIPE,
@@ -98,13 +176,36 @@ class LocalShellEnvironment(EnvironmentModule):
             text=True,
             bufsize=1,
         )
-
+        self.cwd = None
+        try:
+            self.cwd = run_command(self.process, "true", STARTUP_TIMEOUT)[3]
+        except (TimeoutError, RuntimeError) as e:
+            print("Shell did not start cleanly", e)
+
+    def stop_shell(self):
+        for pid in self.get_child_pids(self.process.pid):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.process.kill()
+        self.process.wait()
 
     def teardown(self, **kwargs):
         os.chdir(self.old_dir)
 
+    def read_files(self, paths, known=None):
+        return read_local_files(paths, known, self.path)
+
+    def write_file(self, path, content):
+        write_local_file(path, content, self.path)
+        update_indexed_file(os.path.join(self.path, path))
+
     def get_cwd(self):
-        return self.execute("pwd")[0]
+        """The shell's working directory, as reported with the last command."""
+        if self.cwd is None or self.process is None or self.process.poll() is not None:
+            self.execute("true")
+        return self.cwd
 
     def execute(self, input: str, timeout_duration=25):
         try:
@@ -114,35 +215,76 @@ class LocalShellEnvironment(EnvironmentModule):
                 "producer": "tool",
                 "consumer": self.name,
             })
-            cmd = input if input.endswith("\n") else input + "\n"
-            self.process.stdin.write(cmd)
-            time.sleep(0.1)
-            self.process.stdin.flush()
-
-            stdout_buffer = b""
-            stderr_buffer = b""
-            for stream, chunk in read_with_timeout(self.process, lambda: self.get_child_pids(self.process.pid), timeout_duration, 4096):
-                if stream == 'stdout':
-                    print(chunk.decode(), end='', flush=True)
-                    stdout_buffer += chunk
-                elif stream == 'stderr':
-                    print(chunk.decode(), end='', flush=True)
-                    stderr_buffer += chunk
-
-            self.process.stdin.write("echo $?\n")
-            time.sleep(0.1)
-            self.process.stdin.flush()
-            
-            exit_code = b""
-            for stream, chunk in read_with_timeout(self.process, lambda: self.get_child_pids(self.process.pid), 5, 4096):
-                if stream == 'stdout':
-                    exit_code += chunk
-
-            return stdout_buffer.decode() + stderr_buffer.decode(), int(exit_code.strip())
+            if self.process.poll() is not None:
+                self.start_shell()
+
+            on_chunk, flush_stream = self._stream_output()
+            stdout, stderr, exit_code, self.cwd = run_command(
+                self.process, input, timeout_duration, on_chunk
+            )
+            flush_stream()
+            return stdout.decode(errors="replace") + stderr.decode(errors="replace"), exit_code
+        except TimeoutError as e:
+            self.interrupt()
+            return str(e), -1
+        except RuntimeError as e:
+            # The command exited the shell
+            self.stop_shell()
+            self.start_shell()
+            return str(e), -1
         except Exception as e:
             traceback.print_exc()
             return str(e), -1
-        
+
+    def _stream_output(self):
+        """
+        Build an on_chunk callback for run_command that publishes a command's
+        output to the event log's live subscribers as EnvironmentStream events,
+        and a flush function for once both sentinels arrived. The events are
+        not appended to the log, the EnvironmentResponse records the output.
+        Each stream has its own incremental decoder so characters split across
+        reads are decoded whole.
+        """
+        decoders = {
+            name: codecs.getincrementaldecoder("utf-8")(errors="replace")
+            for name in ("stdout", "stderr")
+        }
+
+        def publish(text: str):
+            if text:
+                self.event_log.publish({
+                    "type": "EnvironmentStream",
+                    "content": text,
+                    "producer": self.name,
+                    "consumer": "tool",
+                })
+
+        def on_chunk(stream: str, chunk: bytes):
+            publish(decoders[stream].decode(chunk))
+
+        def flush():
+            for decoder in decoders.values():
+                publish(decoder.decode(b"", final=True))
+
+        return on_chunk, flush
+
+    def interrupt(self):
+        """
+        Stop a command that timed out so the next one does not queue behind
+        it. The command's children get SIGINT, and if the shell still does
+        not answer it is replaced.
+        """
+        for pid in self.get_child_pids(self.process.pid):
+            try:
+                os.kill(pid, signal.SIGINT)
+            except ProcessLookupError:
+                pass
+        try:
+            self.cwd = run_command(self.process, "true", INTERRUPT_GRACE)[3]
+        except Exception:
+            self.stop_shell()
+            self.start_shell()
+
     def get_child_pids(self, parent_pid):
         try:
             parent = psutil.Process(parent_pid)
@@ -18,7 +18,8 @@ import docker
 from swebench import (MAP_VERSION_TO_INSTALL, get_environment_yml,
                       get_requirements)
 
-from theseus_agent.environment import EnvironmentModule
+from theseus_agent.environment import (EnvironmentModule, unchanged,
+                                       with_final_newline)
 from theseus_agent.tool import Tool
 
 LOGGER_NAME = "intercode"
@@ -206,6 +207,81 @@ def get_archive(path, ctr_name: str):
     return archive
 
 
+def read_container_files(container_obj, paths, known=None) -> Dict[str, Dict]:
+    """
+    read_files for a container: one stat exec to find changed files and one
+    tar exec to fetch them, instead of a cat through the shell per file.
+    """
+    if not paths:
+        return {}
+    stats, stat_errors = container_obj.exec_run(
+        ["stat", "-L", "-c", "%Y %s %n", *paths], demux=True
+    ).output
+    metadata = {}
+    for line in (stats or b"").decode(errors="replace").splitlines():
+        mtime, size, path = line.split(" ", 2)
+        # stat only has whole seconds, so a file written this second may still change unseen
+        if int(mtime) >= time.time() - 1:
+            mtime = None
+        metadata[path] = (mtime and int(mtime), int(size))
+
+    errors = (stat_errors or b"").decode(errors="replace").splitlines()
+    files = {
+        path: {
+            "error": next(
+                (error for error in errors if path in error), f"Could not read {path}"
+            )
+        }
+        for path in paths
+        if path not in metadata
+    }
+    changed = [
+        path
+        for path, (mtime, size) in metadata.items()
+        if not unchanged(known, path, mtime, size)
+    ]
+    if not changed:
+        return files
+
+    archive, _ = container_obj.exec_run(
+        ["tar", "-c", "-h", "-P", "-f", "-", *changed], demux=True
+    ).output
+    with tarfile.open(fileobj=BytesIO(archive or b""), mode="r:") as tar:
+        for member in tar:
+            if member.name in metadata and member.isfile():
+                mtime, size = metadata[member.name]
+                files[member.name] = {
+                    "content": tar.extractfile(member).read().decode(errors="replace"),
+                    "mtime": mtime,
+                    "size": size,
+                }
+    for path in changed:
+        # Found by stat but not archived, e.g. a directory or a file it may not read
+        files.setdefault(path, {"error": f"Could not read {path}"})
+    return files
+
+
+def write_container_file(container_obj, path, content):
+    """
+    write_file for a container, path being absolute. The file goes in as a
+    one-member archive, which also creates missing parent directories. An
+    existing file keeps its mode, and a newline is added if content lacks one.
+    """
+    result = container_obj.exec_run(["stat", "-L", "-c", "%a", path])
+    mode = int(result.output.strip(), 8) if result.exit_code == 0 else 0o644
+
+    data = with_final_newline(content).encode("utf-8")
+    with BytesIO() as tar_stream:
+        with tarfile.open(fileobj=tar_stream, mode="w") as tar:
+            tar_info = tarfile.TarInfo(name=path.lstrip("/"))
+            tar_info.size = len(data)
+            tar_info.mode = mode
+            tar_info.mtime = int(time.time())
+            tar.addfile(tarinfo=tar_info, fileobj=BytesIO(data))
+        if not container_obj.put_archive(path="/", data=tar_stream.getvalue()):
+            raise Exception(f"Could not write to file: {path}")
+
+
 def _get_persistent_container(
     ctr_name: str, image_name: str, persistent: bool = False
 ) -> Tuple[subprocess.Popen, set]:
@@ -600,8 +676,14 @@ class SWEEnvEnvironment(EnvironmentModule):
                     # error_msg="Post-install commands failed to execute successfully",
                 )
 
+    def read_files(self, paths, known=None):
+        return read_container_files(self.container_obj, paths, known)
+
+    def write_file(self, path, content):
+        write_container_file(self.container_obj, path, content)
+
     def get_cwd(self):
-        return self.execute("pwd")[0]
+        return self.execute("pwd")[0].strip()
 
     def reset(self, record):
         self.communicate("cd /")
@@ -1,18 +1,92 @@
+import os
+import tempfile
+import uuid
 from abc import ABC
-from typing import TYPE_CHECKING, Dict, List, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 from pydantic import BaseModel, Field
 
 from theseus_agent.tool import Tool
+from theseus_agent.utils.event_log import EventLog
 
 if TYPE_CHECKING:
     from theseus_agent.tool import Tool
 
 
+def unchanged(known: Optional[Dict[str, Dict]], path: str, mtime, size) -> bool:
+    return bool(
+        known
+        and mtime is not None
+        and path in known
+        and known[path].get("mtime") == mtime
+        and known[path].get("size") == size
+    )
+
+
+def read_local_files(
+    paths: List[str], known: Optional[Dict[str, Dict]] = None, base_path: str = "."
+) -> Dict[str, Dict]:
+    """read_files for environments that share the host filesystem."""
+    files = {}
+    for path in paths:
+        full_path = os.path.join(base_path, path)
+        try:
+            stat = os.stat(full_path)
+            if unchanged(known, path, stat.st_mtime_ns, stat.st_size):
+                continue
+            with open(full_path, "r", encoding="utf-8", errors="replace") as f:
+                content = f.read()
+        except OSError as e:
+            files[path] = {"error": f"{e.strerror or e}: {path}"}
+            continue
+        files[path] = {
+            "content": content,
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+        }
+    return files
+
+
+def with_final_newline(content: str) -> str:
+    """
+    Content as every write_file stores it: ending in a newline, which is what
+    writing through a heredoc has always produced.
+    """
+    return content if content.endswith("\n") else content + "\n"
+
+
+def write_local_file(path: str, content: str, base_path: str = "."):
+    """
+    write_file for environments that share the host filesystem. The content
+    goes to a temporary file next to the target that is then renamed over it,
+    so readers never see a partial file. An existing file keeps its mode.
+    """
+    full_path = os.path.realpath(os.path.join(base_path, path))
+    directory = os.path.dirname(full_path)
+    os.makedirs(directory, exist_ok=True)
+    try:
+        mode = os.stat(full_path).st_mode & 0o7777
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        mode = 0o666 & ~umask
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".theseus-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(with_final_newline(content))
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, full_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
 class EnvironmentModule(BaseModel, ABC):
     default_tool: Tool = Field(default=None)
     tools: Dict[str, Tool] = Field(default_factory=dict)
-    event_log: List[Dict] = Field(default_factory=list)
+    event_log: List[Dict] = Field(default_factory=EventLog)
     # state: Dict = Field(default_factory=dict)
 
     def setup(self, **kwargs): ...
@@ -28,6 +102,49 @@ class EnvironmentModule(BaseModel, ABC):
 
     def execute(self, input: str, timeout_duration=25) -> Tuple[str, int]: ...
 
+    def get_cwd(self) -> Optional[str]:
+        """Working directory of the environment's shell."""
+        output, _ = self.execute("pwd")
+        return output.strip() if output else None
+
+    def read_files(
+        self, paths: List[str], known: Optional[Dict[str, Dict]] = None
+    ) -> Dict[str, Dict]:
+        """
+        Read many files at once. Returns {path: {"content", "mtime", "size"}}
+        for every readable file, leaving out files whose mtime and size match
+        the entry for them in known, and {path: {"error"}} for files that
+        could not be read. Environments without a faster way to reach their
+        filesystem fall back to one cat per file.
+        """
+        files = {}
+        for path in paths:
+            content, rc = self.execute(f"cat '{path}'")
+            if rc == 0:
+                files[path] = {"content": content, "mtime": None, "size": None}
+            else:
+                files[path] = {"error": content.strip() or f"Could not read {path}"}
+        return files
+
+    def write_file(self, path: str, content: str):
+        """
+        Write content to path, creating parent directories. Environments
+        without direct access to their filesystem send a heredoc through the
+        shell, with a delimiter that does not occur in the content. Like
+        every write_file, a newline is added if content lacks one.
+        """
+        content = with_final_newline(content)[:-1]
+        delimiter = "THESEUS_EOF"
+        while delimiter in content:
+            delimiter = f"THESEUS_EOF_{uuid.uuid4().hex}"
+        _, rc = self.execute(
+            f"mkdir -p \"$(dirname '{path}')\" && cat << '{delimiter}' > '{path}'\n"
+            + content
+            + f"\n{delimiter}"
+        )
+        if rc != 0:
+            raise Exception(f"Could not write to file: {path}")
+
     def register_tools(self, tools: Dict[str, "Tool"]):
         if self.tools is None:
             self.tools = {}
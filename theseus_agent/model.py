@@ -1,13 +1,148 @@
+import importlib.metadata
 import logging
 import os
+import re
+import threading
 from dataclasses import dataclass
-from typing import Optional
+from typing import Callable, Optional
 
+import httpx
+import litellm
 from litellm import completion
 
+from theseus_agent.utils.completion_cache import get_completion_cache
+from theseus_agent.utils.rate_limiter import RateLimited, RateLimiter
+
 logger = logging.getLogger("LiteLLM")
 logger.disabled = True
 
+_http_client = None
+_http_client_lock = threading.Lock()
+
+# First litellm release that passes cache_control content blocks through to Anthropic
+PROMPT_CACHING_LITELLM_VERSION = (1, 44, 0)
+
+# Longest a query blocks on the rate limiter before handing back to the session
+ACQUIRE_TIMEOUT = 5.0
+
+
+def litellm_supports_prompt_caching() -> bool:
+    try:
+        version = importlib.metadata.version("litellm")
+    except importlib.metadata.PackageNotFoundError:
+        return False
+    release = tuple(int(part) for part in re.findall(r"\d+", version)[:3])
+    return release >= PROMPT_CACHING_LITELLM_VERSION
+
+
+def cache_breakpoint(message: dict) -> dict:
+    """message with its text content marked as the end of a cacheable prefix."""
+    content = message["content"]
+    if isinstance(content, str):
+        content = [{"type": "text", "text": content}]
+    content = content[:-1] + [{**content[-1], "cache_control": {"type": "ephemeral"}}]
+    return {**message, "content": content}
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Shared keep-alive client handed to litellm, so every model query in the
+    process reuses pooled connections and TLS sessions.
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=100,
+                    max_keepalive_connections=20,
+                    keepalive_expiry=120,
+                ),
+                timeout=600,
+            )
+            litellm.client_session = _http_client
+    return _http_client
+
+
+def response_headers(response) -> dict:
+    hidden_params = getattr(response, "_hidden_params", None) or {}
+    return hidden_params.get("additional_headers") or getattr(
+        response, "_response_headers", None
+    ) or {}
+
+
+def error_headers(error) -> dict:
+    headers = getattr(error, "headers", None) or getattr(
+        error, "litellm_response_headers", None
+    )
+    if not headers and getattr(error, "response", None) is not None:
+        headers = getattr(error.response, "headers", None)
+    return headers or {}
+
+
+def complete(
+    on_token: Optional[Callable[[str], None]] = None,
+    rate_limit_key: Optional[tuple] = None,
+    **kwargs,
+):
+    """
+    Run a litellm completion and return (content, finish_reason).
+
+    With on_token the completion is streamed and every text delta is passed
+    to on_token. Callers pass the closing command tag as a stop sequence, so
+    the provider ends the stream there.
+
+    With rate_limit_key the request first waits for the shared RateLimiter
+    and reports the provider's ratelimit headers back to it. RateLimited is
+    raised instead of waiting longer than ACQUIRE_TIMEOUT.
+
+    Temperature 0 completions are served from the completion cache when one
+    is configured.
+    """
+    cache = get_completion_cache() if kwargs.get("temperature") == 0 else None
+    if cache is not None:
+        cache_key = cache.key(stream=on_token is not None, **kwargs)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            output, finish_reason = cached
+            if on_token is not None and output:
+                on_token(output)
+            return output, finish_reason
+
+    limiter = RateLimiter.get()
+    if rate_limit_key is not None and not limiter.acquire(
+        rate_limit_key, timeout=ACQUIRE_TIMEOUT
+    ):
+        raise RateLimited(limiter.delay(rate_limit_key))
+
+    try:
+        if on_token is None:
+            model_completion = completion(**kwargs)
+            choice = model_completion.choices[0]
+            output, finish_reason = choice.message.content, choice.finish_reason
+        else:
+            output = ""
+            finish_reason = None
+            model_completion = completion(stream=True, **kwargs)
+            for chunk in model_completion:
+                choice = chunk.choices[0]
+                token = choice.delta.content or ""
+                if token:
+                    output += token
+                    on_token(token)
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+    except litellm.RateLimitError as e:
+        if rate_limit_key is not None:
+            limiter.record_limited(rate_limit_key, error_headers(e))
+        raise
+
+    if rate_limit_key is not None:
+        limiter.record_success(rate_limit_key, response_headers(model_completion))
+    if cache is not None and output:
+        cache.put(cache_key, output, finish_reason)
+    return output, finish_reason
+
 
 @dataclass(frozen=False)
 class ModelArguments:
@@ -24,28 +159,42 @@ class HumanModel:
         self.args = args
 
     def query(
-        self, ask, messages: list[dict[str, str]], system_message: str = ""
+        self,
+        ask,
+        messages: list[dict[str, str]],
+        system_message: str = "",
+        on_token: Optional[Callable[[str], None]] = None,
     ) -> str:
         thought = ""
         print(messages[-1])
         command = ask("enter your command here")
-        print(f"<THOUGHT>\n{thought}\n</THOUGHT>\n<COMMAND>\n{command}\n</COMMAND>")
-        return f"<THOUGHT>\n{thought}\n</THOUGHT>\n<COMMAND>\n{command}\n</COMMAND>"
+        output = f"<THOUGHT>\n{thought}\n</THOUGHT>\n<COMMAND>\n{command}\n</COMMAND>"
+        print(output)
+        if on_token is not None:
+            on_token(output)
+        return output
 
 
 class AnthropicModel:
     MODELS = {
         "claude-3-5-sonnet-20240620": {
             "max_tokens": 4096,
+            "context_window": 200000,
+            "prompt_caching": True,
         },
         "claude-3-opus-20240229": {
             "max_tokens": 4096,
+            "context_window": 200000,
+            "prompt_caching": True,
         },
         "claude-3-sonnet-20240229": {
             "max_tokens": 4096,
+            "context_window": 200000,
         },
         "claude-3-haiku-20240307": {
             "max_tokens": 4096,
+            "context_window": 200000,
+            "prompt_caching": True,
         },
     }
 
@@ -61,38 +210,65 @@ class AnthropicModel:
         self.api_model = self.SHORTCUTS.get(args.model_name, args.model_name)
         self.model_metadata = self.MODELS[self.api_model]
         self.prompt_type = "anthropic"
+        get_http_client()
         if args.api_key is not None:
             self.api_key = args.api_key
         else:
             self.api_key = os.getenv("ANTHROPIC_API_KEY")
+        self.rate_limit_key = ("anthropic", self.api_key)
+        self.prompt_caching = (
+            self.model_metadata.get("prompt_caching", False)
+            and litellm_supports_prompt_caching()
+        )
+
+    def _cached_messages(self, system_message: str, messages: list[dict]) -> list[dict]:
+        """
+        The system prompt holds the command docs and is identical every turn,
+        and the history before the last user prompt only grows, so both end
+        a cache breakpoint where the model supports it.
+        """
+        system = {"role": "system", "content": system_message}
+        if not self.prompt_caching:
+            return [system] + messages
+        messages = list(messages)
+        if len(messages) > 1:
+            messages[-2] = cache_breakpoint(messages[-2])
+        return [cache_breakpoint(system)] + messages
 
-    def query(self, messages: list[dict[str, str]], system_message: str = "") -> str:
+    def query(
+        self,
+        messages: list[dict[str, str]],
+        system_message: str = "",
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> str:
         
-        model_completion = completion(
-            messages=[{"role": "system", "content": system_message}] + messages,
+        output, finish_reason = complete(
+            on_token,
+            messages=self._cached_messages(system_message, messages),
             model=self.api_model,
             temperature=self.args.temperature,
             stop=["</COMMAND>"],
             api_key=self.api_key,
+            rate_limit_key=self.rate_limit_key,
         )
 
-        output = model_completion.choices[0].message.content
-
         continues = 0
 
-        while model_completion.choices[0].finish_reason != "stop" and continues < 2:
+        while finish_reason != "stop" and continues < 2:
 
             continues+=1
             
-            model_completion = completion(
-            messages=[{"role": "system", "content": system_message}] + messages + [{"role": "assistant", "content": output}],
+            content, finish_reason = complete(
+            on_token,
+            messages=self._cached_messages(system_message, messages) + [{"role": "assistant", "content": output}],
             model=self.api_model,
             temperature=self.args.temperature,
             stop=["</COMMAND>"],
             api_key=self.api_key,
+            rate_limit_key=self.rate_limit_key,
             )
 
-            output += model_completion.choices[0].message.content
+            output += content
 
             print("aaaaa")
             print(output)
@@ -106,15 +282,19 @@ class OpenAiModel:
     MODELS = {
         "gpt-4o-mini": {
             "max_tokens": 4096,
+            "context_window": 128000,
         },
         "gpt-4o": {
             "max_tokens": 4096,
+            "context_window": 128000,
         },
         "gpt-4-turbo": {
             "max_tokens": 4096,
+            "context_window": 128000,
         },
         "gpt-4-0125-preview": {
             "max_tokens": 4096,
+            "context_window": 128000,
         },
     }
 
@@ -130,6 +310,7 @@ class OpenAiModel:
         self.api_model = self.SHORTCUTS.get(args.model_name, args.model_name)
         self.model_metadata = self.MODELS.get(self.api_model, {})
         self.prompt_type = "openai"
+        get_http_client()
 
         if args.api_key is not None:
             self.api_key = args.api_key
@@ -142,16 +323,25 @@ class OpenAiModel:
         if args.prompt_type is not None:
             self.prompt_type = args.prompt_type
 
-    def query(self, messages: list[dict[str, str]], system_message: str = "") -> str:
-        model_completion = completion(
+        self.rate_limit_key = ("openai", args.api_base, self.api_key)
+
+    def query(
+        self,
+        messages: list[dict[str, str]],
+        system_message: str = "",
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        output, _ = complete(
+            on_token,
             messages=[{"role": "system", "content": system_message}] + messages,
             model=self.api_model,
             temperature=self.args.temperature,
             api_key=self.api_key,
             stop=["</COMMAND>"],
+            rate_limit_key=self.rate_limit_key,
         )
 
-        response = model_completion.choices[0].message.content.rstrip("</COMMAND>")
+        response = output.rstrip("</COMMAND>")
         return response + "</COMMAND>"
 
 
@@ -159,6 +349,7 @@ class GroqModel:
     MODELS = {
         "groq/llama3-70b-8192": {
             "max_tokens": 4096,
+            "context_window": 8192,
         }
     }
 
@@ -171,22 +362,31 @@ class GroqModel:
         self.api_model = self.SHORTCUTS.get(args.model_name, args.model_name)
         self.model_metadata = self.MODELS[self.api_model]
         self.prompt_type = "llama3"
+        get_http_client()
         if args.api_key is not None:
             self.api_key = args.api_key
         else:
             self.api_key = os.getenv("GROQ_API_KEY")
+        self.rate_limit_key = ("groq", self.api_key)
 
-    def query(self, messages: list[dict[str, str]], system_message: str = "") -> str:
-        model_completion = completion(
+    def query(
+        self,
+        messages: list[dict[str, str]],
+        system_message: str = "",
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        output, _ = complete(
+            on_token,
             messages=[{"role": "system", "content": system_message}] + messages,
             max_tokens=self.model_metadata["max_tokens"],
             model=self.api_model,
             temperature=self.args.temperature,
             stop=["</COMMAND>"],
             api_key=self.api_key,
+            rate_limit_key=self.rate_limit_key,
         )
 
-        response = model_completion.choices[0].message.content.rstrip("</COMMAND>")
+        response = output.rstrip("</COMMAND>")
         return response + "</COMMAND>"
 
 
@@ -200,9 +400,16 @@ class OllamaModel:
 
         self.api_key = "ollama"
         self.prompt_type = "ollama"
+        get_http_client()
 
-    def query(self, messages: list[dict[str, str]], system_message: str = "") -> str:
-        model_completion = completion(
+    def query(
+        self,
+        messages: list[dict[str, str]],
+        system_message: str = "",
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> str:
+        output, _ = complete(
+            on_token,
             messages=[{"role": "system", "content": system_message}] + messages,
             max_tokens=self.model_metadata["max_tokens"],
             model=self.api_model,
@@ -212,5 +419,5 @@ class OllamaModel:
             api_key=self.api_key,
         )
 
-        response = model_completion.choices[0].message.content.rstrip("</command>")
+        response = output.rstrip("</command>")
         return response + "</command>"
@@ -2,9 +2,9 @@ import asyncio
 import json
 import logging
 import os
+import threading
 from contextlib import asynccontextmanager
 from pathlib import Path
-from time import sleep
 from typing import Any, Dict, List, Optional
 
 import fastapi
@@ -15,11 +15,20 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
 
 from theseus_agent.config import AgentConfig, Config
-from theseus_agent.data_models import SingletonEngine, init_db, load_data, set_db_engine
+from theseus_agent.data_models import (
+    PersistenceWriter,
+    SingletonEngine,
+    init_db,
+    load_data,
+    set_db_engine,
+)
 from theseus_agent.environments.shell_environment import LocalShellEnvironment
 from theseus_agent.environments.user_environment import UserEnvironment
 from theseus_agent.session import Session
+from theseus_agent.utils.completion_cache import (get_completion_cache,
+                                                   set_completion_cache)
 from theseus_agent.utils.config_utils import hydrate_config
+from theseus_agent.utils.event_log import EventBroadcaster
 from theseus_agent.utils.utils import LOGGER_NAME, WholeFileDiffResults
 
 # from theseus_agent.semantic_search.code_graph_manager import CodeGraphManager
@@ -56,26 +65,24 @@ running_sessions: List[Session] = []
 
 blocked_sessions = []
 
+session_buffers: Dict[str, str] = {}
+session_buffers_condition = threading.Condition()
+
+
+def set_session_buffer(session: str, value: str):
+    with session_buffers_condition:
+        session_buffers[session] = value
+        session_buffers_condition.notify_all()
+
 
 def get_user_input(session: str):
-    if session not in session_buffers:
-        while True:
-            if session not in session_buffers:
-                if session not in blocked_sessions:
-                    blocked_sessions.append(session)
-                sleep(0.1)
-                continue
-            else:
-                blocked_sessions.remove(session)
-                break
+    with session_buffers_condition:
+        if session not in session_buffers:
+            blocked_sessions.append(session)
+            session_buffers_condition.wait_for(lambda: session in session_buffers)
+            blocked_sessions.remove(session)
 
-        result = session_buffers[session]
-        del session_buffers[session]
-        return result
-    else:
-        result = session_buffers[session]
-        del session_buffers[session]
-        return result
+        return session_buffers.pop(session)
 
 
 @asynccontextmanager
@@ -115,10 +122,19 @@ async def lifespan(app: fastapi.FastAPI):
             data = {k: v for k, v in data.items() if v is not None}
             sessions = data
 
+    if app.completion_cache:
+        cache_path = Path(getattr(app, "db_path", None) or ".") / "completion_cache.db"
+        set_completion_cache(cache_path.as_posix())
+
     yield
     print("Terminating sessions")
     for session in sessions.values():
         session.teardown()
+    if app.persist:
+        PersistenceWriter.get().shutdown()
+    if app.completion_cache:
+        print("Completion cache", get_completion_cache().stats())
+        set_completion_cache(None)
 
 
 app = fastapi.FastAPI(
@@ -126,6 +142,7 @@ app = fastapi.FastAPI(
 )
 
 app.persist = True
+app.completion_cache = False
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -134,8 +151,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-session_buffers: Dict[str, str] = {}
-
 
 @app.get("/")
 def read_root():
@@ -319,11 +334,12 @@ def delete_session(session: str):
 
     if session in running_sessions:
         if session in blocked_sessions:
-            session_buffers[session] = "delete"
+            set_session_buffer(session, "delete")
         sessions[session].terminate()
         running_sessions.remove(session)
 
     del sessions[session]
+    event_broadcasters.pop(session, None)
 
     return session
 
@@ -367,7 +383,7 @@ def revert_session(
     if session not in sessions:
         raise fastapi.HTTPException(status_code=404, detail="Session not found")
     if session in blocked_sessions:
-        session_buffers[session] = "revert"
+        set_session_buffer(session, "revert")
 
     sessions[session].terminate()
     sessions[session].revert(checkpoint_id)
@@ -411,7 +427,7 @@ def reset_session(session: str, background_tasks: fastapi.BackgroundTasks):
     if not (session_obj := sessions.get(session)):
         raise fastapi.HTTPException(status_code=404, detail="Session not found")
     print("resetting session2",flush=True)
-    session_buffers[session] = "terminate"
+    set_session_buffer(session, "terminate")
     print("resetting session3",flush=True)
     session_obj.terminate()
     print("resetting session4",flush=True)
@@ -472,8 +488,8 @@ def teardown_session(session: str):
 def create_response(session: str, response: str):
     if session not in sessions:
         raise fastapi.HTTPException(status_code=404, detail="Session not found")
-    session_buffers[session] = response
-    return session_buffers[session]
+    set_session_buffer(session, response)
+    return response
 
 
 @app.get("/sessions/{session}/diff")
@@ -517,32 +533,70 @@ def create_event(session: str, event: ServerEvent):
 
 
 @app.get("/sessions/{session}/events")
-def read_events(session: str):
+def read_events(
+    session: str,
+    response: fastapi.Response,
+    offset: int = fastapi.Query(0, ge=0),
+    limit: Optional[int] = fastapi.Query(None, ge=0),
+):
     if session not in sessions:
         raise fastapi.HTTPException(status_code=404, detail="Session not found")
     events = sessions.get(session, None).event_log
-    return events
+    response.headers["X-Total-Count"] = str(len(events))
+    end = None if limit is None else offset + limit
+    return events[offset:end]
+
+
+event_broadcasters: Dict[str, EventBroadcaster] = {}
+
+
+def get_event_broadcaster(session: str) -> EventBroadcaster:
+    session_obj = sessions[session]
+    broadcaster = event_broadcasters.get(session)
+    if broadcaster is None or broadcaster.notify not in session_obj.event_listeners:
+        broadcaster = EventBroadcaster(asyncio.get_running_loop())
+        session_obj.event_listeners.append(broadcaster.notify)
+        session_obj.stream_listeners.append(broadcaster.publish)
+        event_broadcasters[session] = broadcaster
+    return broadcaster
 
 
 @app.get("/sessions/{session}/events/stream")
-async def read_events_stream(session: str):
+async def read_events_stream(
+    session: str,
+    since: Optional[int] = fastapi.Query(None, ge=1),
+    last_event_id: Optional[str] = fastapi.Header(default=None),
+):
     if session not in sessions:
         raise fastapi.HTTPException(status_code=404, detail="Session not found")
     session_obj: Session = sessions.get(session)
     if not session_obj:
         raise fastapi.HTTPException(status_code=404, detail="Session not found")
 
+    # Reconnecting clients resume after the last id they saw, new ones only get new events
+    if last_event_id is not None:
+        try:
+            start = int(last_event_id) + 1
+        except ValueError:
+            start = 0
+        if start <= 0:
+            raise fastapi.HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    elif since is not None:
+        start = since
+    else:
+        start = len(session_obj.event_log)
+
+    broadcaster = get_event_broadcaster(session)
+
     async def event_generator():
-        initial_index = len(session_obj.event_log)
-        while True:
-            current_index = len(session_obj.event_log)
-            if current_index > initial_index:
-                for event in session_obj.event_log[initial_index:current_index]:
-                    print("STREAM:", event)
-                    yield f"data: {json.dumps(event)}\n\n"
-                initial_index = current_index
+        async for index, event in broadcaster.stream(
+            lambda: session_obj.event_log, start
+        ):
+            if index is None:
+                # Live only, not in the log so it has no id to resume from
+                yield f"data: {json.dumps(event)}\n\n"
             else:
-                await asyncio.sleep(0.1)  # Sleep to prevent busy waiting
+                yield f"id: {index}\ndata: {json.dumps(event)}\n\n"
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
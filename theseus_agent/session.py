@@ -1,17 +1,17 @@
-import asyncio
 import inspect
 import json
 import logging
 import os
 import tempfile
-import time
+import threading
 import traceback
 from typing import Dict, List
 import copy
 
 from theseus_agent.agents.conversational_agent import ConversationalAgent
 from theseus_agent.config import Checkpoint, Config
-from theseus_agent.data_models import _delete_session_util, _save_session_util
+from theseus_agent.data_models import PersistenceWriter, SessionJournal, fingerprint
+from theseus_agent.environments.shell_environment import LocalShellEnvironment
 from theseus_agent.tool import ToolNotFoundException
 from theseus_agent.tools import parse_command
 from theseus_agent.tools.codenav import CodeGoTo, CodeSearch
@@ -31,8 +31,11 @@ from theseus_agent.tools.filetools import FileTreeDisplay, SearchFileTool
 from theseus_agent.tools.lifecycle import NoOpTool
 from theseus_agent.tools.shelltool import ShellTool
 from theseus_agent.tools.usertools import AskUserToolWithCommit
-from theseus_agent.tools.utils import get_ignored_files, read_file
+from theseus_agent.tools.utils import get_ignored_files
 from theseus_agent.utils.config_utils import get_checkpoint_id
+from theseus_agent.utils.event_log import EventLog
+from theseus_agent.utils.file_watcher import FileWatcher
+from theseus_agent.utils.rate_limiter import BACKOFF_MAX, RateLimiter
 from theseus_agent.utils.telemetry import Posthog, SessionStartEvent
 from theseus_agent.utils.utils import Event, WholeFileDiff, WholeFileDiffResults
 from theseus_agent.versioning.git_versioning import (
@@ -57,15 +60,13 @@ from theseus_agent.versioning.git_versioning import (
 )
 
 
-def waitForEvent(event_log: List[Dict], event_type: str):
-    while True:
-        if event_log[-1]["type"] == event_type:
-            return event_log[-1]
-        time.sleep(1)
+def waitForEvent(event_log: EventLog, event_type: str, start=None):
+    return event_log.wait_for_event(lambda event: event["type"] == event_type, start)
 
 
-def git_error(message: str, event_log: List[Dict]):
+def git_error(message: str, event_log: EventLog):
     print(f"Git Error: {message}")
+    start = len(event_log)
     event_log.append(
         {
             "type": "GitError",
@@ -74,16 +75,17 @@ def git_error(message: str, event_log: List[Dict]):
             "consumer": "user",
         }
     )
-    event = waitForEvent(event_log, "GitResolve")
+    event = waitForEvent(event_log, "GitResolve", start)
     if event["content"]["action"] == "nogit":
         return "nogit"
     if event["content"]["action"] == "resolved":
         return "resolvedError"
 
 
-def git_ask_user_for_action(message: str, event_log: List[Dict], event_type: str,options=["Yes","No"]):
+def git_ask_user_for_action(message: str, event_log: EventLog, event_type: str,options=["Yes","No"]):
     print(f"Git Ask User For Action: {message}", flush=True)
 
+    start = len(event_log)
     event_log.append(
         {
             "type": "GitAskUser",
@@ -96,10 +98,7 @@ def git_ask_user_for_action(message: str, event_log: List[Dict], event_type: str
         }
     )
 
-    while True:
-        if event_log[-1]["type"] == event_type:
-            return event_log[-1]
-        time.sleep(1)
+    return waitForEvent(event_log, event_type, start)
 
 
 class Session:
@@ -107,8 +106,14 @@ class Session:
         self.name = config.name
         self.config = config
         self.persist_to_db = config.persist_to_db
+        self.journal = SessionJournal()
         self.logger = logging.getLogger(self.config.logger_name)
 
+        # Shared by every event log this session owns, so waiters survive reverts and resets
+        self.event_condition = threading.Condition()
+        self.event_listeners = []
+        self.stream_listeners = []
+
         agent_config = self.config.agent_configs[0]
 
         if agent_config.agent_type == "conversational":
@@ -121,6 +126,8 @@ class Session:
             raise ValueError(f"Agent type {agent_config.agent_type} not supported")
 
         self.environments = config.environments
+        self.command_docs_cache = {}
+        self.file_watcher = None
 
         self.environments["local"].register_tools(
             {
@@ -142,8 +149,6 @@ class Session:
             }
         )
         self.environments["local"].set_default_tool(ShellTool())
-        self.environments["local"].event_log = event_log
-        self.environments["user"].event_log = event_log
 
         self.environments["user"].register_tools({"ask_user": AskUserToolWithCommit()})
         if self.config.versioning_type == "git":
@@ -155,7 +160,28 @@ class Session:
 
         self.default_environment = self.environments["local"]
 
-        self.event_log = event_log
+        self.set_event_log(event_log)
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, value):
+        with self.event_condition:
+            self._status = value
+            self.event_condition.notify_all()
+
+    def set_event_log(self, event_log: List[Dict]):
+        self.event_log = EventLog(
+            event_log,
+            condition=self.event_condition,
+            listeners=self.event_listeners,
+            stream_listeners=self.stream_listeners,
+        )
+        for env in self.environments.values():
+            env.event_log = self.event_log
+        self.event_log.notify()
 
     def init_state(self, event_log: List[Dict] = []):
         self.config.state = {}
@@ -170,9 +196,7 @@ class Session:
 
         self.agent.reset()
 
-        self.event_log = event_log
-        for env in self.environments.values():
-            env.event_log = event_log
+        self.set_event_log(event_log)
 
         if (
             Event(
@@ -241,16 +265,13 @@ class Session:
                         self.logger.error(f"Failed to revert to commit {checkpoint.commit_hash}: {result[1]}")
                         return
                 event_id = checkpoint.event_id
-                event_log = self.event_log[: event_id + 1]
                 self.event_id = event_id
-                self.event_log = event_log
+                self.set_event_log(self.event_log[: event_id + 1])
                 self.config.state = checkpoint.state
                 self.config.agent_configs[0].chat_history = list(
                     checkpoint.agent_history
                 )
                 self.setup()
-                for env in self.environments.values():
-                    env.event_log = event_log
                 self.start()
                 break
         self.config.checkpoints = self.config.checkpoints[: i + 1]
@@ -261,8 +282,7 @@ class Session:
             return
         self.status = "terminating"
 
-        while self.status != "terminated":
-            time.sleep(2)
+        self.event_log.wait_for(lambda: self.status == "terminated")
 
     def git_setup(self, action):
         self.logger.info(f"Setting up git for action {action}")
@@ -816,7 +836,7 @@ class Session:
 
             if self.status == "paused":
                 print("Session paused, waiting for resume")
-                time.sleep(2)
+                self.event_log.wait_for(lambda: self.status != "paused")
                 continue
 
             event = self.event_log[self.event_id]
@@ -858,16 +878,7 @@ class Session:
 
             case "ModelRequest":
                 # TODO: Need some quantized timestep for saving persistence that isn't literally every 0.1s
-                if self.config.state["editor"] and self.config.state["editor"]["files"]:
-                    for file in self.config.state["editor"]["files"]:
-                        self.config.state["editor"]["files"][file]["lines"] = read_file(
-                            {
-                                "environment": self.default_environment,
-                                "session": self,
-                                "state": self.config.state,
-                            },
-                            file,
-                        )
+                self.refresh_editor_files()
                 thought, action, output = self.agent.predict(
                     self.config.state["task"], event["content"], self
                 )
@@ -897,10 +908,15 @@ class Session:
                     )
 
             case "RateLimit":
-                for i in range(60):
-                    if self.status == "terminating":
-                        break
-                    time.sleep(1)
+                rate_limit_key = getattr(self.agent.current_model, "rate_limit_key", None)
+                delay = (
+                    RateLimiter.get().delay(rate_limit_key)
+                    if rate_limit_key is not None
+                    else BACKOFF_MAX
+                )
+                self.event_log.wait_for(
+                    lambda: self.status == "terminating", timeout=delay
+                )
                 new_events.append(
                     {
                         "type": "ModelRequest",
@@ -945,6 +961,7 @@ class Session:
                     response = env.tools[tool_name](
                         {
                             "environment": env,
+                            "session": self,
                             "config": self.config,
                             "state": self.config.state,
                             "event_log": self.event_log,
@@ -1116,19 +1133,83 @@ class Session:
 
         return tools
 
+    def refresh_editor_files(self):
+        """
+        Reload open editor files that changed on disk. With a local default
+        environment a FileWatcher tracks the open files and only the files it
+        saw change are read, plus those it cannot vouch for, which are read
+        only if their mtime or size changed. Other environments compare the
+        stat of every open file through read_files.
+        """
+        editor = self.config.state.get("editor")
+        if not editor or not editor.get("files"):
+            return
+        editor_files = editor["files"]
+
+        if self.file_watcher is None and isinstance(
+            self.default_environment, LocalShellEnvironment
+        ):
+            self.file_watcher = FileWatcher()
+        files = list(editor_files)
+        known = editor_files
+        if self.file_watcher is not None:
+            self.file_watcher.sync(editor_files)
+            changed = self.file_watcher.pop_changed()
+            unverified = self.file_watcher.pop_unverified()
+            files = [
+                file
+                for file in editor_files
+                if os.path.abspath(file) in changed or os.path.abspath(file) in unverified
+            ]
+            known = {
+                file: entry
+                for file, entry in editor_files.items()
+                if os.path.abspath(file) not in changed
+            }
+        if not files:
+            return
+
+        for file, read in self.default_environment.read_files(files, known=known).items():
+            if "error" in read:
+                # Keep showing what was last read rather than blanking the file
+                self.logger.warning("Could not refresh open file %s", read["error"])
+                continue
+            editor_files[file]["lines"] = read["content"]
+            editor_files[file]["mtime"] = read["mtime"]
+            editor_files[file]["size"] = read["size"]
+
     def generate_command_docs(self, format="manpage"):
         """
         Generates a dictionary of function names and their docstrings.
+
+        The result is memoized per format and reused until the set of
+        registered tools changes.
         """
+        tools = [
+            (name, tool)
+            for env in self.environments.values()
+            for name, tool in env.tools.items()
+        ]
+        cached = self.command_docs_cache.get(format)
+        if (
+            cached
+            and len(cached[0]) == len(tools)
+            and all(
+                name == cached_name and tool is cached_tool
+                for (name, tool), (cached_name, cached_tool) in zip(tools, cached[0])
+            )
+        ):
+            return cached[1]
+
         docs = {}
-        for env in self.environments.values():
-            for name, tool in env.tools.items():
-                signature = inspect.signature(tool.function)
-                docs[name] = {
-                    "docstring": tool.documentation(format),
-                    "signature": str(signature),
-                }
+        for name, tool in tools:
+            signature = inspect.signature(tool.function)
+            docs[name] = {
+                "docstring": tool.documentation(format),
+                "signature": str(signature),
+            }
 
+        self.command_docs_cache[format] = (tools, docs)
         return docs
 
     def setup(self):
@@ -1161,6 +1242,9 @@ class Session:
         self.telemetry_client.capture(SessionStartEvent(self.config.name))
 
     def teardown(self):
+        if self.file_watcher is not None:
+            self.file_watcher.close()
+            self.file_watcher = None
         for env in self.environments.values():
             env.teardown()
             for tool in env.tools.values():
@@ -1190,11 +1274,35 @@ class Session:
 
     def persist(self):
         if self.config.persist_to_db:
-            asyncio.run(_save_session_util(self.config.name, self.to_dict()))
+            exclude = {
+                "logger": True,
+                "checkpoints": True,
+                "agent_configs": {"__all__": {"chat_history"}},
+            }
+            # The state holds the open files' contents, it is hashed instead of dumped every step
+            config_hash = hash(
+                (
+                    json.dumps(
+                        self.config.model_dump(mode="json", exclude={**exclude, "state": True})
+                    ),
+                    fingerprint(self.config.state),
+                )
+            )
+            record = self.journal.record(
+                lambda: self.config.model_dump(mode="json", exclude=exclude),
+                self.event_log,
+                self.config.agent_configs[0].chat_history,
+                self.config.checkpoints,
+                config_hash=config_hash,
+            )
+            PersistenceWriter.get().submit(
+                self.config.name, record, on_error=self.journal.invalidate
+            )
 
     def delete_from_db(self):
         if self.config.persist_to_db:
-            asyncio.run(_delete_session_util(self.config.name))
+            PersistenceWriter.get().delete(self.config.name)
+            self.journal.invalidate()
 
     def merge(self, commit_message):
 
@@ -1269,6 +1377,8 @@ class Session:
             checkout_branch(self.config.path, "theseus_agent")
             os.remove(temp_file.name)
             src_checkpoint.merged_commit = merge_commit
+            # The checkpoint is already journaled, the next save has to snapshot it
+            self.journal.invalidate()
             return True, "Merge successful"
         else:
             self.logger.error("Error getting diff patch")
@@ -0,0 +1,95 @@
+"""
+Benchmark EditBlockTool's closest edit distance fallback against the previous
+exhaustive search.
+
+    python -m theseus_agent.test.benchmark_editorblock [LINES ...]
+"""
+
+import random
+import sys
+import time
+from difflib import SequenceMatcher
+
+from theseus_agent.tools.editorblock import find_closest_chunk
+
+
+def exhaustive_closest_chunk(whole_lines, part, part_lines, similarity_thresh=0.8):
+    """The search replaced by find_closest_chunk, kept here for comparison."""
+    max_similarity = 0
+    most_similar_chunk_start = -1
+    most_similar_chunk_end = -1
+
+    scale = 0.1
+    min_len = max(3, int(len(part_lines) * (1 - scale)))
+    max_len = min(len(whole_lines), int(len(part_lines) * (1 + scale)))
+
+    for length in range(min_len, max_len + 1):
+        for i in range(len(whole_lines) - length + 1):
+            chunk = "\n".join(whole_lines[i : i + length])
+            similarity = SequenceMatcher(None, chunk, part).ratio()
+
+            if similarity > max_similarity:
+                max_similarity = similarity
+                most_similar_chunk_start = i
+                most_similar_chunk_end = i + length
+
+    if max_similarity < similarity_thresh:
+        return -1, -1, max_similarity
+    return most_similar_chunk_start, most_similar_chunk_end, max_similarity
+
+
+def make_file(num_lines, seed=0):
+    rng = random.Random(seed)
+    names = ["value", "result", "index", "count", "total", "item", "node", "path"]
+    lines = []
+    while len(lines) < num_lines:
+        name = rng.choice(names) + str(rng.randrange(1000))
+        lines.extend(
+            [
+                f"def compute_{name}(data, limit={rng.randrange(100)}):",
+                f"    {name} = 0",
+                "    for entry in data:",
+                f"        if entry > {rng.randrange(50)}:",
+                f"            {name} += entry * {rng.randrange(9)}",
+                f"    return {name}",
+                "",
+            ]
+        )
+    return lines[:num_lines]
+
+
+def make_edits(whole_lines, seed=0):
+    rng = random.Random(seed)
+    start = rng.randrange(len(whole_lines) - 30)
+    block = whole_lines[start : start + 20]
+    return {
+        "reindented": [line.replace("    ", "  ") for line in block],
+        "typo": [line.replace("entry", "entri") for line in block],
+        "missing": ["def does_not_exist(x):", "    return x + 1"] * 10,
+    }
+
+
+def run(num_lines):
+    whole_lines = make_file(num_lines)
+    for name, part_lines in make_edits(whole_lines).items():
+        part = "\n".join(part_lines)
+        timings = []
+        results = []
+        for search in (find_closest_chunk, exhaustive_closest_chunk):
+            if search is exhaustive_closest_chunk and num_lines > 2000:
+                timings.append(None)
+                continue
+            started = time.perf_counter()
+            results.append(search(whole_lines, part, part_lines)[:2])
+            timings.append(time.perf_counter() - started)
+        same = "" if len(results) < 2 else f" same={results[0] == results[1]}"
+        exhaustive = "skipped" if timings[1] is None else f"{timings[1]:.3f}s"
+        print(
+            f"{num_lines:>6} lines {name:>10}: bounded {timings[0]:.3f}s, "
+            f"exhaustive {exhaustive}, match {results[0]}{same}"
+        )
+
+
+if __name__ == "__main__":
+    for num_lines in [int(arg) for arg in sys.argv[1:]] or [500, 2000, 5000, 20000]:
+        run(num_lines)
@@ -0,0 +1,185 @@
+import importlib
+import importlib.util
+import sys
+import types
+import uuid
+
+import networkx as nx
+import pytest
+
+MODULE = "theseus_agent.tools.semantic_search.code_graph_manager"
+
+
+@pytest.fixture
+def manager_module(monkeypatch):
+    if importlib.util.find_spec("chromadb") is None:
+        # Only the collection is exercised, and it is a fake
+        embedding_functions = types.ModuleType("chromadb.utils.embedding_functions")
+        embedding_functions.OpenAIEmbeddingFunction = lambda **kwargs: None
+        utils = types.ModuleType("chromadb.utils")
+        utils.embedding_functions = embedding_functions
+        chromadb = types.ModuleType("chromadb")
+        chromadb.utils = utils
+        monkeypatch.setitem(sys.modules, "chromadb", chromadb)
+        monkeypatch.setitem(sys.modules, "chromadb.utils", utils)
+        monkeypatch.setitem(
+            sys.modules, "chromadb.utils.embedding_functions", embedding_functions
+        )
+        monkeypatch.delitem(sys.modules, MODULE, raising=False)
+    return importlib.import_module(MODULE)
+
+
+class FakeCollection:
+    def __init__(self, entries):
+        self.entries = entries
+        self.calls = []
+
+    def delete(self, where):
+        self.calls.append(("delete", where))
+
+    def get(self, where, include):
+        node_ids = where["node_id"]["$in"]
+        ids = [id for id, metadata in self.entries.items() if metadata["node_id"] in node_ids]
+        return {"ids": ids, "metadatas": [self.entries[id] for id in ids]}
+
+    def update(self, ids, metadatas):
+        self.calls.append(("update", ids, metadatas))
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        self.calls.append(("upsert", ids, documents, metadatas))
+
+
+def build_graph(functions, doc=""):
+    """
+    A directory, a file and its functions, given as (name, text, start_line),
+    with fresh node ids like every build of GraphConstructor.
+    """
+    graph = nx.DiGraph()
+    directory, file = str(uuid.uuid4()), str(uuid.uuid4())
+    graph.graph["root_node_id"] = directory
+    graph.add_node(directory, node_id=directory, type="directory", path="pkg")
+    ids = {}
+    for name, text, start_line in functions:
+        ids[name] = str(uuid.uuid4())
+        graph.add_node(
+            ids[name],
+            node_id=ids[name],
+            type="function_definition",
+            name=name,
+            text=text,
+            doc=doc,
+            path=f"pkg.mod.{name}",
+            file_path="pkg/mod.py",
+            file_node_id=file,
+            start_line=start_line,
+            end_line=start_line + 1,
+        )
+        graph.add_edge(file, ids[name], type="FUNCTION_DEFINITION")
+    file_text = "import os\n# Code replaced for brevity. See node_id " + ids["keep"]
+    graph.add_node(
+        file,
+        node_id=file,
+        type="file",
+        name="mod",
+        text=file_text,
+        doc=doc,
+        path="pkg.mod",
+        file_path="pkg/mod.py",
+        start_line=1,
+        end_line=20,
+    )
+    graph.add_edge(directory, file, type="CONTAINS")
+    return graph, ids
+
+
+def two_builds(manager_module):
+    old_graph, old_ids = build_graph(
+        [
+            ("keep", "def keep():\n    pass", 3),
+            ("move", "def move():\n    pass", 6),
+            ("edit", "def edit():\n    pass", 9),
+            ("gone", "def gone():\n    pass", 12),
+        ],
+        doc="documented",
+    )
+    manager_module.set_content_hashes(old_graph)
+    graph, new_ids = build_graph(
+        [
+            ("keep", "def keep():\n    pass", 3),
+            ("added", "def added():\n    pass", 6),
+            ("move", "def move():\n    pass", 9),
+            ("edit", "def edit():\n    return 'edited'", 12),
+        ]
+    )
+    manager_module.reuse_node_ids(old_graph, graph)
+    manager_module.set_content_hashes(graph)
+    return old_graph, old_ids, graph, new_ids
+
+
+def test_reuse_node_ids_keeps_ids_of_matching_nodes(manager_module):
+    old_graph, old_ids, graph, new_ids = two_builds(manager_module)
+
+    for name in ("keep", "move", "edit"):
+        assert old_ids[name] in graph
+        assert graph.nodes[old_ids[name]]["node_id"] == old_ids[name]
+    assert new_ids["added"] in graph and old_ids["gone"] not in graph
+    assert graph.graph["root_node_id"] == old_graph.graph["root_node_id"]
+
+    old_file = next(node for node, data in old_graph.nodes(data=True) if data["type"] == "file")
+    assert old_file in graph
+    assert graph.nodes[new_ids["added"]]["file_node_id"] == old_file
+    # The placeholder points at the old id, so the file's text is unchanged
+    assert graph.nodes[old_file]["text"] == old_graph.nodes[old_file]["text"]
+
+
+def test_diff_graphs_splits_changed_moved_and_removed(manager_module):
+    old_graph, old_ids, graph, new_ids = two_builds(manager_module)
+
+    changed, moved, removed = manager_module.diff_graphs(old_graph, graph)
+
+    assert changed == {old_ids["edit"], new_ids["added"]}
+    assert list(moved) == [old_ids["move"]]
+    assert (moved[old_ids["move"]]["start_line"], moved[old_ids["move"]]["end_line"]) == (9, 10)
+    assert removed == [old_ids["gone"]]
+    assert graph.nodes[old_ids["keep"]]["doc"] == "documented"
+
+
+def test_update_collection_deletes_updates_and_upserts_by_node_id(manager_module, monkeypatch):
+    old_graph, old_ids, graph, new_ids = two_builds(manager_module)
+    changed, moved, removed = manager_module.diff_graphs(old_graph, graph)
+    for node in changed:
+        graph.nodes[node]["doc"] = "redocumented"
+    # The edited function is too long to embed whole, so it is stored in two entries
+    monkeypatch.setattr(
+        manager_module, "count_tokens", lambda text: 9000 if "edited" in text else 10
+    )
+
+    move_id = old_ids["move"]
+    collection = FakeCollection(
+        {
+            f"{move_id}-doc": {"node_id": move_id, "start_line": 6, "split_type": "documentation"},
+            f"{move_id}-code": {"node_id": move_id, "start_line": 6, "split_type": "code"},
+            old_ids["keep"]: {"node_id": old_ids["keep"], "start_line": 3},
+        }
+    )
+    manager = manager_module.CodeGraphManager("graph.pkl", "db", "collection", "key")
+    manager.openai_ef = lambda documents: [[float(len(document))] for document in documents]
+
+    manager.update_collection(collection, old_graph, graph, changed, moved, removed)
+
+    delete, update, upsert = collection.calls
+    assert delete == ("delete", {"node_id": {"$in": [old_ids["edit"], old_ids["gone"]]}})
+    assert update[0] == "update"
+    assert update[1] == [f"{move_id}-doc", f"{move_id}-code"]
+    assert [(metadata["start_line"], metadata["split_type"]) for metadata in update[2]] == [
+        (9, "documentation"),
+        (9, "code"),
+    ]
+    assert upsert[0] == "upsert"
+    assert sorted(upsert[1]) == sorted(
+        [new_ids["added"], f"{old_ids['edit']}-doc", f"{old_ids['edit']}-code"]
+    )
+    split_types = {id: metadata.get("split_type") for id, metadata in zip(upsert[1], upsert[3])}
+    assert split_types[f"{old_ids['edit']}-doc"] == "documentation"
+    assert split_types[f"{old_ids['edit']}-code"] == "code"
+    assert split_types[new_ids["added"]] is None
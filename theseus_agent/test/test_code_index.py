@@ -0,0 +1,113 @@
+import os
+import time
+
+from theseus_agent.tools.retrieval import code_index as code_index_module
+from theseus_agent.tools.retrieval.code_index import CodeIndex
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_refresh_reparses_only_changed_files(tmp_path, monkeypatch):
+    root = (tmp_path / "repo").as_posix()
+    write(f"{root}/a.py", "def alpha():\n    return 1\n")
+    write(f"{root}/pkg/b.py", "class Beta:\n    def method(self):\n        pass\n")
+
+    parsed = []
+    extract_file = code_index_module.extract_file
+    monkeypatch.setattr(
+        code_index_module,
+        "extract_file",
+        lambda path, *args: parsed.append(path) or extract_file(path, *args),
+    )
+
+    index = CodeIndex(root)
+    index.refresh()
+    assert sorted(parsed) == [f"{root}/a.py", f"{root}/pkg/b.py"]
+    assert index.find_function("ALPHA")[0]["location"]["file_path"] == "/a.py"
+    assert index.find_class("beta")[0]["location"]["file_path"] == "/pkg/b.py"
+
+    parsed.clear()
+    time.sleep(0.01)
+    write(f"{root}/a.py", "def gamma():\n    return 2\n")
+    os.remove(f"{root}/pkg/b.py")
+    assert index.find_function("gamma")[0]["code"].startswith("def gamma")
+    assert parsed == [f"{root}/a.py"]
+    assert index.find_function("alpha") == {}
+    assert index.find_class("Beta") == {}
+
+
+def test_shards_load_lazily(tmp_path, monkeypatch):
+    root = (tmp_path / "repo").as_posix()
+    cache_dir = (tmp_path / "cache").as_posix()
+    write(f"{root}/a.py", "def alpha():\n    return 1\n")
+    write(f"{root}/b.py", "def beta():\n    return 2\n")
+    CodeIndex(root, cache_dir=cache_dir).refresh()
+
+    monkeypatch.setattr(code_index_module, "extract_file", None)
+    index = CodeIndex(root, cache_dir=cache_dir)
+    assert not index.refresh()
+    assert index.loaded == set()
+    assert index.find_function("beta")[0]["location"]["start_line"] == 1
+    assert index.loaded == {"/b.py"}
+    nodes = index.code_graph.graph.nodes
+    assert nodes[f"alpha:{root}/a.py"]["location"]["file_path"] == "/a.py"
+    assert nodes[f"beta:{root}/b.py"]["type"] == "function"
+
+
+def test_symbol_lookup_is_case_insensitive_with_suggestions(tmp_path):
+    root = (tmp_path / "repo").as_posix()
+    write(
+        f"{root}/a.py",
+        "import functools\n\n\n@functools.cache\ndef load_config():\n    return {}\n\n\n"
+        "def load_cache():\n    pass\n\n\nclass ConfigLoader:\n    pass\n",
+    )
+    index = CodeIndex(root)
+    index.refresh()
+    index.load_all()
+
+    table = index.function_table
+    assert [e["location"]["start_line"] for e in table.lookup("LOAD_CONFIG")] == [5]
+    assert table.names_with_prefix("load_") == ["load_cache", "load_config"]
+    assert table.similar_names("load_confg")[0] == "load_config"
+    code = table.get_function_with_location("Load_Config")[0]["code"]
+    assert code.startswith("@functools.cache\ndef load_config")
+    assert code.endswith("return {}")
+    assert index.similar_names("class", "configloadr") == ["configloader"]
+    assert index.find_function("load_confg") == {}
+
+    table.remove_file(["load_config", "load_cache"], "/a.py")
+    assert table.lookup("load_config") == []
+    assert table.names_with_prefix("load") == []
+
+
+def test_lookups_of_known_names_do_not_walk_the_tree(tmp_path, monkeypatch):
+    root = (tmp_path / "repo").as_posix()
+    write(f"{root}/a.py", "def alpha():\n    return 1\n")
+    write(f"{root}/b.py", "class Beta:\n    pass\n")
+    index = CodeIndex(root)
+    index.refresh()
+
+    walks = []
+    discover = code_index_module.discover_python_files
+    monkeypatch.setattr(
+        code_index_module,
+        "discover_python_files",
+        lambda *args: walks.append(args) or discover(*args),
+    )
+    assert index.find_function("Alpha")[0]["location"]["file_path"] == "/a.py"
+    assert index.find_class("beta")[0]["location"]["file_path"] == "/b.py"
+    assert walks == []
+
+    # An edit to a defining file is still seen, a new file only once a lookup misses
+    time.sleep(0.01)
+    write(f"{root}/a.py", "def alpha():\n    return 2\n\n\ndef delta():\n    pass\n")
+    write(f"{root}/c.py", "def epsilon():\n    pass\n")
+    assert index.find_function("alpha")[0]["code"].endswith("return 2")
+    assert index.find_function("delta")[0]["location"]["start_line"] == 5
+    assert walks == []
+    assert index.find_function("epsilon")[0]["location"]["file_path"] == "/c.py"
+    assert len(walks) == 1
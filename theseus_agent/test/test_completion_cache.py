@@ -0,0 +1,36 @@
+from theseus_agent.utils.completion_cache import CompletionCache
+
+
+def test_key_ignores_api_key_and_orders_args():
+    messages = [{"role": "user", "content": "ls"}]
+    assert CompletionCache.key(model="gpt-4o", messages=messages, api_key="a") == (
+        CompletionCache.key(api_key="b", messages=messages, model="gpt-4o")
+    )
+    assert CompletionCache.key(model="gpt-4o", messages=messages) != (
+        CompletionCache.key(model="gpt-4o-mini", messages=messages)
+    )
+
+
+def test_hits_misses_and_persistence(tmp_path):
+    path = (tmp_path / "cache.db").as_posix()
+    cache = CompletionCache(path)
+    assert cache.get("a") is None
+    cache.put("a", "<COMMAND>ls</COMMAND>", "stop")
+    assert cache.get("a") == ("<COMMAND>ls</COMMAND>", "stop")
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1}
+    cache.close()
+
+    assert CompletionCache(path).get("a") == ("<COMMAND>ls</COMMAND>", "stop")
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = CompletionCache((tmp_path / "cache.db").as_posix(), max_entries=2)
+    cache.put("a", "1", "stop")
+    cache.put("b", "2", "stop")
+    cache.get("a")
+    cache.put("c", "3", "stop")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == ("1", "stop")
+    assert cache.get("c") == ("3", "stop")
+    assert cache.stats()["entries"] == 2
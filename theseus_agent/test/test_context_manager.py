@@ -0,0 +1,52 @@
+from theseus_agent.agents.context_manager import (MAX_OBSERVATION_TOKENS,
+                                                  ContextManager)
+
+
+def test_history_tokens_are_counted_incrementally():
+    context_manager = ContextManager(1000)
+    history = [{"role": "user", "content": "hello world"}]
+    first = context_manager.history_tokens(history)
+    history.append({"role": "assistant", "content": "ls -la"})
+    second = context_manager.history_tokens(history)
+
+    assert len(second) == 2
+    assert second[0] == first[0]
+    assert context_manager.history_tokens([]) == []
+
+
+def test_fit_history_drops_oldest_and_shortens_old_observations():
+    context_manager = ContextManager(100000)
+    big = "line of output\n" * 3000
+    history = [{"role": "user", "content": big}] + [
+        {"role": "assistant", "content": f"step {i}"} for i in range(10)
+    ]
+
+    fitted = context_manager.fit_history(history, 100000)
+    assert len(fitted) == len(history)
+    assert "tokens of output omitted" in fitted[0]["content"]
+    assert history[0]["content"] == big
+
+    fitted = context_manager.fit_history(history, 20)
+    assert "earlier messages omitted" in fitted[0]["content"]
+    assert fitted[-1] == history[-1]
+    assert sum(context_manager.count(e["content"]) for e in fitted[1:]) <= 20
+    assert MAX_OBSERVATION_TOKENS > 20
+
+
+def test_fit_editor_hides_least_recently_viewed():
+    context_manager = ContextManager(1000)
+    files = {
+        "a.py": {"page": 0, "lines": "a = 1\n" * 50},
+        "b.py": {"page": 0, "lines": "b = 2\n" * 50},
+    }
+    render = lambda path, file: file["lines"]
+    size = context_manager.count(files["a.py"]["lines"])
+
+    assert context_manager.fit_editor(files, size * 2, render).keys() == files.keys()
+
+    files["a.py"] = {"page": 1, "lines": files["a.py"]["lines"]}
+    visible = context_manager.fit_editor(files, size, render)
+    assert list(visible) == ["a.py"]
+
+    del files["a.py"]
+    assert list(context_manager.fit_editor(files, size, render)) == ["b.py"]
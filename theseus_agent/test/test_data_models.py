@@ -0,0 +1,219 @@
+import asyncio
+import json
+import threading
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from theseus_agent.config import Checkpoint
+from theseus_agent.data_models import (
+    Base,
+    JSONLog,
+    PersistenceWriter,
+    SessionJournal,
+    _save_record,
+    fingerprint,
+    load_data,
+    sqlite_url,
+)
+
+
+def make_config(history=None, task="fix bug"):
+    return {"task": task, "agent_configs": [{"model": "gpt4-o", "chat_history": history or []}]}
+
+
+def config_without_history(config):
+    return {
+        "task": config["task"],
+        "agent_configs": [{"model": config["agent_configs"][0]["model"]}],
+    }
+
+
+async def run_journal(tmp_path):
+    engine = create_async_engine(sqlite_url(str(tmp_path / "test.db")))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+    journal = SessionJournal(compact_every=4)
+    events = [{"type": "Task", "content": "a"}]
+    history = []
+    config = make_config(history)
+
+    async def save():
+        record = journal.record(config_without_history(config), events, history)
+        async with AsyncSessionLocal() as db:
+            await _save_record(db, "s", record)
+        return record
+
+    first = await save()
+    events.append({"type": "ModelRequest", "content": "b"})
+    history.append({"role": "user", "content": "b"})
+    second = await save()
+    config["task"] = "new task"
+    third = await save()
+
+    async with AsyncSessionLocal() as db:
+        loaded = await load_data(db)
+        rows = (await db.execute(select(JSONLog))).scalars().all()
+
+    await engine.dispose()
+    return first, second, third, loaded, rows, events, history
+
+
+def test_journal_appends_deltas_and_replays(tmp_path):
+    first, second, third, loaded, rows, events, history = asyncio.run(run_journal(tmp_path))
+
+    assert first["snapshot"] is not None
+    assert second["snapshot"] is None
+    assert [kind for kind, _, _ in second["entries"]] == ["event_history", "chat_history"]
+    assert [kind for kind, _, _ in third["entries"]] == ["config"]
+    assert len(rows) == 3
+
+    assert loaded["s"]["event_history"] == events
+    assert loaded["s"]["config"]["task"] == "new task"
+    assert loaded["s"]["config"]["agent_configs"][0]["chat_history"] == history
+
+
+def test_journal_snapshots_when_log_is_replaced():
+    journal = SessionJournal()
+    events = [{"type": "Task"}, {"type": "ModelRequest"}]
+    history = []
+    journal.record(make_config(), events, history)
+
+    assert journal.record(make_config(), events, history)["snapshot"] is None
+    assert journal.record(make_config(), events[:1], history)["snapshot"] is not None
+
+
+def test_persistence_writer_batches_and_flushes(tmp_path):
+    engine = create_async_engine(sqlite_url(str(tmp_path / "writer.db")))
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    writer = PersistenceWriter(flush_interval=60, engine=engine)
+    asyncio.run_coroutine_threadsafe(create_tables(), writer._loop).result()
+
+    journal = SessionJournal()
+    events = [{"type": "Task", "content": "a"}]
+    writer.submit("s", journal.record(make_config(), events, []))
+    events.append({"type": "ModelRequest", "content": "b"})
+    writer.submit("s", journal.record(make_config(), events, []))
+    writer.submit("other", SessionJournal().record(make_config(), events, []))
+    writer.delete("other")
+    writer.shutdown()
+
+    async def read():
+        AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+        async with AsyncSessionLocal() as db:
+            loaded = await load_data(db)
+        await engine.dispose()
+        return loaded
+
+    loaded = asyncio.run(read())
+    assert list(loaded) == ["s"]
+    assert loaded["s"]["event_history"] == events
+
+
+def make_checkpoint(number):
+    return Checkpoint(
+        commit_hash=f"{number:040x}",
+        commit_message=f"step {number}",
+        agent_history=[{"role": "user", "content": str(number)}],
+        event_id=number,
+        checkpoint_id=str(number),
+        state={"editor": {}},
+    )
+
+
+def test_journal_appends_checkpoints_outside_the_config(tmp_path):
+    engine = create_async_engine(sqlite_url(str(tmp_path / "checkpoints.db")))
+    AsyncSessionLocal = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    journal = SessionJournal()
+    events = [{"type": "Task", "content": "a"}]
+    history = []
+    checkpoints = [make_checkpoint(1)]
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        records = []
+        for _ in range(3):
+            records.append(journal.record(make_config(), events, history, checkpoints))
+            async with AsyncSessionLocal() as db:
+                await _save_record(db, "s", records[-1])
+            checkpoints.append(make_checkpoint(len(checkpoints) + 1))
+        async with AsyncSessionLocal() as db:
+            loaded = await load_data(db)
+        await engine.dispose()
+        return records, loaded
+
+    records, loaded = asyncio.run(run())
+
+    assert records[0]["snapshot"] is not None
+    # Each step writes only its new checkpoint, never the config again
+    assert [record["entries"] for record in records[1:]] == [
+        [("checkpoints", 1, json.dumps([make_checkpoint(2).model_dump(mode="json")]))],
+        [("checkpoints", 2, json.dumps([make_checkpoint(3).model_dump(mode="json")]))],
+    ]
+    assert loaded["s"]["config"]["checkpoints"] == [
+        checkpoint.model_dump(mode="json") for checkpoint in checkpoints[:3]
+    ]
+    assert loaded["s"]["config"]["task"] == "fix bug"
+
+
+def test_journal_dumps_the_config_only_when_its_hash_changed():
+    journal = SessionJournal()
+    events = [{"type": "Task", "content": "a"}]
+    history = []
+    state = {"editor": {"files": {"a.py": {"lines": "x = 1\n" * 1000}}}}
+    dumps = []
+
+    def dump():
+        dumps.append(1)
+        return dict(make_config(), state=state)
+
+    journal.record(dump, events, history, config_hash=fingerprint(state))
+    events.append({"type": "ModelRequest", "content": "b"})
+    record = journal.record(dump, events, history, config_hash=fingerprint(state))
+    assert len(dumps) == 1
+    assert [kind for kind, _, _ in record["entries"]] == ["event_history"]
+
+    state["editor"]["files"]["a.py"]["lines"] += "y = 2\n"
+    record = journal.record(dump, events, history, config_hash=fingerprint(state))
+    assert len(dumps) == 2
+    assert [kind for kind, _, _ in record["entries"]] == ["config"]
+
+
+def test_fingerprint_follows_nested_values():
+    value = {"files": {"a.py": {"lines": "x = 1\n", "page": 0}}, "cwd": ["/"]}
+    same = {"files": {"a.py": {"lines": "x = 1\n", "page": 0}}, "cwd": ["/"]}
+    assert fingerprint(value) == fingerprint(same)
+    same["files"]["a.py"]["page"] = 1
+    assert fingerprint(value) != fingerprint(same)
+    assert fingerprint({"set": {1}}) == fingerprint({"set": {1}})
+
+
+def test_journal_invalidate_is_safe_from_another_thread():
+    journal = SessionJournal()
+    events = [{"type": "Task", "content": "a"}]
+    stop = threading.Event()
+
+    def invalidate():
+        while not stop.is_set():
+            journal.invalidate()
+
+    thread = threading.Thread(target=invalidate)
+    thread.start()
+    try:
+        for i in range(2000):
+            events.append({"type": "ModelRequest", "content": str(i)})
+            record = journal.record(make_config(), events, [])
+            if record["snapshot"] is None:
+                # A delta always continues exactly where the previous record ended
+                assert record["entries"][0][1] == len(events) - 1
+    finally:
+        stop.set()
+        thread.join()
@@ -1,9 +1,13 @@
 import os
+import random
+import time
+
 import pytest
 from theseus_agent.config import Config
 from theseus_agent.environments.shell_environment import LocalShellEnvironment
 from theseus_agent.tools.shelltool import ShellTool
-from theseus_agent.tools.editorblock import EditBlockTool
+from theseus_agent.tools.editorblock import EditBlockTool, find_closest_chunk
+from theseus_agent.test.benchmark_editorblock import exhaustive_closest_chunk, make_edits, make_file
 from theseus_agent.tool import ToolContext
 
 @pytest.fixture
@@ -84,6 +88,7 @@ def greet(name):
     
     assert "def greet(name):" in updated_content
     assert "print(f'Hello, {name}!')" in updated_content
+    assert updated_content.endswith("hello()\n")
 
 @pytest.mark.flaky(reruns=20)
 def test_edit_empty_file(temp_dir_shell_environment, test_config):
@@ -122,3 +127,97 @@ if __name__ == "__main__":
     
     assert "def main():" in updated_content
     assert 'print("This file is no longer empty!")' in updated_content
+
+
+def test_find_closest_chunk():
+    whole_lines = [f"def f{i}(x):\n    y = x * {i}\n    return y".split("\n") for i in range(200)]
+    whole_lines = [line for block in whole_lines for line in block]
+    part_lines = ["def f120(x):", "  y = x * 120", "  return y", "def f121(x):"]
+    part = "\n".join(part_lines)
+
+    assert find_closest_chunk(whole_lines, part, part_lines)[:2] == (360, 364)
+
+    # No line of the part occurs in the file, so every window is scored
+    part_lines = ["def f120(z):", "  w = z * 120", "  return w", "def f121(z):"]
+    assert find_closest_chunk(whole_lines, "\n".join(part_lines), part_lines)[:2] == (360, 364)
+
+    part_lines = ["class Widget:", "    pass", "", "widget = Widget()"]
+    start, end, similarity = find_closest_chunk(whole_lines, "\n".join(part_lines), part_lines)
+    assert (start, end) == (-1, -1)
+    assert similarity < 0.8
+
+    tool = EditBlockTool()
+    new = tool.replace_most_similar_chunk(
+        "\n".join(whole_lines), "def f5(x):\n  y = x * 5\n  return  y", "def f5(x):\n    return 0"
+    )
+    assert "def f5(x):\n    return 0\ndef f6(x):" in new
+
+
+def test_find_closest_chunk_scores_windows_that_do_not_anchor():
+    whole_lines = []
+    for i in range(100):
+        whole_lines += [
+            f"def handle_{i}(request):",
+            "    payload = request.json()",
+            f"    result = process_{i}(payload)",
+            "    return send(result)",
+        ]
+    whole_lines[9] = "    cache.clear()"
+    # Only the unrelated line anchors, the edited handler has a typo on every line
+    part_lines = [
+        "def handle_50(reqest):",
+        "    payload = reqest.json()",
+        "    cache.clear()",
+        "    result = proces_50(payload)",
+        "    return send(reslt)",
+    ]
+    part = "\n".join(part_lines)
+    assert find_closest_chunk(whole_lines, part, part_lines) == exhaustive_closest_chunk(
+        whole_lines, part, part_lines
+    )
+    assert find_closest_chunk(whole_lines, part, part_lines)[:2] == (200, 204)
+
+
+def test_find_closest_chunk_matches_exhaustive_search():
+    rng = random.Random(0)
+    words = ["a = 1", "b = 2", "return a", "pass", "x = a + b", "if a:", "else:"]
+    for _ in range(100):
+        whole_lines = [rng.choice(words) + " " * rng.randrange(2) for _ in range(rng.randrange(3, 40))]
+        part_lines = [rng.choice(words) for _ in range(rng.randrange(3, 8))]
+        part = "\n".join(part_lines)
+        start, end, similarity = find_closest_chunk(whole_lines, part, part_lines)
+        expected = exhaustive_closest_chunk(whole_lines, part, part_lines)
+        assert (start, end) == expected[:2]
+        if start >= 0:
+            assert similarity == expected[2]
+
+
+def test_find_closest_chunk_matches_exhaustive_search_on_long_parts():
+    whole_lines = make_file(150, seed=1)
+    rng = random.Random(1)
+    for _ in range(10):
+        start = rng.randrange(len(whole_lines) - 25)
+        part_lines = [
+            line.replace(rng.choice(["entry", "data", "    "]), rng.choice(["entri", "  "]))
+            for line in whole_lines[start : start + rng.randrange(10, 20)]
+        ]
+        part = "\n".join(part_lines)
+        assert len(part) >= 200
+        result = find_closest_chunk(whole_lines, part, part_lines)
+        expected = exhaustive_closest_chunk(whole_lines, part, part_lines)
+        assert result[:2] == expected[:2]
+        if result[0] >= 0:
+            assert result[2] == expected[2]
+
+
+def test_find_closest_chunk_is_faster_than_exhaustive_search():
+    whole_lines = make_file(400)
+    for part_lines in make_edits(whole_lines).values():
+        part = "\n".join(part_lines)
+        timings = []
+        for search in (find_closest_chunk, exhaustive_closest_chunk):
+            started = time.perf_counter()
+            result = search(whole_lines, part, part_lines)
+            timings.append(time.perf_counter() - started)
+        assert result[:2] == find_closest_chunk(whole_lines, part, part_lines)[:2]
+        assert timings[0] * 3 < timings[1]
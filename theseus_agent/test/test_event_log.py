@@ -0,0 +1,93 @@
+import asyncio
+import threading
+
+from theseus_agent.utils.event_log import EventBroadcaster, EventLog
+
+
+def test_wait_for_event_wakes_on_append():
+    event_log = EventLog([{"type": "Task", "content": "", "producer": "system", "consumer": "theseus"}])
+    start = len(event_log)
+
+    def respond():
+        event_log.append({"type": "UserRequest", "content": "", "producer": "tool", "consumer": "user"})
+        event_log.append({"type": "GitResolve", "content": {"action": "yes"}, "producer": "user", "consumer": "theseus"})
+
+    threading.Timer(0.05, respond).start()
+    event = event_log.wait_for_event(lambda e: e["type"] == "GitResolve", start, timeout=5)
+
+    assert event is not None
+    assert event["content"]["action"] == "yes"
+
+
+def test_wait_for_event_times_out():
+    event_log = EventLog()
+    assert event_log.wait_for_event(lambda e: True, timeout=0.05) is None
+
+
+def test_shared_condition_across_logs():
+    condition = threading.Condition()
+    old_log = EventLog([], condition=condition)
+    new_log = EventLog(old_log[:1], condition=condition)
+    state = {"ready": False}
+
+    def flip():
+        with condition:
+            state["ready"] = True
+            condition.notify_all()
+
+    threading.Timer(0.05, flip).start()
+    assert new_log.wait_for(lambda: state["ready"], timeout=5)
+    assert isinstance(new_log, list)
+
+
+def test_broadcaster_streams_tail_and_new_events():
+    event_log = EventLog([{"type": "Task"}, {"type": "ModelRequest"}])
+
+    async def collect():
+        broadcaster = EventBroadcaster(asyncio.get_running_loop())
+        event_log.listeners.append(broadcaster.notify)
+        received = []
+
+        async def consume():
+            async for index, event in broadcaster.stream(lambda: event_log, 1):
+                received.append((index, event["type"]))
+                if len(received) == 2:
+                    return
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0)
+        threading.Thread(target=lambda: event_log.append({"type": "ToolRequest"})).start()
+        await asyncio.wait_for(consumer, 5)
+        return received
+
+    assert asyncio.run(collect()) == [(1, "ModelRequest"), (2, "ToolRequest")]
+
+
+def test_published_events_reach_subscribers_without_being_logged():
+    event_log = EventLog([{"type": "Task"}])
+
+    async def collect():
+        broadcaster = EventBroadcaster(asyncio.get_running_loop())
+        event_log.listeners.append(broadcaster.notify)
+        event_log.stream_listeners.append(broadcaster.publish)
+        received = []
+
+        async def consume():
+            async for index, event in broadcaster.stream(lambda: event_log, 1):
+                received.append((index, event["type"]))
+                if len(received) == 2:
+                    return
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0)
+
+        def produce():
+            event_log.publish({"type": "ModelStream", "content": "par"})
+            event_log.append({"type": "ModelResponse", "content": "partial"})
+
+        threading.Thread(target=produce).start()
+        await asyncio.wait_for(consumer, 5)
+        return received
+
+    assert asyncio.run(collect()) == [(None, "ModelStream"), (1, "ModelResponse")]
+    assert [event["type"] for event in event_log] == ["Task", "ModelResponse"]
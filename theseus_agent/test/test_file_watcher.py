@@ -0,0 +1,156 @@
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from theseus_agent.environment import read_local_files
+from theseus_agent.utils.file_watcher import FileWatcher
+
+
+@pytest.fixture(params=[True, False], ids=["inotify", "poll"])
+def watcher(request):
+    watcher = FileWatcher(poll_interval=0.05, use_inotify=request.param)
+    yield watcher
+    watcher.close()
+
+
+def wait_for_change(watcher, path):
+    changed = threading.Event()
+    watcher.listeners.append(lambda p: p == path and changed.set())
+    return changed
+
+
+def test_marks_only_changed_files(watcher, tmp_path):
+    a = (tmp_path / "a.py").as_posix()
+    b = (tmp_path / "b.py").as_posix()
+    for path in (a, b):
+        with open(path, "w") as f:
+            f.write("x = 1\n")
+
+    watcher.sync([a, b])
+    assert watcher.pop_changed() == {a, b}
+    assert watcher.pop_changed() == set()
+
+    changed = wait_for_change(watcher, b)
+    with open(b, "a") as f:
+        f.write("y = 2\n")
+    assert changed.wait(5)
+    assert watcher.pop_changed() == {b}
+
+
+def test_sees_atomic_replace_and_unwatch(watcher, tmp_path):
+    a = (tmp_path / "a.py").as_posix()
+    with open(a, "w") as f:
+        f.write("x = 1\n")
+    watcher.watch(a)
+    watcher.pop_changed()
+
+    changed = wait_for_change(watcher, a)
+    with open(a + ".tmp", "w") as f:
+        f.write("x = 2\n")
+    os.replace(a + ".tmp", a)
+    assert changed.wait(5)
+    assert a in watcher.pop_changed()
+
+    watcher.sync([])
+    assert watcher.paths == set()
+    assert watcher.changed == set()
+
+
+def test_unverified_paths(watcher, tmp_path):
+    root = os.path.realpath(tmp_path)
+    a = os.path.join(root, "a.py")
+    link = os.path.join(root, "link.py")
+    missing = os.path.join(root, "missing", "c.py")
+    with open(a, "w") as f:
+        f.write("x = 1\n")
+    os.symlink(a, link)
+
+    watcher.sync([a, link, missing])
+    if watcher.uses_inotify:
+        assert watcher.pop_unverified() == {link, missing}
+        # Covered once its directory exists
+        os.mkdir(os.path.dirname(missing))
+        watcher.sync([a, link, missing])
+        assert watcher.pop_unverified() == {link}
+    else:
+        assert watcher.pop_unverified() == {a, link, missing}
+
+
+def test_pop_changed_includes_changes_not_yet_delivered(tmp_path):
+    watcher = FileWatcher(use_inotify=True)
+    if not watcher.uses_inotify:
+        watcher.close()
+        pytest.skip("inotify is not available")
+    try:
+        a = os.path.join(os.path.realpath(tmp_path), "a.py")
+        watcher.watch(a)
+        watcher.pop_changed()
+        for i in range(20):
+            with open(a, "w") as f:
+                f.write(f"x = {i}\n")
+            assert watcher.pop_changed() == {a}
+    finally:
+        watcher.close()
+
+
+class FakeWatcher:
+    def __init__(self, changed, unverified=()):
+        self.changed = changed
+        self.unverified = set(unverified)
+
+    def sync(self, paths):
+        pass
+
+    def pop_changed(self):
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def pop_unverified(self):
+        return self.unverified
+
+
+class LocalFiles:
+    def __init__(self):
+        self.reads = []
+
+    def read_files(self, paths, known=None):
+        self.reads.append(list(paths))
+        return read_local_files(paths, known)
+
+
+def test_refresh_editor_files_reads_what_the_watcher_reports(tmp_path):
+    Session = pytest.importorskip("theseus_agent.session").Session
+    a = (tmp_path / "a.py").as_posix()
+    b = (tmp_path / "b.py").as_posix()
+    for path in (a, b):
+        with open(path, "w") as f:
+            f.write("x = 1\n")
+    editor_files = {a: {"lines": ""}, b: {"lines": ""}}
+    session = SimpleNamespace(
+        config=SimpleNamespace(state={"editor": {"files": editor_files}}),
+        file_watcher=FakeWatcher({a, b}),
+        default_environment=LocalFiles(),
+    )
+    Session.refresh_editor_files(session)
+    assert editor_files[a]["lines"] == editor_files[b]["lines"] == "x = 1\n"
+
+    # Nothing reported, nothing read
+    Session.refresh_editor_files(session)
+    assert session.default_environment.reads == [[a, b]]
+
+    # A reported file is read even when its stat did not change
+    editor_files[b]["lines"] = "stale"
+    session.file_watcher = FakeWatcher({b})
+    Session.refresh_editor_files(session)
+    assert editor_files[b]["lines"] == "x = 1\n"
+    assert session.default_environment.reads[-1] == [b]
+
+    # Files the watcher cannot vouch for fall back to the stat comparison
+    with open(a, "w") as f:
+        f.write("x = 22\n")
+    session.file_watcher = FakeWatcher(set(), unverified={a, b})
+    Session.refresh_editor_files(session)
+    assert editor_files[a]["lines"] == "x = 22\n"
+    assert editor_files[b]["lines"] == "x = 1\n"
@@ -0,0 +1,53 @@
+import subprocess
+
+import pytest
+
+from theseus_agent.versioning.git_versioning import GitVersioning
+
+
+def git(path, *args):
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=path,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip()
+
+
+@pytest.mark.parametrize("object_format", ["sha1", "sha256"])
+def test_get_diff_list_reads_all_changes_at_once(tmp_path, object_format):
+    git(tmp_path, "init", "-q", f"--object-format={object_format}")
+    (tmp_path / "kept.py").write_text("a = 1\n")
+    (tmp_path / "changed.py").write_text("b = 1\n")
+    (tmp_path / "removed.py").write_text("c = 1\n")
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "first")
+    first = git(tmp_path, "rev-parse", "HEAD")
+
+    (tmp_path / "changed.py").write_text("b = 2\n")
+    (tmp_path / "removed.py").unlink()
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "new file.py").write_text("d = 'é'\n")
+    git(tmp_path, "add", "-A")
+    git(tmp_path, "commit", "-q", "-m", "second")
+
+    versioning = GitVersioning(tmp_path.as_posix(), None)
+    read_blobs = versioning.read_blobs
+    requested = []
+    versioning.read_blobs = lambda object_ids: requested.extend(object_ids) or read_blobs(object_ids)
+    diff_list, error = versioning.get_diff_list(first, "HEAD")
+    assert error is None
+    # The null id of added and removed files is not looked up
+    assert len(requested) == 4 and not any(set(object_id) == {"0"} for object_id in requested)
+    assert sorted(diff_list) == [
+        ("changed.py", "b = 1\n", "b = 2\n"),
+        ("dir/new file.py", "", "d = 'é'\n"),
+        ("removed.py", "c = 1\n", ""),
+    ]
+
+    assert versioning.get_diff_list(first, "HEAD")[0] is diff_list
+    assert versioning.get_diff_list(first, "nonexistent") == (
+        [],
+        "Error: Invalid commit 'nonexistent'",
+    )
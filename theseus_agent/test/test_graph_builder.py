@@ -0,0 +1,161 @@
+import re
+
+import pytest
+
+pytest.importorskip("tree_sitter_languages")
+
+from theseus_agent.tools.semantic_search.graph_construction.core.graph_builder import \
+    GraphConstructor
+from theseus_agent.tools.semantic_search.graph_construction.languages.python.python_parser import \
+    PythonParser
+from theseus_agent.tools.semantic_search.graph_construction.utils.tree_parser import \
+    remove_non_ascii
+
+NODE_ID = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+
+def write_tree(root):
+    (root / "pkg" / "sub").mkdir(parents=True)
+    (root / "pkg" / "__init__.py").write_text("from .models import Model\n")
+    (root / "pkg" / "models.py").write_text(
+        "import os\n\n\nclass Model:\n    def save(self, path):\n"
+        "        return os.path.join(path, 'model')\n\n\ndef load(path):\n    return Model()\n"
+    )
+    (root / "pkg" / "sub" / "jobs.py").write_text(
+        "from ..models import load\n\n\ndef run():\n    model = load('x')\n    model.save('y')\n"
+    )
+    (root / "pkg" / "sub" / "util.py").write_text("def helper():\n    return 'ü'\n")
+
+
+def canonical(graph):
+    """The graph with node ids, which are new on every build, replaced by stable keys."""
+    keys = {
+        node: (data["type"], data["path"], data.get("start_line"))
+        for node, data in graph.nodes(data=True)
+    }
+    nodes = {
+        keys[node]: {
+            name: NODE_ID.sub("<id>", value) if isinstance(value, str) else value
+            for name, value in data.items()
+            if name not in ("node_id", "file_node_id")
+        }
+        for node, data in graph.nodes(data=True)
+    }
+    edges = sorted((keys[source], keys[target], data["type"]) for source, target, data in graph.edges(data=True))
+    return nodes, edges
+
+
+def test_parallel_build_matches_serial_build(tmp_path):
+    write_tree(tmp_path)
+    graphs = []
+    for workers in (1, 2):
+        constructor = GraphConstructor("python")
+        constructor.build_graph(tmp_path.as_posix(), workers=workers)
+        graphs.append(canonical(constructor.graph))
+
+    nodes, edges = graphs[0]
+    assert graphs[1] == graphs[0]
+    assert {(key[0], key[1]) for key in nodes} >= {
+        ("class_definition", f"{tmp_path.as_posix()}/pkg/models.Model".replace("/", ".")),
+        ("function_definition", f"{tmp_path.as_posix()}/pkg/sub/jobs.run".replace("/", ".")),
+    }
+    assert len(edges) == len(nodes) - 1
+
+
+NESTED_SOURCE = """import os
+from functools import wraps
+
+
+def decorator(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+class Outer:
+    \"\"\"Grüße aus Köln.\"\"\"
+
+    greeting = "héllo"
+
+    class Inner:
+        def method(self):
+            return os.getcwd()
+
+        @staticmethod
+        def static(value):
+            return value * 2
+
+    @decorator
+    def run(self, path):
+        inner = self.Inner()
+        return inner.method() + path
+
+
+@decorator
+def main():
+    outer = Outer()
+    return outer.run("ü")
+"""
+
+
+def parse_with(backend, path):
+    """Nodes, edges and imports of path, with node ids replaced by node paths."""
+    parser = PythonParser()
+    parser.backend = backend
+    nodes, edges, imports = parser.parse_file(
+        path.as_posix(), path.parent.as_posix(), visited_nodes={}, global_imports={}, level=0
+    )
+    paths = {node["attributes"]["node_id"]: node["attributes"]["path"] for node in nodes}
+    parsed = []
+    for node in nodes:
+        attributes = {
+            name: NODE_ID.sub(lambda match: paths[match.group(0)], value)
+            if isinstance(value, str)
+            else value
+            for name, value in node["attributes"].items()
+            if name not in ("node_id", "file_node_id")
+        }
+        parsed.append((node["type"], attributes))
+    edges = sorted((paths[edge["sourceId"]], paths[edge["targetId"]], edge["type"]) for edge in edges)
+    return parsed, edges, list(imports.values())
+
+
+def test_tree_sitter_backend_replaces_child_scopes(tmp_path):
+    path = tmp_path / "mod.py"
+    path.write_text(NESTED_SOURCE)
+    nodes, edges, _ = parse_with("tree_sitter", path)
+
+    by_name = {attributes["name"]: attributes for _, attributes in nodes}
+    outer = by_name["Outer"]
+    inner_path = outer["path"] + ".Inner"
+    assert outer["text"].startswith('class Outer:\n    """Grüße aus Köln."""')
+    assert (
+        f"    class Inner:\n        # Code replaced for brevity. See node_id {inner_path}\n" in outer["text"]
+    )
+    assert "    @decorator\n    def run(self, path):\n        # Code replaced" in outer["text"]
+    assert by_name["static"]["text"] == "def static(value):\n            return value * 2"
+    assert (by_name["main"]["start_line"], by_name["main"]["end_line"]) == (33, 35)
+    assert (outer["path"], inner_path, "CLASS_DEFINITION") in edges
+    assert len(edges) == len(nodes) - 1
+
+
+def test_tree_sitter_backend_matches_code_hierarchy_parser(tmp_path):
+    pytest.importorskip("llama_index.packs.code_hierarchy")
+    path = tmp_path / "mod.py"
+    path.write_text(NESTED_SOURCE)
+
+    nodes, edges, imports = parse_with("tree_sitter", path)
+    # The llama_index backend drops non-ASCII characters before parsing
+    nodes = [
+        (
+            node_type,
+            {
+                name: remove_non_ascii(value) if isinstance(value, str) else value
+                for name, value in attributes.items()
+            },
+        )
+        for node_type, attributes in nodes
+    ]
+    assert (nodes, edges, imports) == parse_with("llama_index", path)
@@ -0,0 +1,38 @@
+import pytest
+
+from theseus_agent.tools.lint_service import LintService
+
+
+@pytest.fixture
+def service():
+    service = LintService(timeout=30)
+    yield service
+    service.close()
+
+
+def test_lint_reports_errors_and_caches(service):
+    results = service.lint("import os\nos.nothing_here\nprint(undefined_name)\n")
+    assert {(r["line"], r["symbol"]) for r in results} == {
+        (2, "no-member"),
+        (3, "undefined-variable"),
+    }
+    assert service.lint("import os\nos.nothing_here\nprint(undefined_name)\n") == results
+    assert service.stats()["hits"] == 1
+
+
+def test_new_errors_only_reports_introduced(service):
+    before = "x = 1\nprint(missing)\n"
+    after = "x = 1\nprint(missing)\nprint(also_missing)\n"
+    assert [r["message"] for r in service.new_errors(before, after)] == [
+        "Undefined variable 'also_missing'"
+    ]
+    # The content linted last is what the next edit starts from
+    service.new_errors(after, "x = 1\n")
+    assert service.stats() == {"hits": 1, "misses": 3, "cached": 3}
+
+
+def test_worker_restarts_after_dying(service):
+    assert service.lint("y\n")[0]["symbol"] == "undefined-variable"
+    service.process.kill()
+    service.process.join()
+    assert service.lint("z\n")[0]["symbol"] == "undefined-variable"
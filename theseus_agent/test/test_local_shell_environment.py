@@ -74,3 +74,84 @@ def test_shared_shell_environment(temp_dir_shell_environment):
     stdout, rc = temp_dir_shell_environment.execute("echo $TESTVAR")
     assert rc == 0
     assert stdout == "test\n"
+
+
+def test_read_files_skips_unchanged(tmp_path: pathlib.Path):
+    env = LocalShellEnvironment(path=tmp_path.as_posix())
+    (tmp_path / "a.py").write_text("a = 1\n")
+    (tmp_path / "b.py").write_text("b = 2\n")
+    paths = [(tmp_path / "a.py").as_posix(), (tmp_path / "b.py").as_posix(), "missing.py"]
+
+    files = env.read_files(paths)
+    assert sorted(files) == sorted(paths)
+    assert files[paths[0]]["content"] == "a = 1\n"
+    assert "content" not in files["missing.py"]
+    assert files["missing.py"]["error"] == "No such file or directory: missing.py"
+
+    (tmp_path / "b.py").write_text("b = 22\n")
+    changed = env.read_files(paths, known=files)
+    assert list(changed) == [paths[1], "missing.py"]
+    assert changed[paths[1]]["content"] == "b = 22\n"
+
+
+def test_write_file_is_native_and_keeps_mode(tmp_path: pathlib.Path):
+    env = LocalShellEnvironment(path=tmp_path.as_posix())
+    content = "cat << 'DELIM'\nDELIM\n" * 3
+    target = (tmp_path / "new" / "dir" / "script.sh").as_posix()
+
+    env.write_file(target, content)
+    assert open(target).read() == content
+
+    os.chmod(target, 0o755)
+    env.write_file(target, "echo hi")
+    assert open(target).read() == "echo hi\n"
+    assert os.stat(target).st_mode & 0o777 == 0o755
+    assert os.listdir(os.path.dirname(target)) == ["script.sh"]
+
+
+def test_execute_recovers_from_timeout_and_exit(tmp_path: pathlib.Path):
+    env = LocalShellEnvironment(path=tmp_path.as_posix())
+    env.setup()
+    try:
+        assert env.execute("printf abc; false") == ("abc", 1)
+        assert env.execute("echo out; echo err >&2") == ("out\nerr\n", 0)
+
+        assert env.execute("sleep 30; echo late", timeout_duration=0.5)[1] == -1
+        assert env.execute("echo next") == ("next\n", 0)
+
+        assert env.execute("exit 3")[1] == -1
+        assert env.execute("echo restarted") == ("restarted\n", 0)
+    finally:
+        env.stop_shell()
+        env.teardown()
+
+
+def test_cwd_is_tracked_without_pwd(tmp_path: pathlib.Path):
+    (tmp_path / "sub").mkdir()
+    env = LocalShellEnvironment(path=tmp_path.as_posix())
+    env.setup()
+    try:
+        assert env.get_cwd() == tmp_path.as_posix()
+        env.execute("cd sub")
+        requests = len(env.event_log)
+        assert env.get_cwd() == (tmp_path / "sub").as_posix()
+        assert len(env.event_log) == requests
+    finally:
+        env.stop_shell()
+        env.teardown()
+
+
+def test_output_is_streamed_live_and_decoded_across_reads(tmp_path: pathlib.Path):
+    env = LocalShellEnvironment(path=tmp_path.as_posix())
+    streamed = []
+    env.event_log.stream_listeners.append(streamed.append)
+    env.setup()
+    try:
+        # é is split over two reads of stdout
+        assert env.execute(r"printf '\303'; sleep 0.2; printf '\251\n'") == ("é\n", 0)
+        assert "".join(event["content"] for event in streamed) == "é\n"
+        assert {event["type"] for event in streamed} == {"EnvironmentStream"}
+        assert all(event["type"] != "EnvironmentStream" for event in env.event_log)
+    finally:
+        env.stop_shell()
+        env.teardown()
@@ -0,0 +1,35 @@
+from theseus_agent import model
+from theseus_agent.model import AnthropicModel, ModelArguments
+
+EPHEMERAL = {"type": "ephemeral"}
+
+
+def test_prompt_caching_marks_system_prompt_and_history(monkeypatch):
+    monkeypatch.setattr(model, "litellm_supports_prompt_caching", lambda: True)
+    messages = [
+        {"role": "user", "content": "task"},
+        {"role": "assistant", "content": "<COMMAND>ls</COMMAND>"},
+        {"role": "user", "content": "editor and observation"},
+    ]
+
+    cached = AnthropicModel(ModelArguments("claude-3-5-sonnet", api_key="key"))
+    system, *rest = cached._cached_messages("docs", messages)
+    assert system["content"] == [{"type": "text", "text": "docs", "cache_control": EPHEMERAL}]
+    assert rest[0] == messages[0]
+    assert rest[1]["content"][0]["cache_control"] == EPHEMERAL
+    assert rest[1]["content"][0]["text"] == "<COMMAND>ls</COMMAND>"
+    assert rest[2] == messages[2]
+    assert messages[1]["content"] == "<COMMAND>ls</COMMAND>"
+
+    # No caching for models without it
+    uncached = AnthropicModel(ModelArguments("claude-sonnet", api_key="key"))
+    assert uncached._cached_messages("docs", messages) == [
+        {"role": "system", "content": "docs"}
+    ] + messages
+
+
+def test_prompt_caching_needs_a_recent_litellm(monkeypatch):
+    monkeypatch.setattr(model.importlib.metadata, "version", lambda name: "1.43.2")
+    assert not model.litellm_supports_prompt_caching()
+    monkeypatch.setattr(model.importlib.metadata, "version", lambda name: "1.44.0.dev1")
+    assert model.litellm_supports_prompt_caching()
@@ -0,0 +1,60 @@
+import time
+
+from theseus_agent.utils.rate_limiter import (BACKOFF_MAX, RateLimiter,
+                                              parse_duration)
+
+
+def test_parse_duration():
+    assert parse_duration("20") == 20
+    assert parse_duration("1m30s") == 90
+    assert parse_duration("250ms") == 0.25
+    assert parse_duration("2000-01-01T00:00:00Z") == 0
+    assert parse_duration("soon") is None
+    assert parse_duration(None) is None
+
+
+def test_retry_after_pauses_key_only():
+    limiter = RateLimiter()
+    assert limiter.record_limited(("openai", "a"), {"retry-after": "30"}) == 30
+
+    assert 30 <= limiter.delay(("openai", "a")) <= 30 * 1.25 + 0.1
+    assert limiter.delay(("openai", "b")) == 0
+    assert not limiter.acquire(("openai", "a"), timeout=0.05)
+    assert limiter.acquire(("openai", "b"), timeout=0.05)
+
+
+def test_backoff_grows_without_retry_after():
+    limiter = RateLimiter()
+    delays = [limiter.record_limited("key") for _ in range(10)]
+
+    assert delays[0] <= 2
+    assert max(delays) <= BACKOFF_MAX
+    assert delays[-1] >= BACKOFF_MAX / 2
+
+
+def test_headers_fill_bucket_and_pause_on_exhaustion():
+    limiter = RateLimiter()
+    limiter.record_success(
+        "key",
+        {
+            "llm_provider-x-ratelimit-limit-requests": "600",
+            "llm_provider-x-ratelimit-remaining-requests": "2",
+        },
+    )
+    assert limiter.acquire("key", timeout=0)
+    assert limiter.acquire("key", timeout=0)
+    # Bucket is empty, 600 per minute refills one request every 0.1s
+    start = time.monotonic()
+    assert limiter.acquire("key", timeout=1)
+    assert time.monotonic() - start >= 0.05
+
+    limiter.record_success(
+        "key",
+        {
+            "x-ratelimit-remaining-tokens": "0",
+            "x-ratelimit-reset-tokens": "10s",
+        },
+    )
+    assert limiter.delay("key") >= 10
+    limiter.record_success("key", {})
+    assert limiter.delay("key") >= 9
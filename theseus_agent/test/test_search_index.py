@@ -0,0 +1,78 @@
+import os
+import time
+
+from theseus_agent.tools.search_index import (SearchIndex, bre_to_regex,
+                                              get_search_index,
+                                              required_literals,
+                                              update_indexed_file)
+
+
+def write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def test_bre_translation_and_literals():
+    assert bre_to_regex("foo(bar)") == "foo\\(bar\\)"
+    assert bre_to_regex("a\\|b") == "a|b"
+    assert required_literals(bre_to_regex("def search(")) == ["def search("]
+    assert required_literals("get_.*_index") == ["get_", "_index"]
+    assert required_literals("foo|bar") == []
+
+
+def test_search_counts_lines_and_skips_ignored(tmp_path):
+    root = tmp_path.as_posix()
+    write(f"{root}/a.py", "def search(term):\n    return search(term)\n")
+    write(f"{root}/pkg/b.py", "search = 1\nother = 2\n")
+    write(f"{root}/.hidden/c.py", "search\n")
+    write(f"{root}/build/d.py", "search\n")
+    write(f"{root}/pkg/e.log", "search\n")
+    write(f"{root}/.gitignore", "build/\n*.log\n")
+    with open(f"{root}/bin.dat", "wb") as f:
+        f.write(b"search\0")
+
+    index = SearchIndex(root)
+    assert index.search("search") == {f"{root}/a.py": 2, f"{root}/pkg/b.py": 1}
+    assert index.search("search(", f"{root}/pkg") == {}
+    assert index.search("^other") == {f"{root}/pkg/b.py": 1}
+
+
+def test_search_sees_changes(tmp_path):
+    root = tmp_path.as_posix()
+    write(f"{root}/a.py", "alpha\n")
+    index = SearchIndex(root, refresh_interval=0)
+    assert index.search("beta") == {}
+
+    time.sleep(0.01)
+    write(f"{root}/a.py", "beta\nbeta\n")
+    write(f"{root}/b.py", "beta\n")
+    assert index.search("beta") == {f"{root}/a.py": 2, f"{root}/b.py": 1}
+    assert index.search("alpha") == {}
+
+    os.remove(f"{root}/b.py")
+    assert index.search("beta") == {f"{root}/a.py": 2}
+
+
+def test_writes_update_the_index_between_throttled_refreshes(tmp_path):
+    root = tmp_path.as_posix()
+    write(f"{root}/a.py", "alpha\n")
+    write(f"{root}/.gitignore", "build/\n")
+    index = get_search_index(root)
+    index.refresh_interval = 60
+    assert index.search("alpha") == {f"{root}/a.py": 1}
+
+    # Inside the interval the tree is not walked again
+    write(f"{root}/b.py", "alpha\n")
+    assert index.search("alpha") == {f"{root}/a.py": 1}
+
+    write(f"{root}/a.py", "gamma\n")
+    update_indexed_file(f"{root}/a.py")
+    write(f"{root}/build/c.py", "gamma\n")
+    update_indexed_file(f"{root}/build/c.py")
+    write(f"{root}/.hidden.py", "gamma\n")
+    update_indexed_file(f"{root}/.hidden.py")
+    assert index.search("gamma") == {f"{root}/a.py": 1}
+
+    index.refresh(force=True)
+    assert index.search("alpha") == {f"{root}/b.py": 1}
@@ -95,3 +95,29 @@ def test_session_CRUD():
     assert status == "running"
 
     print("test ended")
+
+
+def test_event_queries_reject_invalid_values():
+    name = "test_event_queries"
+    response = client.post(
+        f"/sessions/{name}?path=.",
+        json={"model": "claude-opus"},
+    )
+    assert response.status_code == 200
+
+    for query in ("offset=-1", "limit=-1", "offset=a"):
+        response = client.get(f"/sessions/{name}/events?{query}")
+        assert response.status_code == 422
+    assert client.get(f"/sessions/{name}/events?offset=0&limit=1").status_code == 200
+
+    for query in ("since=0", "since=-3"):
+        response = client.get(f"/sessions/{name}/events/stream?{query}")
+        assert response.status_code == 422
+    for last_event_id in ("junk", "-1", "1.5"):
+        response = client.get(
+            f"/sessions/{name}/events/stream", headers={"Last-Event-ID": last_event_id}
+        )
+        assert response.status_code == 400
+
+    response = client.delete(f"/sessions/{name}")
+    assert response.status_code == 200
@@ -0,0 +1,41 @@
+import random
+
+from theseus_agent.utils.udiff import (levenshtein_distance, match_fence,
+                                       match_fence_all,
+                                       match_stripped_lines_context,
+                                       within_distance)
+
+
+def test_within_distance_agrees_with_levenshtein():
+    rng = random.Random(0)
+    for _ in range(2000):
+        a = "".join(rng.choice("abc") for _ in range(rng.randrange(7)))
+        b = "".join(rng.choice("abc") for _ in range(rng.randrange(7)))
+        k = rng.randrange(4)
+        assert within_distance(a, b, k) == (levenshtein_distance(a, b) <= k)
+
+
+def test_match_fence_all_finds_every_fuzzy_window():
+    rng = random.Random(0)
+    for _ in range(300):
+        lines = [
+            (i * 2, "".join(rng.choice("ab") for _ in range(rng.randrange(4))))
+            for i in range(rng.randrange(30))
+        ]
+        fence = ["".join(rng.choice("ab") for _ in range(rng.randrange(4))) for _ in range(3)]
+
+        expected = []
+        start = 0
+        while True:
+            begin, end, start = match_fence(lines, fence, start)
+            if start is None:
+                break
+            expected.append((begin, end, start))
+            start += 1
+        assert match_fence_all(lines, fence) == expected
+
+
+def test_match_stripped_lines_context_tolerates_typos():
+    file_lines = list(enumerate(["def f(x):", "    y = x + 1", "    z = y * 2", "    return z", ""]))
+    old_lines = ["def f(x):", "    y = x + 1", "    z = y * 3", "    return z"]
+    assert match_stripped_lines_context(file_lines, old_lines) == (0, 3, 1, 2)
@@ -8,28 +8,26 @@ def setup_code_index(ctx, **kwargs):
     if ctx["state"]["code_index"]:
         return ctx["state"]["code_index"]
     else:
-        if "cache_path" in kwargs and os.path.exists(kwargs["cache_path"]):
-            return CodeIndex.load_from_json(kwargs["cache_path"])
+        codebase_path = None
+        if "codebase_path" in kwargs:
+            codebase_path = kwargs["codebase_path"]
         else:
-            codebase_path = None
-            if "codebase_path" in kwargs:
-                codebase_path = kwargs["codebase_path"]
-            else:
-                codebase_path = ctx["environment"].path
-            if codebase_path is None:
-                raise ValueError("Codebase path is required")
+            codebase_path = ctx["environment"].path
+        if codebase_path is None:
+            raise ValueError("Codebase path is required")
 
-            code_index = CodeIndex(codebase_path)
-            code_index.initialize()
-            if "cache_path" in kwargs:
-                code_index.save_as_json(kwargs["cache_path"])
-            return code_index
+        # cache_path holds one shard per file; a single-file cache from before is left alone
+        cache_dir = kwargs.get("cache_path")
+        if cache_dir and os.path.isfile(cache_dir):
+            cache_dir = cache_dir + ".d"
+
+        code_index = CodeIndex(codebase_path, cache_dir=cache_dir)
+        code_index.refresh()
+        return code_index
 
 
 def cleanup_code_index(ctx, code_index, **kwargs):
-    if "cache_path" in kwargs:
-        if not os.path.exists(kwargs["cache_path"]):
-            code_index.save_as_json(kwargs["cache_path"])
+    code_index.save_manifest()
 
 
 class FindFunctionTool(Tool):
@@ -99,7 +97,11 @@ EXAMPLES
         """
         find_function [function_name] - Find the location of a function in the codebase.
         """
-        return self.code_index.function_table.get_function_with_location(function_name)
+        results = self.code_index.find_function(function_name)
+        suggestions = [] if results else self.code_index.similar_names("function", function_name)
+        if suggestions:
+            return f"No function named {function_name}. Similar names: {', '.join(suggestions)}"
+        return results
 
 
 class FindClassTool(Tool):
@@ -158,4 +160,8 @@ EXAMPLES
         """
         find_class [class_name] - Find the location of a class in the codebase.
         """
-        return self.code_index.class_table.get_class_with_location(class_name)
+        results = self.code_index.find_class(class_name)
+        suggestions = [] if results else self.code_index.similar_names("class", class_name)
+        if suggestions:
+            return f"No class named {class_name}. Similar names: {', '.join(suggestions)}"
+        return results
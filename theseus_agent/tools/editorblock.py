@@ -1,4 +1,6 @@
+import itertools
 import re
+from collections import Counter
 from difflib import SequenceMatcher
 
 from theseus_agent.tool import Tool, ToolContext
@@ -6,6 +8,184 @@ from theseus_agent.tools.utils import cwd_normalize_path, make_abs_path, read_fi
 
 # from .editblock_prompts import EditBlockPrompts
 
+SIMILARITY_THRESH = 0.8
+
+# Length from which SequenceMatcher junks characters that are common in the part
+AUTOJUNK_MIN_LEN = 200
+
+
+def _chunk_windows(whole_lines, part_lines):
+    """Window lengths searched: the part length plus or minus 10%."""
+    scale = 0.1
+    min_len = max(3, int(len(part_lines) * (1 - scale)))
+    max_len = min(len(whole_lines), int(len(part_lines) * (1 + scale)))
+    return min_len, max_len
+
+
+def _sliding_quick_ratios(whole_lines, part, length, line_counts):
+    """
+    Yield (start, quick_ratio) for every window of length lines, equal to
+    SequenceMatcher(None, chunk, part).quick_ratio() but updated line by line
+    instead of recounting every chunk.
+    """
+    part_counts = Counter(part)
+    window = Counter()
+    matches = 0
+    chunk_len = 0
+
+    def update(counts, sign):
+        nonlocal matches
+        for char, count in counts.items():
+            before = window[char]
+            window[char] = before + sign * count
+            available = part_counts[char]
+            matches += min(before + sign * count, available) - min(before, available)
+
+    # Windows are joined with newlines, which never occur inside a line
+    newline_matches = min(length - 1, part_counts["\n"])
+    for i, line in enumerate(whole_lines):
+        update(line_counts[i], 1)
+        chunk_len += len(line)
+        if i >= length:
+            update(line_counts[i - length], -1)
+            chunk_len -= len(whole_lines[i - length])
+        if i >= length - 1:
+            total = chunk_len + length - 1 + len(part)
+            yield i - length + 1, 2.0 * (matches + newline_matches) / total if total else 1.0
+
+
+def _seeded_chars(text, part):
+    """
+    Mark the characters of text SequenceMatcher can match against part.
+
+    For a part of AUTOJUNK_MIN_LEN characters or more SequenceMatcher drops
+    the characters that occur in more than 1% of it. Every matching block it
+    then finds starts from a match of a remaining character and is extended
+    through equal characters, except a block at the very start of both
+    strings. Such a block lies in a run of equal characters, along one
+    diagonal of text against part, that goes through a match of a remaining
+    character. The returned bytearray is 1 on every character of text
+    covered by one of those runs.
+    """
+    limit = len(part) // 100 + 1
+    occurrences = {}
+    for j, char in enumerate(part):
+        occurrences.setdefault(char, []).append(j)
+    seeds = {char: js for char, js in occurrences.items() if len(js) <= limit}
+
+    covered = bytearray(len(text))
+    # End of the run already marked on each diagonal, so every run is walked once
+    run_ends = {}
+    for p, char in enumerate(text):
+        for j in seeds.get(char, ()):
+            if run_ends.get(p - j, -1) > p:
+                continue
+            low, low_j = p, j
+            while low > 0 and low_j > 0 and text[low - 1] == part[low_j - 1]:
+                low -= 1
+                low_j -= 1
+            high, high_j = p + 1, j + 1
+            while high < len(text) and high_j < len(part) and text[high] == part[high_j]:
+                high += 1
+                high_j += 1
+            run_ends[p - j] = high
+            covered[low:high] = b"\1" * (high - low)
+    return covered
+
+
+def _ratio_bounds(whole_lines, part, min_len, max_len, similarity_thresh):
+    """
+    (bound, length, start) for every window whose SequenceMatcher ratio
+    against part can reach similarity_thresh, bound being an upper bound of
+    that ratio. Windows are ruled out by their length alone first, like
+    real_quick_ratio. Long parts are bounded by the characters _seeded_chars
+    covers plus the window's common prefix with the part, short ones by a
+    sliding quick_ratio.
+    """
+    offsets = [0]
+    for line in whole_lines:
+        offsets.append(offsets[-1] + len(line) + 1)
+
+    if len(part) >= AUTOJUNK_MIN_LEN:
+        text = "\n".join(whole_lines)
+        covered = list(itertools.accumulate(_seeded_chars(text, part), initial=0))
+
+        def bounds(length):
+            for i in range(len(whole_lines) - length + 1):
+                start, end = offsets[i], offsets[i + length] - 1
+                chunk_len = end - start
+                total = chunk_len + len(part)
+                if 2.0 * min(chunk_len, len(part)) / total < similarity_thresh:
+                    continue
+                common_prefix = 0
+                while (
+                    common_prefix < chunk_len
+                    and common_prefix < len(part)
+                    and text[start + common_prefix] == part[common_prefix]
+                ):
+                    common_prefix += 1
+                matches = min(
+                    covered[end] - covered[start] + common_prefix, chunk_len, len(part)
+                )
+                yield i, 2.0 * matches / total
+
+    else:
+        part_chars = set(part)
+        line_counts = [Counter(char for char in line if char in part_chars) for line in whole_lines]
+
+        def bounds(length):
+            for i, quick_ratio in _sliding_quick_ratios(whole_lines, part, length, line_counts):
+                chunk_len = offsets[i + length] - offsets[i] - 1
+                total = chunk_len + len(part)
+                real_quick_ratio = 2.0 * min(chunk_len, len(part)) / total if total else 1.0
+                yield i, min(quick_ratio, real_quick_ratio)
+
+    for length in range(min_len, max_len + 1):
+        for i, bound in bounds(length):
+            if bound >= similarity_thresh:
+                yield bound, length, i
+
+
+def find_closest_chunk(whole_lines, part, part_lines, similarity_thresh=SIMILARITY_THRESH):
+    """
+    Find the window of whole_lines most similar to part by SequenceMatcher
+    ratio, among windows within 10% of the part's line count. Returns
+    (start, end, similarity), or (-1, -1, similarity) when no window reaches
+    similarity_thresh, where windows ruled out by their bound are not scored
+    so similarity is only as high as the ones that were. Ties go to the
+    shortest, then earliest window.
+
+    Windows are scored in order of an upper bound of their ratio, and the
+    search stops at the first window whose bound is below the best ratio
+    found so far.
+    """
+    min_len, max_len = _chunk_windows(whole_lines, part_lines)
+    candidates = sorted(
+        (-bound, length, i)
+        for bound, length, i in _ratio_bounds(
+            whole_lines, part, min_len, max_len, similarity_thresh
+        )
+    )
+
+    matcher = SequenceMatcher(None)
+    matcher.set_seq2(part)
+    max_similarity = 0
+    best = None
+    for negative_bound, length, i in candidates:
+        if -negative_bound < max_similarity:
+            break
+        matcher.set_seq1("\n".join(whole_lines[i : i + length]))
+        similarity = matcher.ratio()
+        if similarity > max_similarity or (
+            similarity == max_similarity and best is not None and (length, i) < best
+        ):
+            max_similarity = similarity
+            best = (length, i)
+
+    if best is None or max_similarity < similarity_thresh:
+        return -1, -1, max_similarity
+    length, start = best
+    return start, start + length, max_similarity
 
 
 class EditBlockTool(Tool):
@@ -372,33 +552,11 @@ mathweb/flask/app.py
     def replace_closest_edit_distance(
         self, whole_lines, part, part_lines, replace_lines
     ):
-        similarity_thresh = 0.8
-        max_similarity = 0
-        most_similar_chunk_start = -1
-        most_similar_chunk_end = -1
-
-        scale = 0.1
-        min_len = max(3, int(len(part_lines) * (1 - scale)))
-        max_len = min(len(whole_lines), int(len(part_lines) * (1 + scale)))
-
-        for length in range(min_len, max_len + 1):
-            for i in range(len(whole_lines) - length + 1):
-                chunk = "\n".join(whole_lines[i : i + length])
-                similarity = SequenceMatcher(None, chunk, part).ratio()
-
-                if similarity > max_similarity:
-                    max_similarity = similarity
-                    most_similar_chunk_start = i
-                    most_similar_chunk_end = i + length
-
-        if max_similarity < similarity_thresh:
+        start, end, _ = find_closest_chunk(whole_lines, part, part_lines)
+        if start < 0:
             return "\n".join(whole_lines)
 
-        return "\n".join(
-            whole_lines[:most_similar_chunk_start]
-            + replace_lines
-            + whole_lines[most_similar_chunk_end:]
-        )
+        return "\n".join(whole_lines[:start] + replace_lines + whole_lines[end:])
 
     def _format_results(self, results):
         output = []
@@ -16,10 +16,22 @@ def load_file_to_editor(ctx, file_path):
 def refresh_editor(ctx):
     if ctx["state"]["editor"] is None:
         raise ValueError("Editor is not set")
+    if ctx.get("session") is not None:
+        ctx["session"].refresh_editor_files()
+        return
     for path in list(ctx["state"]["editor"]["files"].keys()):
         load_file_to_editor(ctx, path)
 
 
+def refresh_changed_files(ctx):
+    """
+    Reload open files that changed on disk since the last step, so scrolling
+    works on the current content. Only the session knows what changed.
+    """
+    if ctx.get("session") is not None:
+        ctx["session"].refresh_editor_files()
+
+
 PAGE_SIZE = 200
 
 
@@ -370,20 +382,7 @@ class CreateFileTool(Tool):
 
             # Creating the file with initial content
 
-            create_command = (
-                f"mkdir -p $(dirname '{abs_path}') && cat << 'DELIM' > '{abs_path}' \n"
-                + content
-                + "\nDELIM"
-            )
-            ctx["environment"].execute(create_command)
-
-            # copy_file_to_container(self.container_obj, contents=content, container_path=file_path)
-
-            exists = file_exists(ctx, abs_path)
-
-            # Verify file creation
-            if not exists:
-                raise Exception(f"Command failed to create file: {file_path}")
+            ctx["environment"].write_file(abs_path, content)
 
             ctx["state"]["editor"]["files"][abs_path] = {}
             ctx["state"]["editor"]["files"][abs_path]["lines"] = content
@@ -567,6 +566,7 @@ class ScrollDownTool(Tool):
         if abs_path not in ctx["state"]["editor"]["files"]:
             raise Exception(f"Could not scroll in file, file is not open: {abs_path}")
 
+        refresh_changed_files(ctx)
         lines = ctx["state"]["editor"]["files"][abs_path]["lines"].splitlines()
 
         last_page_idx = len(lines) // ctx["state"]["editor"]["PAGE_SIZE"]
@@ -661,6 +661,7 @@ SCROLL_TO_LINE(1)         April 2024         SCROLL_TO_LINE(1)
         if abs_path not in ctx["state"]["editor"]["files"]:
             raise Exception(f"Could not scroll in file, file is not open: {abs_path}")
 
+        refresh_changed_files(ctx)
         lines = ctx["state"]["editor"]["files"][abs_path]["lines"].splitlines()
         total_lines = len(lines)
         line_number = int(line_number)
@@ -1,11 +1,12 @@
 import os
 
 from theseus_agent.tool import Tool, ToolContext
-from theseus_agent.tools.utils import (check_lint, check_lint_entry_in_list,
-                                     make_abs_path, read_file, write_file)
-from theseus_agent.udiff import (Hallucination, apply_file_context_diffs,
-                               extract_all_diffs, log_failed_diff,
-                               log_successful_diff)
+from theseus_agent.tools.lint_service import LintService
+from theseus_agent.tools.utils import make_abs_path, read_file, write_file
+from theseus_agent.utils.udiff import (Hallucination,
+                                       apply_file_context_diffs,
+                                       extract_all_diffs, log_failed_diff,
+                                       log_successful_diff)
 
 # from theseus_agent.vgit import commit_files, simple_stash_and_commit_changes, stash_and_commit_changes
 
@@ -113,9 +114,8 @@ def real_write_diff(ctx, diff):
             if target_path.endswith(".py"):
                 try:
                     compile(result[1], "<string>", "exec")
-                    before_results = check_lint(
-                        ctx, read_file(ctx, target_path), target_path
-                    )
+                    before_content = read_file(ctx, target_path)
+                    LintService.get().lint(before_content)
                 except Exception as e:
                     return "Error applying diff: \n" + repr(e)
 
@@ -123,13 +123,7 @@ def real_write_diff(ctx, diff):
             file_paths.append(target_path)
 
             if target_path.endswith(".py"):
-                after_results = check_lint(ctx, result[1], target_path)
-
-                diff_results = [
-                    x
-                    for x in after_results
-                    if not check_lint_entry_in_list(x, before_results)
-                ]
+                diff_results = LintService.get().new_errors(before_content, result[1])
 
         paths = ", ".join(file_paths)
 
@@ -1,11 +1,41 @@
 import json
 import os
 
+from theseus_agent.environments.shell_environment import LocalShellEnvironment
 from theseus_agent.tool import Tool, ToolContext
+from theseus_agent.tools.search_index import get_search_index
 from theseus_agent.tools.utils import (_list_files_recursive, cwd_normalize_path,
                                      get_cwd, make_abs_path)
 
 
+def _is_excluded(ctx: ToolContext, root: str, path: str) -> bool:
+    config = ctx.get("config")
+    if not config or not config.ignore_files or not config.exclude_files:
+        return False
+    excluded = {os.path.normpath(os.path.join(root, f)) for f in config.exclude_files}
+    while path.startswith(root) and path != root:
+        if path in excluded:
+            return True
+        path = os.path.dirname(path)
+    return False
+
+
+def _search_local(ctx: ToolContext, search_term: str, abs_path: str) -> str:
+    """
+    Answer search_dir from the shared search index of the local environment,
+    formatted like the output of uniq -c.
+    """
+    root = os.path.abspath(ctx["environment"].path)
+    config = ctx.get("config")
+    ignore_files = (".gitignore", (config and config.theseus_ignore_file) or ".theseusignore")
+    counts = get_search_index(root, ignore_files).search(search_term, abs_path)
+    return "\n".join(
+        f"{count:>7} {path}"
+        for path, count in sorted(counts.items())
+        if not _is_excluded(ctx, root, path)
+    )
+
+
 class SearchDirTool(Tool):
     @property
     def name(self):
@@ -65,15 +95,23 @@ class SearchDirTool(Tool):
         signature: search_dir [SEARCH_TERM] [SEARCH_DIR]
         example: `search_dir "hello" ./docs`
         """
-        if search_term.startswith("--"):
-            search_term = '"' + search_term + '"'
-
         abs_path = cwd_normalize_path(ctx, dir)
 
-        command = f"find {abs_path} -type f ! -path '*/.*' -exec grep -nIH '{search_term}' {{}} + | cut -d: -f1 | sort | uniq -c"
-        result = ctx["environment"].execute(command)
-
-        matches = result[0].strip()
+        environment = ctx["environment"]
+        if (
+            isinstance(environment, LocalShellEnvironment)
+            and os.path.isdir(abs_path)
+            and (abs_path + os.sep).startswith(os.path.abspath(environment.path) + os.sep)
+        ):
+            matches = _search_local(ctx, search_term, abs_path)
+        else:
+            if search_term.startswith("--"):
+                search_term = '"' + search_term + '"'
+
+            command = f"find {abs_path} -type f ! -path '*/.*' -exec grep -nIH '{search_term}' {{}} + | cut -d: -f1 | sort | uniq -c"
+            result = environment.execute(command)
+
+            matches = result[0].strip()
         if not matches:
             return f'No matches found for "{search_term}" in {abs_path}'
         # print(matches)
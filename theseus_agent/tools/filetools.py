@@ -180,18 +180,7 @@ class CreateFileTool(Tool):
                     f"Could not create file, file already exists: {abs_path}"
                 )
 
-            create_command = (
-                f"mkdir -p $(dirname '{abs_path}') && cat << 'DELIM' > '{abs_path}' \n"
-                + content
-                + "\nDELIM"
-            )
-            ctx["environment"].execute(create_command)
-
-            exists = file_exists(ctx, abs_path)
-            if not exists:
-                raise Exception(
-                    f"Could not create file, file does not exist: {abs_path}"
-                )
+            ctx["environment"].write_file(abs_path, content)
 
             return f"Successfully created file {abs_path}"
         except Exception as e:
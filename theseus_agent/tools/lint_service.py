@@ -0,0 +1,171 @@
+import atexit
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# Only undefined names and missing members are reported after an edit
+LINT_ARGS = ["--disable=all", "--enable=E0602,E1101"]
+
+# Seconds to wait for the worker before giving up on it and linting in-process
+LINT_TIMEOUT = 60
+
+# Lint results kept per content hash
+MAX_CACHED_RESULTS = 256
+
+
+def _lint_with_pylint(code_string: str) -> List[dict]:
+    """Lint with a fresh pylint run, as used when the worker is not available."""
+    from pylint.lint import Run
+    from pylint.reporters.json_reporter import JSONReporter
+
+    pylint_output = io.StringIO()
+    with tempfile.NamedTemporaryFile(mode="w+", suffix=".py") as f:
+        f.write(code_string)
+        f.flush()
+        Run(args=LINT_ARGS + [f.name], reporter=JSONReporter(pylint_output), exit=False)
+    return json.loads(pylint_output.getvalue() or "[]")
+
+
+def _lint_worker(conn):
+    """
+    Runs in the worker process. Pylint and astroid are imported once and one
+    linter is reused, so the modules a file imports are only inferred on the
+    first lint that needs them.
+    """
+    import astroid
+    from pylint.lint import Run
+    from pylint.reporters.json_reporter import JSONReporter
+
+    directory = tempfile.mkdtemp(prefix="theseus_lint_")
+    warm_path = os.path.join(directory, "warm.py")
+    with open(warm_path, "w") as f:
+        f.write("")
+    linter = Run(
+        args=LINT_ARGS + [warm_path], reporter=JSONReporter(io.StringIO()), exit=False
+    ).linter
+
+    try:
+        while True:
+            try:
+                digest, code_string = conn.recv()
+            except EOFError:
+                return
+
+            # One module per content so astroid never serves a stale tree
+            module = f"lint_{digest[:16]}"
+            path = os.path.join(directory, module + ".py")
+            try:
+                with open(path, "w") as f:
+                    f.write(code_string)
+                output = io.StringIO()
+                linter.set_reporter(JSONReporter(output))
+                linter.check([path])
+                linter.generate_reports()
+                conn.send((True, json.loads(output.getvalue() or "[]")))
+            except Exception as e:
+                conn.send((False, repr(e)))
+            finally:
+                astroid.MANAGER.astroid_cache.pop(module, None)
+                if os.path.exists(path):
+                    os.remove(path)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class LintService:
+    """
+    Lints code in a long-lived worker process and caches the results by content
+    hash. An edit lints the file before and after the change, and the content
+    before is usually what the previous edit wrote, so it is served from the
+    cache.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_cached: int = MAX_CACHED_RESULTS, timeout: float = LINT_TIMEOUT):
+        self.lock = threading.Lock()
+        self.max_cached = max_cached
+        self.timeout = timeout
+        self.results: "OrderedDict[str, List[dict]]" = OrderedDict()
+        self.process: Optional[multiprocessing.Process] = None
+        self.conn = None
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def get(cls) -> "LintService":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+                atexit.register(cls._instance.close)
+            return cls._instance
+
+    def _start(self):
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_lint_worker, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def _stop(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process.join(timeout=1)
+            self.process = None
+
+    def _lint_in_worker(self, digest: str, code_string: str) -> List[dict]:
+        if self.process is None or not self.process.is_alive():
+            self._stop()
+            self._start()
+        try:
+            self.conn.send((digest, code_string))
+            if not self.conn.poll(self.timeout):
+                raise TimeoutError(f"lint worker did not answer in {self.timeout}s")
+            ok, result = self.conn.recv()
+        except (OSError, EOFError, TimeoutError) as e:
+            print(f"Lint worker failed, linting in-process: {e!r}")
+            self._stop()
+            return _lint_with_pylint(code_string)
+        if not ok:
+            raise Exception(result)
+        return result
+
+    def lint(self, code_string: str) -> List[dict]:
+        digest = hashlib.sha256(code_string.encode()).hexdigest()
+        with self.lock:
+            if digest in self.results:
+                self.results.move_to_end(digest)
+                self.hits += 1
+                return self.results[digest]
+            self.misses += 1
+            results = self._lint_in_worker(digest, code_string)
+            self.results[digest] = results
+            if len(self.results) > self.max_cached:
+                self.results.popitem(last=False)
+            return results
+
+    def new_errors(self, before: str, after: str) -> List[dict]:
+        """Lint entries for after that were not already reported for before."""
+        from theseus_agent.tools.utils import check_lint_entry_in_list
+
+        before_results = self.lint(before)
+        return [x for x in self.lint(after) if not check_lint_entry_in_list(x, before_results)]
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "cached": len(self.results)}
+
+    def close(self):
+        with self.lock:
+            self._stop()
@@ -5,11 +5,30 @@ import os
 
 import networkx as nx
 
-from theseus_agent.retrieval.codebase_graph import add_edge, add_node
+from theseus_agent.tools.retrieval.codebase_graph import add_edge, add_node
 
 
-def extract_info_from_ast(graph, ast_tree, file_path):
+def line_offsets(source):
+    """Byte offset of the start of every line, matching ast's UTF-8 column offsets."""
+    offsets = [0]
+    for line in source.encode("utf-8", errors="replace").splitlines(keepends=True):
+        offsets.append(offsets[-1] + len(line))
+    return offsets
+
+
+def node_span(node, offsets):
+    """Byte offsets of a definition in its file, decorators included."""
+    # Decorators are indented like the definition, and their col_offset is past the "@"
+    first_line = min(n.lineno for n in [node] + node.decorator_list)
+    return (
+        offsets[first_line - 1] + node.col_offset,
+        offsets[node.end_lineno - 1] + node.end_col_offset,
+    )
+
+
+def extract_info_from_ast(graph, ast_tree, file_path, source=None):
     # Add file node to the graph
+    offsets = line_offsets(source) if source is not None else None
 
     def nestedTestFunction():
         pass
@@ -54,6 +73,10 @@ def extract_info_from_ast(graph, ast_tree, file_path):
                     "exported": [],
                 },
             }
+            if offsets:
+                start, end = node_span(node, offsets)
+                class_attrs["location"]["start_offset"] = start
+                class_attrs["location"]["end_offset"] = end
 
             # Add the class node to the graph
             add_node(graph, class_name + ":" + file_path, class_attrs)
@@ -87,6 +110,10 @@ def extract_info_from_ast(graph, ast_tree, file_path):
                     "exported": [],
                 },
             }
+            if offsets:
+                start, end = node_span(node, offsets)
+                function_attrs["location"]["start_offset"] = start
+                function_attrs["location"]["end_offset"] = end
 
             # Add the function node to the graph
             add_node(graph, function_name + ":" + file_path, function_attrs)
@@ -1,166 +1,503 @@
+import ast
+import bisect
+import difflib
+import hashlib
 import json
 import os
-from functools import reduce
+import tempfile
 
-from theseus_agent.retrieval.ast_extractor import extract_info_from_ast
-from theseus_agent.retrieval.ast_parser import parse_python_file
-from theseus_agent.retrieval.codebase_graph import CodeGraph
-from theseus_agent.retrieval.file_discovery import discover_python_files
+import networkx as nx
 
+from theseus_agent.tools.retrieval.ast_extractor import extract_info_from_ast
+from theseus_agent.tools.retrieval.codebase_graph import CodeGraph
+from theseus_agent.tools.retrieval.file_discovery import discover_python_files
+
+IGNORE_DIRECTORIES = [".git", "docs", "__pycache__"]
+
+# Bump when the shard layout or extracted attributes change, so old caches are rebuilt
+INDEX_VERSION = 2
+
+
+def names_with_prefix(sorted_names, prefix, limit=20):
+    """Names in the sorted list of lowercased names that start with prefix."""
+    prefix = prefix.lower()
+    start = bisect.bisect_left(sorted_names, prefix)
+    names = []
+    for lower in sorted_names[start:]:
+        if not lower.startswith(prefix) or len(names) == limit:
+            break
+        names.append(lower)
+    return names
+
+
+def similar_names(sorted_names, name, limit=5):
+    """Names with name as a prefix first, then the closest by difflib ratio."""
+    names = names_with_prefix(sorted_names, name, limit)
+    if len(names) < limit:
+        names += [
+            match
+            for match in difflib.get_close_matches(name.lower(), sorted_names, limit, 0.75)
+            if match not in names
+        ]
+    return names[:limit]
+
+
+def insort_name(sorted_names, lower):
+    index = bisect.bisect_left(sorted_names, lower)
+    if index == len(sorted_names) or sorted_names[index] != lower:
+        sorted_names.insert(index, lower)
+
+
+def remove_name(sorted_names, lower):
+    index = bisect.bisect_left(sorted_names, lower)
+    if index < len(sorted_names) and sorted_names[index] == lower:
+        del sorted_names[index]
+
+
+class SymbolTable:
+    """
+    Entries per symbol name, with an index from lowercased name to the names
+    that share it so case-insensitive lookups do not scan every symbol, and
+    a sorted list of the lowercased names for prefix and fuzzy lookups.
+
+    Entries hold a location whose start_offset/end_offset are byte offsets of
+    the definition in its file; the code is read from the file on lookup
+    rather than kept in memory. Entries that carry their own "code", as in
+    older exports, use it as is.
+    """
 
-class FunctionTable:
     def __init__(self, temp_dir=None):
-        self.function_table = {}
+        self.entries = {}
         self.temp_dir = temp_dir if temp_dir is not None else ""
+        self.by_lower = {}
+        self.sorted_names = []
 
-    def add_function(self, function_name, location):
-        if function_name not in self.function_table:
-            self.function_table[function_name] = [location]
+    def _index_name(self, name):
+        lower = name.lower()
+        names = self.by_lower.get(lower)
+        if names is None:
+            self.by_lower[lower] = [name]
+            insort_name(self.sorted_names, lower)
+        elif name not in names:
+            names.append(name)
+
+    def _unindex_name(self, name):
+        lower = name.lower()
+        names = self.by_lower.get(lower, [])
+        if name in names:
+            names.remove(name)
+        if not names and lower in self.by_lower:
+            del self.by_lower[lower]
+            remove_name(self.sorted_names, lower)
+
+    def load_table(self, entries):
+        self.entries = entries
+        self.by_lower = {}
+        self.sorted_names = []
+        for name in entries:
+            self._index_name(name)
+
+    def add(self, name, entry):
+        if name not in self.entries:
+            self.entries[name] = [entry]
+            self._index_name(name)
         else:
-            # print(f"Function {function_name} already exists in function table")
-            self.function_table[function_name].append(location)
+            self.entries[name].append(entry)
 
-    def get_function(self, function_name, default):
-        result = self.function_table.get(function_name, default)
+    def get(self, name, default):
+        result = self.entries.get(name, default)
         if len(result) == 1:
             return result[0]
         else:
             return result
 
-    def get_function_with_location(self, function_name):
-        # functions =  self.function_table.get(function_name, {})
-        functions = reduce(
-            lambda a, b: a + b,
-            [
-                self.function_table.get(k, {})
-                for k in list(self.function_table.keys())
-                if k.lower() == function_name.lower()
-            ],
-            [],
-        )
-        if len(functions) == 0:
+    def lookup(self, name):
+        """Entries for every name equal to name ignoring case."""
+        return [
+            entry
+            for original in self.by_lower.get(name.lower(), [])
+            for entry in self.entries.get(original, [])
+        ]
+
+    def names_with_prefix(self, prefix, limit=20):
+        return [self.by_lower[lower][0] for lower in names_with_prefix(self.sorted_names, prefix, limit)]
+
+    def similar_names(self, name, limit=5):
+        """Closest names to name, for suggestions when there is no exact match."""
+        return [self.by_lower[lower][0] for lower in similar_names(self.sorted_names, name, limit)]
+
+    def read_code(self, entry):
+        if "code" in entry:
+            return entry["code"]
+        location = entry.get("location", {})
+        if location.get("start_offset") is None:
+            return ""
+        file_path = location.get("file_path", "")
+        if not os.path.exists(file_path):
+            file_path = self.temp_dir + file_path
+        try:
+            with open(file_path, "rb") as f:
+                f.seek(location["start_offset"])
+                data = f.read(location["end_offset"] - location["start_offset"])
+        except OSError:
+            return ""
+        return data.decode("utf-8", errors="replace")
+
+    def get_with_location(self, name):
+        entries = self.lookup(name)
+        if len(entries) == 0:
             return {}
 
         results = []
-        for function in functions:
+        for entry in entries:
             result = {}
-            result["location"] = function.get("location", {})
+            result["location"] = dict(entry.get("location", {}))
             if result["location"].get("file_path", "").startswith(self.temp_dir):
                 result["location"]["file_path"] = result["location"]["file_path"][
                     len(self.temp_dir) :
                 ]
-            result["code"] = function.get("code", "")
-            if len(result["code"].split("/n")) > 20:
-                result["code"] = "\n".join(result["code"].split("/n")[:20]) + "\n..."
+            result["code"] = self.read_code(entry)
             results.append(result)
         return results
 
+    def remove_file(self, names, file_path):
+        """Drop the entries for names defined in file_path."""
+        for name in names:
+            remaining = [
+                entry
+                for entry in self.entries.get(name, [])
+                if entry["location"]["file_path"] != file_path
+            ]
+            if remaining:
+                self.entries[name] = remaining
+            elif name in self.entries:
+                del self.entries[name]
+                self._unindex_name(name)
+
     def save_to_file(self, file_path):
         if not os.path.exists(os.path.dirname(file_path)):
             os.makedirs(os.path.dirname(file_path))
         with open(file_path, "w") as f:
-            json.dump(self.function_table, f)
+            json.dump(self.entries, f)
 
     def load_from_file(self, file_path):
         with open(file_path, "r") as f:
-            self.function_table = json.load(f)
+            self.load_table(json.load(f))
 
 
-class ClassTable:
-    def __init__(self, temp_dir=None):
-        self.class_table = {}
-        self.temp_dir = temp_dir if temp_dir is not None else ""
+class FunctionTable(SymbolTable):
+    @property
+    def function_table(self):
+        return self.entries
+
+    def add_function(self, function_name, location):
+        self.add(function_name, location)
+
+    def get_function(self, function_name, default):
+        return self.get(function_name, default)
+
+    def get_function_with_location(self, function_name):
+        results = self.get_with_location(function_name)
+        for result in results:
+            if len(result["code"].split("/n")) > 20:
+                result["code"] = "\n".join(result["code"].split("/n")[:20]) + "\n..."
+        return results
+
+
+class ClassTable(SymbolTable):
+    @property
+    def class_table(self):
+        return self.entries
 
     def add_class(self, class_name, location):
-        if class_name not in self.class_table:
-            self.class_table[class_name] = [location]
-        else:
-            self.class_table[class_name].append(location)
+        self.add(class_name, location)
 
     def get_class(self, class_name, default):
-        result = self.class_table.get(class_name, default)
-        if len(result) == 1:
-            return result[0]
-        else:
-            return result
+        return self.get(class_name, default)
 
     def get_class_with_location(self, class_name: str):
-        # classes = self.class_table.get(class_name, {})
-        classes = reduce(
-            lambda a, b: a + b,
-            [
-                self.class_table.get(k, {})
-                for k in list(self.class_table.keys())
-                if k.lower() == class_name.lower()
-            ],
-            [],
-        )
+        return self.get_with_location(class_name)
 
-        if len(classes) == 0:
-            return {}
 
-        results = []
-        for _class in classes:
-            result = {}
-            result["location"] = _class["location"]
-            if result["location"].get("file_path", "").startswith(self.temp_dir):
-                result["location"]["file_path"] = result["location"]["file_path"][
-                    len(self.temp_dir) :
-                ]
-            result["code"] = _class["code"]
-            results.append(result)
-        return results
+def compact_entry(attrs):
+    """Table entry for a function or class node: its type and location, without the code."""
+    return {"type": attrs["type"], "location": attrs["location"]}
 
-    def save_to_file(self, file_path):
-        if not os.path.exists(os.path.dirname(file_path)):
-            os.makedirs(os.path.dirname(file_path))
-        with open(file_path, "w") as f:
-            json.dump(self.class_table, f)
 
-    def load_from_file(self, file_path):
-        with open(file_path, "r") as f:
-            self.class_table = json.load(f)
+def _write_json(path, data):
+    """Write JSON through a temporary file so a crash never leaves half a shard."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f, default=list)
+    os.replace(temp_path, path)
+
+
+def extract_file(file_path, source, relative_path):
+    """
+    Nodes and edges one file contributes to the code graph, with function and
+    class locations relative to the codebase like the tables hold them.
+    """
+    try:
+        ast_tree = ast.parse(source)
+    except SyntaxError:
+        print(f"SyntaxError: {file_path}")
+        return [], []
+    except Exception as e:
+        print(f"Error: {e}")
+        return [], []
+    graph = CodeGraph().graph
+    extract_info_from_ast(graph, ast_tree, file_path, source)
+    nodes = list(graph.nodes(data=True))
+    for _, attrs in nodes:
+        if attrs.get("type", "") in ("function", "class"):
+            attrs["location"]["file_path"] = relative_path
+    return nodes, list(graph.edges(data=True))
 
 
 class CodeIndex:
-    def __init__(self, codebase_path):
-        self.code_graph = CodeGraph()
+    """
+    Function and class tables for the Python files under codebase_path, kept
+    per file. A file is re-parsed only when its mtime or size changed and its
+    content hash with it, so refresh() after an edit costs a stat per file
+    plus a parse per changed file.
+
+    With a cache_dir each file's nodes and edges are stored in their own
+    shard next to a manifest of hashes and symbol names. Loading reads only
+    the manifest; a file's shard is read the first time a lookup needs it.
+    """
+
+    def __init__(self, codebase_path, cache_dir=None):
         self.function_table = FunctionTable(codebase_path)
         self.class_table = ClassTable(codebase_path)
         self.codebase_path = codebase_path
+        self.cache_dir = cache_dir
+        # relative path -> {"mtime", "size", "hash", "functions", "classes"}
+        self.files = {}
+        # Files whose entries are in the tables
+        self.loaded = set()
+        # "function"/"class" -> lowercased name -> relative paths defining it
+        self.symbols = {"function": {}, "class": {}}
+        # Sorted keys of symbols, for prefix and fuzzy lookups
+        self.sorted_symbols = {"function": [], "class": []}
+        self._code_graph = None
+        # Set for indexes loaded from a save_as_json export, which are not refreshed
+        self.frozen = False
 
-    def initialize_tables(self):
-        for node in self.code_graph.graph.nodes(data=True):
-            if node[1].get("type", "") == "function":
-                node[1]["location"]["file_path"] = node[1]["location"]["file_path"][
-                    len(self.codebase_path) :
-                ]
-                name, filepath = node[0].split(":")
-                self.function_table.add_function(name, node[1])
-            elif node[1].get("type", "") == "class":
-                node[1]["location"]["file_path"] = node[1]["location"]["file_path"][
-                    len(self.codebase_path) :
-                ]
-                name, filepath = node[0].split(":")
-                self.class_table.add_class(name, node[1])
+        if cache_dir:
+            os.makedirs(os.path.join(cache_dir, "shards"), exist_ok=True)
+            self._load_manifest()
 
-    def initialize(self):
-        ignore_directories = [".git", "docs", "__pycache__"]
+    def relative_path(self, file_path):
+        return file_path[len(self.codebase_path) :]
+
+    def _shard_path(self, relative_path):
+        name = hashlib.sha1(relative_path.encode()).hexdigest()
+        return os.path.join(self.cache_dir, "shards", name + ".json")
 
-        python_files = discover_python_files(self.codebase_path, ignore_directories)
+    def _manifest_path(self):
+        return os.path.join(self.cache_dir, "manifest.json")
 
+    def _load_manifest(self):
+        try:
+            with open(self._manifest_path(), "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return
+        if manifest.get("version") != INDEX_VERSION or manifest.get("codebase_path") != self.codebase_path:
+            return
+        for relative_path, entry in manifest["files"].items():
+            self.files[relative_path] = entry
+            self._add_symbols(relative_path, entry)
+
+    def save_manifest(self):
+        if not self.cache_dir:
+            return
+        _write_json(
+            self._manifest_path(),
+            {"version": INDEX_VERSION, "codebase_path": self.codebase_path, "files": self.files},
+        )
+
+    def _add_symbols(self, relative_path, entry):
+        for kind, names in (("function", entry["functions"]), ("class", entry["classes"])):
+            for name in names:
+                if name.lower() not in self.symbols[kind]:
+                    self.symbols[kind][name.lower()] = set()
+                    insort_name(self.sorted_symbols[kind], name.lower())
+                self.symbols[kind][name.lower()].add(relative_path)
+
+    def _remove(self, relative_path):
+        entry = self.files.pop(relative_path)
+        for kind, names in (("function", entry["functions"]), ("class", entry["classes"])):
+            for name in names:
+                paths = self.symbols[kind].get(name.lower())
+                if paths:
+                    paths.discard(relative_path)
+                    if not paths:
+                        del self.symbols[kind][name.lower()]
+                        remove_name(self.sorted_symbols[kind], name.lower())
+        if relative_path in self.loaded:
+            self.function_table.remove_file(entry["functions"], relative_path)
+            self.class_table.remove_file(entry["classes"], relative_path)
+            self.loaded.discard(relative_path)
+        self._code_graph = None
+
+    def _add_to_tables(self, relative_path, nodes):
+        for node_id, attrs in nodes:
+            if attrs.get("type", "") not in ("function", "class"):
+                continue
+            name = node_id.split(":", 1)[0]
+            if attrs["type"] == "function":
+                self.function_table.add_function(name, compact_entry(attrs))
+            else:
+                self.class_table.add_class(name, compact_entry(attrs))
+        self.loaded.add(relative_path)
+
+    def _index_file(self, file_path, stat, source, digest):
+        relative_path = self.relative_path(file_path)
+        nodes, edges = extract_file(file_path, source, relative_path)
+        entry = {
+            "mtime": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "hash": digest,
+            "functions": sorted({n.split(":", 1)[0] for n, a in nodes if a.get("type") == "function"}),
+            "classes": sorted({n.split(":", 1)[0] for n, a in nodes if a.get("type") == "class"}),
+        }
+        if relative_path in self.files:
+            self._remove(relative_path)
+        self.files[relative_path] = entry
+        self._add_symbols(relative_path, entry)
+        self._code_graph = None
+        if self.cache_dir:
+            _write_json(self._shard_path(relative_path), {"nodes": nodes, "edges": edges})
+        self._add_to_tables(relative_path, nodes)
+
+    def update_file(self, file_path):
+        """
+        Bring one file up to date. Returns whether its entries changed, which
+        is only when its content did.
+        """
+        relative_path = self.relative_path(file_path)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            if relative_path in self.files:
+                self._remove(relative_path)
+                return True
+            return False
+
+        known = self.files.get(relative_path)
+        if known and (known["mtime"], known["size"]) == (stat.st_mtime_ns, stat.st_size):
+            return False
+        try:
+            with open(file_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return False
+        digest = hashlib.sha256(data).hexdigest()
+        if known and known["hash"] == digest:
+            known["mtime"], known["size"] = stat.st_mtime_ns, stat.st_size
+            return False
+        self._index_file(file_path, stat, data.decode("utf-8", errors="replace"), digest)
+        return True
+
+    def refresh(self):
+        """Re-index files that changed since the last refresh and drop deleted ones."""
+        python_files = discover_python_files(self.codebase_path, IGNORE_DIRECTORIES)
+        changed = False
         for python_file in python_files:
-            ast_tree = parse_python_file(python_file)
-            if ast_tree is None:
+            changed = self.update_file(python_file) or changed
+        present = {self.relative_path(python_file) for python_file in python_files}
+        for relative_path in [path for path in self.files if path not in present]:
+            self._remove(relative_path)
+            changed = True
+        if changed:
+            self.save_manifest()
+        return changed
+
+    def _read_shard(self, relative_path):
+        try:
+            with open(self._shard_path(relative_path), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _ensure_loaded(self, relative_paths):
+        for relative_path in relative_paths:
+            if relative_path in self.loaded or relative_path not in self.files:
+                continue
+            shard = self._read_shard(relative_path) if self.cache_dir else None
+            if shard is None:
+                # Shard missing or unreadable, parse the file again
+                self._remove(relative_path)
+                self.update_file(self.codebase_path + relative_path)
                 continue
-            # print(file_path)
+            self._add_to_tables(relative_path, shard["nodes"])
+
+    def load_all(self):
+        self._ensure_loaded(list(self.files))
+
+    def _update_symbol(self, kind, name):
+        """
+        Bring the files defining name up to date and load them, a stat each
+        through the symbol map instead of a walk of the whole tree. Only when
+        no file defines name any more is the tree refreshed, since a walk is
+        the only way to find new files.
+        """
+        changed = False
+        for relative_path in list(self.symbols[kind].get(name.lower(), ())):
+            changed = self.update_file(self.codebase_path + relative_path) or changed
+        if changed:
+            self.save_manifest()
+        if name.lower() not in self.symbols[kind]:
+            self.refresh()
+        self._ensure_loaded(self.symbols[kind].get(name.lower(), ()))
+
+    def find_function(self, function_name):
+        if not self.frozen:
+            self._update_symbol("function", function_name)
+        return self.function_table.get_function_with_location(function_name)
 
-            # Extract information from the AST and build the graph
-            extract_info_from_ast(self.code_graph.graph, ast_tree, python_file)
+    def find_class(self, class_name):
+        if not self.frozen:
+            self._update_symbol("class", class_name)
+        return self.class_table.get_class_with_location(class_name)
+
+    def similar_names(self, kind, name, limit=5):
+        """Lowercased function or class names close to name, from every indexed file."""
+        if self.frozen:
+            table = self.function_table if kind == "function" else self.class_table
+            return similar_names(table.sorted_names, name, limit)
+        return similar_names(self.sorted_symbols[kind], name, limit)
+
+    @property
+    def code_graph(self):
+        """The whole code graph, assembled from the per-file shards on first use."""
+        if self._code_graph is None:
+            code_graph = CodeGraph()
+            for relative_path in sorted(self.files):
+                shard = self._read_shard(relative_path) if self.cache_dir else None
+                if shard is None:
+                    file_path = self.codebase_path + relative_path
+                    with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+                        nodes, edges = extract_file(file_path, f.read(), relative_path)
+                    shard = {"nodes": nodes, "edges": edges}
+                code_graph.graph.add_nodes_from(shard["nodes"])
+                code_graph.graph.add_edges_from(shard["edges"])
+            code_graph.graph.graph["total_nodes"] = len(code_graph.graph.nodes)
+            code_graph.graph.graph["total_edges"] = len(code_graph.graph.edges)
+            code_graph.graph.graph["disconnected_components"] = list(
+                nx.weakly_connected_components(code_graph.graph)
+            )
+            self._code_graph = code_graph
+        return self._code_graph
+
+    def initialize(self):
+        self.refresh()
+        self.load_all()
         print("intialized")
-        self.initialize_tables()
 
     def save_as_json(self, file_path):
+        self.load_all()
         index = {
             "codebase_path": self.codebase_path,
             "function_table": self.function_table.function_table,
@@ -175,12 +512,12 @@ class CodeIndex:
 
     @classmethod
     def load_from_json(cls, file_path):
+        """Load a save_as_json export as a fixed snapshot of the tables."""
         with open(file_path, "r") as f:
             index = json.load(f)
         code_index = cls(index["codebase_path"])
-        code_index.function_table.function_table = index["function_table"]
-        code_index.class_table.class_table = index["class_table"]
-        code_index.code_graph.from_json_dict(index["code_graph"])
+        code_index.frozen = True
+        code_index.function_table.load_table(index["function_table"])
+        code_index.class_table.load_table(index["class_table"])
+        code_index._code_graph = CodeGraph.from_json_dict(index["code_graph"])
         return code_index
-
-        # print(node[0])
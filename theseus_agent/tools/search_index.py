@@ -0,0 +1,329 @@
+import fnmatch
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+# Files larger than this are searched on every query instead of being indexed
+MAX_INDEXED_SIZE = 1024 * 1024
+
+# Bytes sniffed for a NUL to decide a file is binary, like grep -I
+BINARY_SNIFF = 8000
+
+BRE_LITERALS = "(){}|+?"
+
+# Seconds a refresh is trusted for. Writes through a local environment update
+# the index right away, this only bounds how late other changes are seen.
+REFRESH_INTERVAL = 1.0
+
+
+def bre_to_regex(pattern: str) -> str:
+    """
+    Translate a grep basic regular expression to Python syntax. In BRE the
+    characters (){}|+? are literals unless escaped, the reverse of Python.
+    """
+    regex = ""
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if char == "\\" and index + 1 < len(pattern):
+            following = pattern[index + 1]
+            regex += following if following in BRE_LITERALS else char + following
+            index += 2
+            continue
+        regex += "\\" + char if char in BRE_LITERALS else char
+        index += 1
+    return regex
+
+
+def required_literals(regex: str) -> List[str]:
+    """Literal runs every match of regex must contain, used to pick candidate files."""
+    try:
+        parsed = sre_parse.parse(regex)
+    except Exception:
+        return []
+    literals = []
+    current = ""
+    for op, value in parsed:
+        if op == sre_parse.LITERAL:
+            current += chr(value)
+            continue
+        if current:
+            literals.append(current)
+        current = ""
+    if current:
+        literals.append(current)
+    return literals
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class IgnoreRules:
+    """fnmatch patterns from one ignore file, relative to the directory holding it."""
+
+    def __init__(self, base: str, patterns: Iterable[str]):
+        self.base = base
+        self.rules = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith("#") or pattern.startswith("!"):
+                continue
+            dir_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            anchored = "/" in pattern
+            self.rules.append((pattern.lstrip("/"), dir_only, anchored))
+
+    @classmethod
+    def load(cls, directory: str, names: Iterable[str]) -> Optional["IgnoreRules"]:
+        patterns = []
+        for name in names:
+            try:
+                with open(os.path.join(directory, name), "r", encoding="utf-8", errors="replace") as f:
+                    patterns.extend(f.read().splitlines())
+            except OSError:
+                continue
+        return cls(directory, patterns) if patterns else None
+
+    def ignores(self, path: str, is_dir: bool) -> bool:
+        relative = os.path.relpath(path, self.base)
+        name = os.path.basename(path)
+        for pattern, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if fnmatch.fnmatch(relative if anchored else name, pattern):
+                return True
+        return False
+
+
+class SearchIndex:
+    """
+    Trigram index over the text files under root. Files are re-read only when
+    their mtime or size changed since the last refresh. Hidden paths and paths
+    matched by the ignore files are skipped.
+
+    Posting lists hold file ids. A changed or deleted file keeps its old id in
+    the postings until enough ids are dead to make compacting worthwhile.
+
+    A refresh walks the whole tree, so refresh skips the walk when the last
+    one is less than refresh_interval seconds old.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        ignore_files: Iterable[str] = (".gitignore",),
+        refresh_interval: float = REFRESH_INTERVAL,
+    ):
+        self.root = os.path.abspath(root)
+        self.ignore_files = tuple(ignore_files)
+        self.refresh_interval = refresh_interval
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+        self.files: Dict[str, Tuple[Optional[int], int, int]] = {}
+        self.paths: Dict[int, str] = {}
+        self.postings: Dict[str, Set[int]] = {}
+        self.unindexed: Set[int] = set()
+        self.next_id = 0
+        self.dead = 0
+
+    def _walk(self):
+        stack = [(self.root, [])]
+        while stack:
+            directory, rules = stack.pop()
+            local_rules = IgnoreRules.load(directory, self.ignore_files)
+            if local_rules:
+                rules = rules + [local_rules]
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                    if not is_dir and not entry.is_file(follow_symlinks=False):
+                        continue
+                except OSError:
+                    continue
+                if any(rule.ignores(entry.path, is_dir) for rule in rules):
+                    continue
+                if is_dir:
+                    stack.append((entry.path, rules))
+                else:
+                    try:
+                        yield entry.path, entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+
+    def _ignored(self, path: str) -> bool:
+        """Whether _walk skips path, checking only the directories on its way."""
+        parts = os.path.relpath(path, self.root).split(os.sep)
+        if parts[0] == ".." or any(part.startswith(".") for part in parts):
+            return True
+        rules = []
+        directory = self.root
+        for depth, part in enumerate(parts):
+            local_rules = IgnoreRules.load(directory, self.ignore_files)
+            if local_rules:
+                rules.append(local_rules)
+            directory = os.path.join(directory, part)
+            is_dir = depth < len(parts) - 1
+            if any(rule.ignores(directory, is_dir) for rule in rules):
+                return True
+        return False
+
+    def _remove(self, path: str):
+        file_id = self.files.pop(path)[0]
+        if file_id is not None:
+            del self.paths[file_id]
+            self.unindexed.discard(file_id)
+            self.dead += 1
+
+    def _add(self, path: str, stat: os.stat_result):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        if b"\0" in data[:BINARY_SNIFF]:
+            self.files[path] = (None, stat.st_mtime_ns, stat.st_size)
+            return
+
+        file_id = self.next_id
+        self.next_id += 1
+        self.files[path] = (file_id, stat.st_mtime_ns, stat.st_size)
+        self.paths[file_id] = path
+        if len(data) > MAX_INDEXED_SIZE:
+            self.unindexed.add(file_id)
+            return
+        for trigram in trigrams(data.decode("utf-8", errors="replace")):
+            posting = self.postings.get(trigram)
+            if posting is None:
+                self.postings[trigram] = {file_id}
+            else:
+                posting.add(file_id)
+
+    def _compact(self):
+        live = self.paths.keys()
+        for trigram in list(self.postings):
+            posting = self.postings[trigram]
+            posting.intersection_update(live)
+            if not posting:
+                del self.postings[trigram]
+        self.dead = 0
+
+    def refresh(self, force=False):
+        with self.lock:
+            now = time.monotonic()
+            if (
+                not force
+                and self.refreshed_at is not None
+                and now - self.refreshed_at < self.refresh_interval
+            ):
+                return
+            self.refreshed_at = now
+            seen = set()
+            for path, stat in self._walk():
+                seen.add(path)
+                known = self.files.get(path)
+                if known and known[1:] == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                if known:
+                    self._remove(path)
+                self._add(path, stat)
+            for path in [path for path in self.files if path not in seen]:
+                self._remove(path)
+            if self.dead > len(self.paths):
+                self._compact()
+
+    def update_file(self, path: str):
+        """Re-index one file right after it was written, without a full refresh."""
+        path = os.path.abspath(path)
+        with self.lock:
+            if path in self.files:
+                self._remove(path)
+            if self._ignored(path):
+                return
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return
+            self._add(path, stat)
+
+    def candidates(self, literals: List[str], under: str) -> List[str]:
+        with self.lock:
+            ids = None
+            for literal in literals:
+                for trigram in trigrams(literal):
+                    posting = self.postings.get(trigram, set())
+                    ids = set(posting) if ids is None else ids & posting
+            ids = set(self.paths) if ids is None else (ids & self.paths.keys()) | self.unindexed
+            prefix = under.rstrip(os.sep) + os.sep
+            return [
+                self.paths[file_id]
+                for file_id in ids
+                if self.paths[file_id].startswith(prefix)
+            ]
+
+    def search(self, search_term: str, under: Optional[str] = None, refresh=True) -> Dict[str, int]:
+        """
+        Number of matching lines per file under the given directory. The term
+        is a grep basic regular expression, so plain strings match literally.
+        """
+        try:
+            pattern = re.compile(bre_to_regex(search_term))
+            literals = required_literals(pattern.pattern)
+        except re.error:
+            pattern = re.compile(re.escape(search_term))
+            literals = [search_term]
+
+        if refresh:
+            self.refresh()
+        counts = {}
+        for path in self.candidates(literals, under or self.root):
+            try:
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    text = f.read()
+            except OSError:
+                continue
+            if literals and literals[0] not in text:
+                continue
+            count = sum(1 for line in text.split("\n") if pattern.search(line))
+            if count:
+                counts[path] = count
+        return counts
+
+
+_search_indexes: Dict[Tuple[str, Tuple[str, ...]], SearchIndex] = {}
+_search_indexes_lock = threading.Lock()
+
+
+def get_search_index(root: str, ignore_files: Iterable[str] = (".gitignore",)) -> SearchIndex:
+    """Shared index for root, so every session on a repository reuses one index."""
+    key = (os.path.abspath(root), tuple(ignore_files))
+    with _search_indexes_lock:
+        if key not in _search_indexes:
+            _search_indexes[key] = SearchIndex(*key)
+        return _search_indexes[key]
+
+
+def update_indexed_file(path: str):
+    """Re-index path in every shared index whose root holds it, after a write."""
+    path = os.path.abspath(path)
+    with _search_indexes_lock:
+        indexes = [
+            index
+            for index in _search_indexes.values()
+            if path.startswith(index.root + os.sep)
+        ]
+    for index in indexes:
+        index.update_file(path)
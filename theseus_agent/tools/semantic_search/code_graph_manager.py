@@ -1,7 +1,12 @@
 import asyncio
+import hashlib
+import os
+import re
+from collections import Counter
 
 import chromadb
 import chromadb.utils.embedding_functions as embedding_functions
+import networkx as nx
 import tiktoken
 from dotenv import load_dotenv
 
@@ -9,12 +14,103 @@ from theseus_agent.tools.semantic_search.graph_construction.core.graph_builder i
     GraphConstructor
 from theseus_agent.tools.semantic_search.graph_traversal.encode_codegraph import \
     generate_doc_level_wise
-from theseus_agent.tools.semantic_search.graph_traversal.value_extractor import \
-    extract_chromadb_values
+from theseus_agent.tools.semantic_search.graph_traversal.value_extractor import (
+    extract_chromadb_values, process_node)
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Placeholder a parent's text keeps where a child scope was cut out
+NODE_ID_REFERENCE = re.compile(r"(See node_id )([0-9a-f-]{36})")
+
+
+def content_hash(node_data):
+    """Hash of what a node's documentation and embedding are generated from."""
+    return hashlib.sha256(node_data.get("text", "").encode()).hexdigest()
+
+
+def set_content_hashes(graph):
+    for _, data in graph.nodes(data=True):
+        data["content_hash"] = content_hash(data)
+
+
+def node_keys(graph):
+    """
+    Keys that identify the same code across builds, as node ids are new on
+    every build: type, file, dotted path, and which occurrence of that path
+    it is when a name is defined twice.
+    """
+    keys = {}
+    seen = Counter()
+    for node, data in graph.nodes(data=True):
+        key = (data.get("type"), data.get("file_path", ""), data.get("path"))
+        keys[node] = key + (seen[key],)
+        seen[key] += 1
+    return keys
+
+
+def reuse_node_ids(old_graph, graph):
+    """
+    Relabels the nodes of graph that were in old_graph to their old ids, in
+    the node attributes and the child placeholders in the text too, so
+    unchanged code keeps its id, text and collection entries.
+    """
+    old_ids = {key: node for node, key in node_keys(old_graph).items()}
+    mapping = {
+        node: old_ids[key] for node, key in node_keys(graph).items() if key in old_ids
+    }
+    nx.relabel_nodes(graph, mapping, copy=False)
+
+    def remap(match):
+        return match.group(1) + mapping.get(match.group(2), match.group(2))
+
+    for node, data in graph.nodes(data=True):
+        data["node_id"] = node
+        if "file_node_id" in data:
+            data["file_node_id"] = mapping.get(data["file_node_id"], data["file_node_id"])
+        if "text" in data:
+            data["text"] = NODE_ID_REFERENCE.sub(remap, data["text"])
+    root_node_id = graph.graph.get("root_node_id")
+    graph.graph["root_node_id"] = mapping.get(root_node_id, root_node_id)
+
+
+def diff_graphs(old_graph, graph):
+    """
+    Nodes of graph whose content changed or that have no doc yet, nodes that
+    only moved with their new metadata, and nodes of old_graph that are gone.
+    Unchanged nodes take their doc from old_graph. Node ids must already be
+    reused with reuse_node_ids.
+    """
+    changed = set()
+    moved = {}
+    for node, data in graph.nodes(data=True):
+        if data.get("type") == "directory":
+            continue
+        old_data = old_graph.nodes[node] if node in old_graph else None
+        if (
+            old_data is None
+            or old_data.get("content_hash") != data["content_hash"]
+            or not old_data.get("doc")
+        ):
+            changed.add(node)
+            continue
+        data["doc"] = old_data["doc"]
+        metadata = process_node(graph, node)[2]
+        if process_node(old_graph, node)[2] != metadata:
+            moved[node] = metadata
+    removed = [
+        node
+        for node, data in old_graph.nodes(data=True)
+        if node not in graph and data.get("type") != "directory"
+    ]
+    return changed, moved, removed
+
+
+def count_tokens(text: str) -> int:
+    encoding = tiktoken.get_encoding("cl100k_base")
+    num_tokens = len(encoding.encode(text))
+    return num_tokens
+
 
 class CodeGraphManager:
     def __init__(
@@ -30,18 +126,13 @@ class CodeGraphManager:
         self.collection_name = collection_name
 
     def create_graph(self):
-        def count_tokens(text: str) -> int:
-            encoding = tiktoken.get_encoding("cl100k_base")
-            num_tokens = len(encoding.encode(text))
-            return num_tokens
-
         if not self.root_path:
             raise ValueError("Root path is not provided")
 
         # repo_id = str(uuid.uuid4())
         self.graph_constructor.build_graph(self.root_path)
         asyncio.run(generate_doc_level_wise(self.graph_constructor.graph))
-        # self.graph_constructor.save_graph(self.graph_path)
+        set_content_hashes(self.graph_constructor.graph)
 
         client = chromadb.PersistentClient(path=self.db_path)
 
@@ -49,15 +140,104 @@ class CodeGraphManager:
             name=self.collection_name, embedding_function=self.openai_ef
         )
         print("collection created")
-        node_ids, docs, metadatas, codes = extract_chromadb_values(
-            self.graph_constructor.graph
+        ids, documents, metadatas = self.collection_entries(self.graph_constructor.graph)
+
+        print("embedding")
+        embeddings = self.generate_embeddings(documents)
+        print("embedding done")
+        if len(embeddings) > 0:
+            collection.add(
+                ids=ids,
+                documents=documents,
+                embeddings=embeddings,
+                metadatas=metadatas,
+            )
+        # Kept so update_graph can tell what changed
+        self.graph_constructor.save_graph(self.graph_path)
+
+    def update_graph(self):
+        """
+        Rebuilds the graph and compares it with the one saved by the last
+        build. Only nodes whose content hash changed are documented and
+        embedded again. Nodes that only moved get their line numbers updated,
+        and entries for removed nodes are deleted. Without a saved graph this
+        is create_graph.
+        """
+        if not self.root_path:
+            raise ValueError("Root path is not provided")
+        if not os.path.exists(self.graph_path):
+            return self.create_graph()
+
+        self.graph_constructor.load_graph(self.graph_path)
+        old_graph = self.graph_constructor.graph
+        # build_graph clears the graph in place, so it gets a new one
+        self.graph_constructor.graph = nx.DiGraph()
+        self.graph_constructor.build_graph(self.root_path)
+        graph = self.graph_constructor.graph
+        reuse_node_ids(old_graph, graph)
+        set_content_hashes(graph)
+
+        changed, moved, removed = diff_graphs(old_graph, graph)
+        print(f"{len(changed)} changed, {len(moved)} moved, {len(removed)} removed")
+
+        if changed:
+            asyncio.run(generate_doc_level_wise(graph, nodes=changed))
+
+        client = chromadb.PersistentClient(path=self.db_path)
+        collection = client.get_or_create_collection(
+            name=self.collection_name, embedding_function=self.openai_ef
         )
+        self.update_collection(collection, old_graph, graph, changed, moved, removed)
+        self.graph_constructor.save_graph(self.graph_path)
+
+    def update_collection(self, collection, old_graph, graph, changed, moved, removed):
+        """
+        Brings collection from old_graph to graph: entries of changed and
+        removed nodes are deleted, moved nodes get their new metadata and
+        changed nodes are embedded and upserted.
+        """
+        # A node may be stored whole or split in two, so its entries go by node_id
+        stale = [node for node in changed if node in old_graph] + removed
+        if stale:
+            collection.delete(where={"node_id": {"$in": stale}})
+        if moved:
+            entries = collection.get(
+                where={"node_id": {"$in": list(moved)}}, include=["metadatas"]
+            )
+            updated_metadatas = []
+            for entry_metadata in entries["metadatas"]:
+                metadata = moved[entry_metadata["node_id"]].copy()
+                if "split_type" in entry_metadata:
+                    metadata["split_type"] = entry_metadata["split_type"]
+                updated_metadatas.append(metadata)
+            if entries["ids"]:
+                collection.update(ids=entries["ids"], metadatas=updated_metadatas)
+
+        ids, documents, metadatas = self.collection_entries(graph, changed)
+        embeddings = self.generate_embeddings(documents)
+        if len(embeddings) > 0:
+            collection.upsert(
+                ids=ids,
+                documents=documents,
+                embeddings=embeddings,
+                metadatas=metadatas,
+            )
+
+    def collection_entries(self, graph, nodes=None):
+        """
+        Ids, documents and metadatas to store for the nodes of graph, or only
+        for nodes when given. Nodes too long to embed whole are stored as a
+        documentation entry and a code entry.
+        """
+        node_ids, docs, metadatas, codes = extract_chromadb_values(graph)
 
         docs_and_code = []
         combined_ids = []
         combined_metadatas = []
 
         for i in range(len(docs)):
+            if nodes is not None and node_ids[i] not in nodes:
+                continue
             doc = docs[i]
             code = codes[i]
             combined_text = f"documentation - \n{doc} \n--code-- - \n{code}"
@@ -82,16 +262,7 @@ class CodeGraphManager:
                 combined_ids.append(node_ids[i])
                 combined_metadatas.append(metadatas[i])
 
-        print("embedding")
-        embeddings = self.generate_embeddings(docs_and_code)
-        print("embedding done")
-        if len(embeddings) > 0:
-            collection.add(
-                ids=combined_ids,
-                documents=docs_and_code,
-                embeddings=embeddings,
-                metadatas=combined_metadatas,
-            )
+        return combined_ids, docs_and_code, combined_metadatas
 
     def generate_embeddings(self, docs):
         if docs:
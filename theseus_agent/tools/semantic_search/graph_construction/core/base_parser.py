@@ -1,14 +1,14 @@
 from abc import ABC, abstractmethod
 from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
 import tree_sitter_languages
-from llama_index.core import SimpleDirectoryReader
-from llama_index.core.schema import BaseNode, Document, NodeRelationship
-from llama_index.core.text_splitter import CodeSplitter
-from llama_index.packs.code_hierarchy import CodeHierarchyNodeParser
 
-from theseus_agent.semantic_search.graph_construction.utils import (format_nodes,
-                                                                  tree_parser)
+from theseus_agent.tools.semantic_search.graph_construction.utils import (
+    format_nodes, tree_parser)
+
+if TYPE_CHECKING:
+    from llama_index.core.schema import BaseNode, Document
 
 
 class BaseParser(ABC):
@@ -21,9 +21,18 @@ class BaseParser(ABC):
         self,
         language: str,
         wildcard: str,
+        backend: str = "tree_sitter",
     ):
+        """
+        backend is "tree_sitter" to split files into scopes with tree-sitter
+        directly, or "llama_index" to go through CodeHierarchyNodeParser, which
+        needs llama-index and its code hierarchy pack installed.
+        """
+        if backend not in ("tree_sitter", "llama_index"):
+            raise ValueError(f"Unknown parser backend {backend}")
         self.language = language
         self.wildcard = wildcard
+        self.backend = backend
 
     def parse(
         self,
@@ -38,26 +47,38 @@ class BaseParser(ABC):
             print(f"File {file_path} does not exist.")
             raise FileNotFoundError
 
-        documents = SimpleDirectoryReader(
-            input_files=[path],
-            file_metadata=lambda x: {"filepath": x},
-        ).load_data()
+        if self.backend == "tree_sitter":
+            split_nodes, tree = tree_parser.get_code_hierarchy(
+                path.read_bytes(), self.language
+            )
+            document = None
+        else:
+            from llama_index.core import SimpleDirectoryReader
+            from llama_index.core.text_splitter import CodeSplitter
+            from llama_index.packs.code_hierarchy import CodeHierarchyNodeParser
 
-        # Bug related to llama-index it's safer to remove non-ascii characters. Could be removed in the future
-        documents[0].text = tree_parser.remove_non_ascii(documents[0].text)
+            tree = None
+            documents = SimpleDirectoryReader(
+                input_files=[path],
+                file_metadata=lambda x: {"filepath": x},
+            ).load_data()
 
-        code = CodeHierarchyNodeParser(
-            language=self.language,
-            chunk_min_characters=3,
-            code_splitter=CodeSplitter(
-                language=self.language, max_chars=10000, chunk_lines=10
-            ),
-        )
-        try:
-            split_nodes = code.get_nodes_from_documents(documents)
-        except TimeoutError:
-            print(f"Timeout error: {file_path}")
-            return [], [], {}
+            # Bug related to llama-index it's safer to remove non-ascii characters. Could be removed in the future
+            documents[0].text = tree_parser.remove_non_ascii(documents[0].text)
+            document = documents[0]
+
+            code = CodeHierarchyNodeParser(
+                language=self.language,
+                chunk_min_characters=3,
+                code_splitter=CodeSplitter(
+                    language=self.language, max_chars=10000, chunk_lines=10
+                ),
+            )
+            try:
+                split_nodes = code.get_nodes_from_documents(documents)
+            except TimeoutError:
+                print(f"Timeout error: {file_path}")
+                return [], [], {}
 
         node_list = []
         edges_list = []
@@ -70,7 +91,7 @@ class BaseParser(ABC):
             visited_nodes,
             global_imports,
             assignment_dict,
-            documents[0],
+            document,
             level,
         )
         node_list.append(file_node)
@@ -84,7 +105,7 @@ class BaseParser(ABC):
                 visited_nodes,
                 global_imports,
                 assignment_dict,
-                documents[0],
+                document,
                 level,
             )
 
@@ -92,7 +113,7 @@ class BaseParser(ABC):
             edges_list.extend(relationships)
 
         imports = self._get_imports(
-            str(path), node_list[0]["attributes"]["node_id"], root_path
+            str(path), node_list[0]["attributes"]["node_id"], root_path, tree
         )
 
         return node_list, edges_list, imports
@@ -105,13 +126,13 @@ class BaseParser(ABC):
 
     def __process_node__(
         self,
-        node: BaseNode,
+        node: "BaseNode",
         file_path: str,
         file_node_id: str,
         visited_nodes: dict,
         global_imports: dict,
         assignment_dict: dict,
-        document: Document,
+        document: Optional["Document"],
         level: int,
     ):
         no_extension_path = self._remove_extensions(file_path)
@@ -144,8 +165,9 @@ class BaseParser(ABC):
             processed_node = format_nodes.format_file_node(
                 node, file_path, function_calls
             )
+        # Compared by name, both backends' nodes have PARENT and CHILD keys
         for relation in node.relationships.items():
-            if relation[0] == NodeRelationship.CHILD:
+            if relation[0].name == "CHILD":
                 if len(relation[1]) == 0:
                     leaf = True
                 for child in relation[1]:
@@ -163,7 +185,7 @@ class BaseParser(ABC):
                             ),
                         }
                     )
-            elif relation[0] == NodeRelationship.PARENT:
+            elif relation[0].name == "PARENT":
                 if relation[1]:
                     parent_path = (
                         visited_nodes.get(relation[1].node_id, {})
@@ -177,9 +199,14 @@ class BaseParser(ABC):
                     node_path = f"{parent_path}.{processed_node['attributes']['name']}"
                 else:
                     node_path = no_extension_path.replace("/", ".")
-        start_line, end_line = self.get_start_and_end_line_from_byte(
-            document.text, node.metadata["start_byte"], node.metadata["end_byte"]
-        )
+        if "start_line" in node.metadata:
+            # Tree-sitter nodes carry their lines, no need to count newlines
+            start_line = node.metadata["start_line"]
+            end_line = node.metadata["end_line"]
+        else:
+            start_line, end_line = self.get_start_and_end_line_from_byte(
+                document.text, node.metadata["start_byte"], node.metadata["end_byte"]
+            )
         processed_node["attributes"]["start_line"] = start_line
         processed_node["attributes"]["end_line"] = end_line
         processed_node["attributes"]["path"] = node_path
@@ -196,11 +223,14 @@ class BaseParser(ABC):
         visited_nodes[node.node_id] = {"path": node_path, "level": parent_level + 1}
         return processed_node, relationships
 
-    def _get_imports(self, path: str, file_node_id: str, root_path: str) -> dict:
-        parser = tree_sitter_languages.get_parser(self.language)
-        with open(path, "r") as file:
-            code = file.read()
-        tree = parser.parse(bytes(code, "utf-8"))
+    def _get_imports(
+        self, path: str, file_node_id: str, root_path: str, tree=None
+    ) -> dict:
+        if tree is None:
+            parser = tree_sitter_languages.get_parser(self.language)
+            with open(path, "r") as file:
+                code = file.read()
+            tree = parser.parse(bytes(code, "utf-8"))
 
         imports = {"_*wildcard*_": {"path": [], "alias": "", "type": "wildcard"}}
         for node in tree.root_node.children:
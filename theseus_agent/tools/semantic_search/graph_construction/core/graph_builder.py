@@ -1,11 +1,60 @@
+import multiprocessing
 import os
 import pickle
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 import networkx as nx
 
-from theseus_agent.semantic_search.graph_construction.languages.python.python_parser import \
+from theseus_agent.tools.semantic_search.graph_construction.languages.python.python_parser import \
     PythonParser
-from theseus_agent.semantic_search.graph_construction.utils import format_nodes
+from theseus_agent.tools.semantic_search.graph_construction.utils import format_nodes
+
+# Files handed to a worker at a time, small so the last few files still spread over every worker
+PARSE_CHUNK_SIZE = 4
+
+# Parser of the current worker process, created once by _init_worker
+_worker_parser = None
+
+
+def make_parser(language):
+    if language == "python":
+        return PythonParser()
+    # elif language == "javascript":
+    #     return JavascriptParser()
+    raise ValueError(f"Language {language} not supported")
+    # TODO: Add more languages
+
+
+def parse_file(parser, file_path, root, level):
+    """
+    Parses one file with its own visited nodes and global imports. Node ids are
+    unique, so a file only ever reads back what it wrote itself, and the
+    results can be merged in any process.
+    """
+    visited_nodes = {}
+    global_imports = {}
+    try:
+        processed_nodes, relations, file_imports = parser.parse_file(
+            file_path,
+            root,
+            visited_nodes=visited_nodes,
+            global_imports=global_imports,
+            level=level,
+        )
+    except Exception as e:
+        return None, str(e)
+    return (processed_nodes, relations, file_imports, visited_nodes, global_imports), None
+
+
+def _init_worker(language):
+    global _worker_parser
+    _worker_parser = make_parser(language)
+
+
+def _parse_in_worker(job):
+    file_path, root, level = job
+    return parse_file(_worker_parser, file_path, root, level)
 
 
 class GraphConstructor:
@@ -17,13 +66,8 @@ class GraphConstructor:
         self.import_aliases = {}
         self.root = None
         self.skip_tests = True
-        if language == "python":
-            self.parser = PythonParser()
-        # elif language == "javascript":
-        #     self.parser = JavascriptParser()
-        else:
-            raise ValueError(f"Language {language} not supported")
-        # TODO: Add more languages
+        self.language = language
+        self.parser = make_parser(language)
 
     def save_graph(self, file_path):
         """Saves the graph to the specified file path using pickle."""
@@ -51,17 +95,21 @@ class GraphConstructor:
         path: str,
         nodes: list = None,
         relationships: list = None,
-        imports: dict = None,
+        files: list = None,
         parent_id: str = None,
         level: int = 0,
         ignored_paths: set = None,
     ):
+        """
+        Walks the tree, adding directory nodes and collecting the files to parse
+        as (path, level, directory node id, directory path) in walk order.
+        """
         if nodes is None:
             nodes = []
         if relationships is None:
             relationships = []
-        if imports is None:
-            imports = {}
+        if files is None:
+            files = []
         if ignored_paths is None:
             ignored_paths = set()
 
@@ -70,7 +118,7 @@ class GraphConstructor:
         if self.root is None:
             self.root = path
         if path.endswith("tests") or path.endswith("test"):
-            return nodes, relationships, imports
+            return nodes, relationships, files
 
         # package = self.parser.is_package(path)
 
@@ -118,79 +166,96 @@ class GraphConstructor:
 
             if entry.is_file():
                 if entry.name.endswith(".py") or entry.name.endswith(".js"):
-                    entry_name = entry.name.split(".")[0]
-                    try:
-                        processed_nodes, relations, file_imports = (
-                            self.parser.parse_file(
-                                entry.path,
-                                self.root,
-                                visited_nodes=self.visited_nodes,
-                                global_imports=self.global_imports,
-                                level=level,
-                            )
-                        )
-                    except Exception as e:
-                        print(f"Error {entry.path}")
-                        print(e)
-                        continue
-                    print(f"Processed {entry.path}")
-                    if not processed_nodes:
-                        self.import_aliases.update(file_imports)
-                        continue
-                    file_root_node_id = processed_nodes[0]["attributes"]["node_id"]
-
-                    nodes.extend(processed_nodes)
-                    relationships.extend(relations)
-                    relationships.append(
-                        {
-                            "sourceId": directory_node_id,
-                            "targetId": file_root_node_id,
-                            "type": "CONTAINS",
-                        }
-                    )
-                    imports.update(file_imports)
-
-                    global_import_key = (directory_path + entry_name).replace("/", ".")
-                    self.global_imports[global_import_key] = {
-                        "id": file_root_node_id,
-                        "type": "FILE",
-                    }
-                else:
-                    pass
-                    # file_node = {
-                    #     "type": "FILE",
-                    #     "attributes": {
-                    #         "path": entry.path,
-                    #         "name": entry.name,
-                    #         "node_id": str(uuid.uuid4()),
-                    #     },
-                    # }
-                    # nodes.append(file_node)
-                    # relationships.append(
-                    #     {
-                    #         "sourceId": directory_node_id,
-                    #         "targetId": file_node["attributes"]["node_id"],
-                    #         "type": "CONTAINS",
-                    #     }
-                    # )
+                    files.append((entry.path, level, directory_node_id, directory_path))
             if entry.is_dir():
                 if self.parser.skip_directory(entry.name):
                     continue
-                nodes, relationships, imports = self._scan_directory(
+                nodes, relationships, files = self._scan_directory(
                     entry.path,
                     nodes,
                     relationships,
-                    imports,
+                    files,
                     directory_node_id,
                     level + 1,
                     ignored_paths,
                 )
-        return nodes, relationships, imports
-
-    def build_graph(self, path):
+        return nodes, relationships, files
+
+    def _parse_files(self, files, workers):
+        """
+        Yields the parse result of every file in order. With more than one
+        worker the files are parsed in a pool of processes that each keep one
+        parser; if the pool breaks, the remaining files are parsed here.
+        """
+        jobs = [(file_path, self.root, level) for file_path, level, _, _ in files]
+        done = 0
+        if workers > 1 and len(jobs) > 1:
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=min(workers, len(jobs)),
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.language,),
+                ) as executor:
+                    for result in executor.map(
+                        _parse_in_worker, jobs, chunksize=PARSE_CHUNK_SIZE
+                    ):
+                        done += 1
+                        yield result
+            except BrokenProcessPool as e:
+                print(f"Graph workers failed, parsing the remaining files here: {e!r}")
+        for file_path, root, level in jobs[done:]:
+            yield parse_file(self.parser, file_path, root, level)
+
+    def _add_file(self, file, parsed, nodes, relationships, imports):
+        file_path, _, directory_node_id, directory_path = file
+        processed_nodes, relations, file_imports, visited_nodes, global_imports = parsed
+        self.visited_nodes.update(visited_nodes)
+        self.global_imports.update(global_imports)
+        if not processed_nodes:
+            self.import_aliases.update(file_imports)
+            return
+        file_root_node_id = processed_nodes[0]["attributes"]["node_id"]
+
+        nodes.extend(processed_nodes)
+        relationships.extend(relations)
+        relationships.append(
+            {
+                "sourceId": directory_node_id,
+                "targetId": file_root_node_id,
+                "type": "CONTAINS",
+            }
+        )
+        imports.update(file_imports)
+
+        entry_name = os.path.basename(file_path).split(".")[0]
+        global_import_key = (directory_path + entry_name).replace("/", ".")
+        self.global_imports[global_import_key] = {
+            "id": file_root_node_id,
+            "type": "FILE",
+        }
+
+    def build_graph(self, path, workers=None):
+        """
+        Builds the graph of the codebase at path. Files are parsed by that many
+        worker processes, one per core by default, and merged in the order of
+        the walk so the graph matches a build with a single worker.
+        """
         self.clear_graph()
-
-        nodes, relationships, imports = self._scan_directory(path)
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        nodes, relationships, files = self._scan_directory(path)
+        imports = {}
+        for i, (file, (parsed, error)) in enumerate(
+            zip(files, self._parse_files(files, workers)), 1
+        ):
+            if error is not None:
+                print(f"Error {file[0]}")
+                print(error)
+                continue
+            print(f"Processed {file[0]} ({i}/{len(files)})")
+            self._add_file(file, parsed, nodes, relationships, imports)
 
         for node in nodes:
             node["attributes"]["type"] = node["type"]
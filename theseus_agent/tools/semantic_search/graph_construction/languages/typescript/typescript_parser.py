@@ -2,7 +2,7 @@ import os
 
 import tree_sitter_languages
 
-from theseus_agent.semantic_search.graph_construction.core.base_parser import \
+from theseus_agent.tools.semantic_search.graph_construction.core.base_parser import \
     BaseParser
 
 
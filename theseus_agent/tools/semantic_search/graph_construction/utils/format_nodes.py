@@ -1,11 +1,13 @@
 import os
 import uuid
+from typing import TYPE_CHECKING
 
-from llama_index.core.schema import BaseNode
+if TYPE_CHECKING:
+    from llama_index.core.schema import BaseNode
 
 
 def format_function_node(
-    node: BaseNode, scope: dict, function_calls: list[str], file_node_id: str
+    node: "BaseNode", scope: dict, function_calls: list[str], file_node_id: str
 ) -> dict:
     name = scope["name"]
     signature = scope["signature"]
@@ -26,7 +28,7 @@ def format_function_node(
 
 
 def format_class_node(
-    node: BaseNode, scope: dict, file_node_id: str, inheritances: list[str]
+    node: "BaseNode", scope: dict, file_node_id: str, inheritances: list[str]
 ) -> dict:
     name = scope["name"]
     signature = scope["signature"]
@@ -47,7 +49,7 @@ def format_class_node(
 
 
 def format_file_node(
-    node: BaseNode, no_extension_path: str, function_calls: list[str]
+    node: "BaseNode", no_extension_path: str, function_calls: list[str]
 ) -> dict:
     processed_node = {
         "type": "FILE",
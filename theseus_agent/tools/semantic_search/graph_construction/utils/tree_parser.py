@@ -1,7 +1,52 @@
+import functools
 import re
+import uuid
+from enum import Enum
 
 import tree_sitter_languages
-from tree_sitter import Language, Node
+from tree_sitter import Node
+
+# Node types that become graph nodes, with the child type their signature ends at
+# and the child types their name can be read from
+SCOPE_TYPES = {
+    "python": {
+        "function_definition": (["block"], ["identifier"]),
+        "class_definition": (["block"], ["identifier"]),
+    },
+    "typescript": {
+        "function_declaration": (["statement_block"], ["identifier"]),
+        "class_declaration": (["class_body"], ["type_identifier"]),
+        "method_definition": (["statement_block"], ["property_identifier"]),
+        "interface_declaration": (["object_type"], ["type_identifier"]),
+    },
+}
+
+# Prefix of the comment left where a child scope is cut out of its parent's text
+COMMENT_PREFIXES = {"python": "#", "typescript": "//"}
+
+# Languages whose scopes are closed by a bracket rather than by dedenting
+BRACKET_LANGUAGES = {"typescript"}
+
+
+class NodeRelationship(Enum):
+    """
+    Relationship keys of CodeNode. BaseParser compares them by name, so it
+    reads llama-index's NodeRelationship keys the same way.
+    """
+
+    PARENT = "parent"
+    CHILD = "child"
+
+
+@functools.lru_cache(maxsize=None)
+def get_parser(language: str):
+    return tree_sitter_languages.get_parser(language)
+
+
+@functools.lru_cache(maxsize=None)
+def get_query(language: str, source: str):
+    """Compiles a query once per language, compiling is most of a node's cost."""
+    return tree_sitter_languages.get_language(language).query(source)
 
 
 def remove_non_ascii(text):
@@ -34,8 +79,9 @@ def get_function_name(call_str):
         return None  # No function name found
 
 
-def decompose_function_call(call_node: Node, language: Language, decomposed_calls=[]):
-    calls_query = language.query(
+def decompose_function_call(call_node: Node, language: str, decomposed_calls=[]):
+    calls_query = get_query(
+        language,
         """
         (attribute
             object: [
@@ -72,12 +118,10 @@ def get_function_calls(node: Node, assignments_dict: dict, language: str) -> lis
     code_text = node.text
     function_calls = []
 
-    parser = tree_sitter_languages.get_parser(language)
-    tree = parser.parse(bytes(code_text, "utf-8"))
-    language = tree_sitter_languages.get_language(language)
+    tree = get_parser(language).parse(bytes(code_text, "utf-8"))
 
-    assignment_query = language.query(
-        """(assignment left: _ @variable right: _ @expression)"""
+    assignment_query = get_query(
+        language, """(assignment left: _ @variable right: _ @expression)"""
     )
 
     assignments = assignment_query.captures(tree.root_node)
@@ -106,7 +150,7 @@ def get_function_calls(node: Node, assignments_dict: dict, language: str) -> lis
 
             assignments_dict[variable_identifier] = assign_value.text.decode()
 
-    calls_query = language.query("""(call function: _ @function_call)""")
+    calls_query = get_query(language, """(call function: _ @function_call)""")
 
     function_calls_nodes = calls_query.captures(tree.root_node)
 
@@ -149,8 +193,7 @@ def get_function_calls(node: Node, assignments_dict: dict, language: str) -> lis
 def get_inheritances(node: Node, language: str) -> list[str]:
     code_text = node.text
 
-    parser = tree_sitter_languages.get_parser(language)
-    tree = parser.parse(bytes(code_text, "utf-8"))
+    tree = get_parser(language).parse(bytes(code_text, "utf-8"))
     node_names = map(lambda node: node, traverse_tree(tree))
 
     inheritances = []
@@ -165,3 +208,151 @@ def get_inheritances(node: Node, language: str) -> list[str]:
                             inheritances.append(argument.text.decode("utf-8"))
 
     return inheritances
+
+
+class CodeNode:
+    """
+    One scope of a file, with the attributes BaseParser reads from the nodes
+    of llama-index's CodeHierarchyNodeParser: text with child scopes replaced
+    by their signature and a comment, node_id, metadata and parent/child
+    relationships.
+
+    Unlike CodeHierarchyNodeParser, which runs every scope through a
+    CodeSplitter, scopes longer than the splitter's 10000 characters are not
+    split into several nodes, they stay one node.
+    """
+
+    def __init__(self, source: bytes, node: Node, language: str, scopes: list, parent=None):
+        self.source = source
+        self.ts_node = node
+        self.language = language
+        self.node_id = str(uuid.uuid4())
+        self.children = []
+        start_byte = node.start_byte
+        if parent is not None:
+            # Take in the indentation before the scope, the replacement text is indented from it
+            while start_byte > 0 and source[start_byte - 1 : start_byte] in (b" ", b"\t"):
+                start_byte -= 1
+        self.metadata = {
+            "inclusive_scopes": scopes,
+            "start_byte": start_byte,
+            "end_byte": node.end_byte,
+            "start_line": node.start_point[0] + 1,
+            "end_line": node.end_point[0] + 1,
+        }
+        self.relationships = {
+            NodeRelationship.PARENT: parent,
+            NodeRelationship.CHILD: self.children,
+        }
+        self._text = None
+
+    def decode(self, start_byte: int, end_byte: int) -> str:
+        return self.source[start_byte:end_byte].decode("utf-8", errors="replace")
+
+    def replacement_text(self) -> str:
+        """The signature and comment this scope is replaced with in its parent's text."""
+        indent_char, per_level, level = get_indentation(
+            self.decode(self.metadata["start_byte"], self.metadata["end_byte"])
+        )
+        indent = indent_char * per_level
+        comment = (
+            f"{COMMENT_PREFIXES[self.language]} Code replaced for brevity. "
+            f"See node_id {self.node_id}"
+        )
+        signature = self.metadata["inclusive_scopes"][-1]["signature"]
+        if self.language in BRACKET_LANGUAGES:
+            return (
+                f"{indent * level}{signature} {{\n"
+                f"{indent * (level + 1)}{comment}\n"
+                f"{indent * level}}}"
+            )
+        return f"{indent * level}{signature}\n{indent * (level + 1)}{comment}"
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            parts = []
+            position = self.metadata["start_byte"]
+            for child in self.children:
+                parts.append(self.decode(position, child.metadata["start_byte"]))
+                parts.append(child.replacement_text())
+                position = child.metadata["end_byte"]
+            parts.append(self.decode(position, self.metadata["end_byte"]))
+            self._text = "".join(parts).strip()
+        return self._text
+
+
+def get_indentation(text: str) -> tuple[str, int, int]:
+    """
+    Indent character, indent width per level and level of the first line of
+    text, worked out the way CodeHierarchyNodeParser does: the width is the
+    smallest indentation of any line, 4 if no line is indented.
+    """
+    indent_char = None
+    per_level = None
+    lines = text.splitlines()
+    for line in lines:
+        stripped = line.lstrip()
+        if not stripped:
+            continue
+        leading = line[: len(line) - len(stripped)]
+        if indent_char is None and leading:
+            indent_char = "\t" if "\t" in leading else " "
+        count = leading.count(indent_char) if indent_char else 0
+        if count and (per_level is None or count < per_level):
+            per_level = count
+    indent_char = indent_char or " "
+    per_level = per_level or 4
+    first_line = lines[0] if lines else ""
+    first_count = len(first_line) - len(first_line.lstrip(indent_char))
+    return indent_char, per_level, first_count // per_level
+
+
+def get_scope(node: Node, source: bytes, language: str):
+    """Name, type and signature of node if it is a scope of language, else None."""
+    scope_types = SCOPE_TYPES[language]
+    if node.type not in scope_types:
+        return None
+    end_types, name_types = scope_types[node.type]
+    name = ""
+    end = node.end_byte
+    for child in node.children:
+        if not name and child.type in name_types:
+            name = child.text.decode("utf-8", errors="replace")
+        if child.type in end_types:
+            end = child.start_byte
+            break
+    signature = source[node.start_byte : end].decode("utf-8", errors="replace").strip()
+    return {"name": name, "type": node.type, "signature": signature}
+
+
+def get_code_hierarchy(source: bytes, language: str):
+    """
+    Parses source with tree-sitter and returns the file node followed by every
+    scope in pre-order, so a scope always comes after its parent, and the
+    tree so it can be reused.
+    """
+    if language not in SCOPE_TYPES:
+        raise ValueError(f"Language {language} not supported")
+    tree = get_parser(language).parse(source)
+    file_node = CodeNode(source, tree.root_node, language, [])
+    code_nodes = [file_node]
+
+    # Explicit stack of (tree-sitter node, closest enclosing code node), children pushed in reverse
+    stack = [(child, file_node) for child in reversed(tree.root_node.children)]
+    while stack:
+        node, parent = stack.pop()
+        scope = get_scope(node, source, language)
+        if scope is not None:
+            code_node = CodeNode(
+                source,
+                node,
+                language,
+                parent.metadata["inclusive_scopes"] + [scope],
+                parent,
+            )
+            parent.children.append(code_node)
+            code_nodes.append(code_node)
+            parent = code_node
+        stack.extend((child, parent) for child in reversed(node.children))
+    return code_nodes, tree
@@ -1,8 +1,8 @@
 import asyncio
 from collections import deque
 
-from theseus_agent.semantic_search.llm import (code_explainer_prompt,
-                                             get_completion)
+from theseus_agent.tools.semantic_search.llm import (code_explainer_prompt,
+                                                   get_completion)
 
 
 async def process_node(graph, node):
@@ -49,7 +49,12 @@ async def generate_doc_level_wise(
     graph,
     edge_types=["FUNCTION_DEFINITION", "CLASS_DEFINITION", "CONTAINS"],
     batch_size=30,
+    nodes=None,
 ):
+    """
+    Documents the nodes under the root, deepest level first. When nodes is
+    given only those are documented, the rest keep the doc they have.
+    """
     root_node = graph.graph["root_node_id"]
 
     print("here2")
@@ -82,6 +87,7 @@ async def generate_doc_level_wise(
             for node, node_level in node_levels.items()
             if node_level == level
             and graph.nodes[node].get("type", "directory") != "directory"
+            and (nodes is None or node in nodes)
         ]
         if nodes_to_process:
             await process_level_async(
@@ -1,14 +1,12 @@
-import time
-from typing import Dict, List
 from theseus_agent.config import Checkpoint
 from theseus_agent.tool import Tool, ToolContext
+from theseus_agent.utils.event_log import EventLog
 
 
-def waitForEvent(event_log: List[Dict], event):
-    while True:
-        if event_log[-1] == event:
-            return event_log[-1]
-        time.sleep(1)
+def waitForEvent(event_log: EventLog, event):
+    return event_log.wait_for_event(
+        lambda logged: logged == event, start=max(len(event_log) - 1, 0)
+    )
 
 class AskUserTool(Tool):
     @property
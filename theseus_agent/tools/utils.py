@@ -1,11 +1,9 @@
 import fnmatch
-import io
-import json
 import os
-import tempfile
 from pathlib import Path
 
 from theseus_agent.tool import ToolContext
+from theseus_agent.tools.lint_service import LintService
 
 
 def get_ignored_files(gitignore_path):
@@ -74,20 +72,17 @@ def get_cwd(ctx) -> str:
     Returns:
         str: The current working directory of the container.
     """
-    command = "pwd"
-    result = ctx["environment"].execute(command)
-
-    # logger.info(f"CWD {result}")
-
-    return result[0].strip() if result[0] else None
+    cwd = ctx["environment"].get_cwd()
+    return cwd.strip() if cwd else None
 
 
 def cwd_normalize_path(ctx, path):
     if os.path.isabs(path):
         return make_abs_path(ctx, path)
     else:
-        print(get_cwd(ctx), path)
-        return make_abs_path(ctx, os.path.join(get_cwd(ctx), path))
+        cwd = get_cwd(ctx)
+        print(cwd, path)
+        return make_abs_path(ctx, os.path.join(cwd, path))
 
 
 def file_exists(ctx, fpath):
@@ -127,11 +122,7 @@ def write_file(ctx, file_path: str, content: str = "") -> str:
                 f"Could not write to file, file not open in editor: {abs_path}"
             )
 
-        create_command = f"cat << 'DELIM' > {abs_path} \n" + content + "\nDELIM"
-        result = ctx["environment"].execute(create_command)
-
-        if result[1] == 1:
-            raise Exception(result)
+        ctx["environment"].write_file(abs_path, content)
 
         ctx["state"]["editor"]["files"][abs_path]["lines"] = content
         msg = f"Successfully wrote to file {abs_path}"
@@ -154,24 +145,7 @@ def check_lint(ctx, code_string: str, file_path: str):
     # example json
     # [{'type': 'error', 'module': 'tmp5cpif150', 'obj': 'ModelFormMetaclass.__new__', 'line': 224, 'column': 20, 'endLine': 224, 'endColumn': 60, 'path': '/tmp/tmp5cpif150', 'symbol': 'too-many-function-args', 'message': 'Too many positional arguments for classmethod call', 'message-id': 'E1121'}, {'type': 'error', 'module': 'tmp5cpif150', 'obj': 'ModelForm', 'line': 477, 'column': 0, 'endLine': 477, 'endColumn': 15, 'path': '/tmp/tmp5cpif150', 'symbol': 'invalid-metaclass', 'message': "Invalid metaclass 'ModelFormMetaclass' used", 'message-id': 'E1139'}, {'type': 'error', 'module': 'tmp5cpif150', 'obj': 'ModelChoiceField.__deepcopy__', 'line': 1250, 'column': 17, 'endLine': 1250, 'endColumn': 41, 'path': '/tmp/tmp5cpif150', 'symbol': 'bad-super-call', 'message': "Bad first argument 'ChoiceField' given to super()", 'message-id': 'E1003'}]
 
-    from pylint.lint import Run
-    from pylint.reporters.json_reporter import JSONReporter
-
-    pylint_output = io.StringIO()  # Custom open stream
-    reporter = JSONReporter(pylint_output)
-
-    with tempfile.NamedTemporaryFile(mode="w+") as f:
-        f.write(code_string)
-        f.seek(0)
-        Run(
-            args=["--disable=all", "--enable=E0602,E1101", f.name],
-            reporter=reporter,
-            exit=False,
-        )
-
-    results = json.loads(pylint_output.getvalue())
-
-    return results
+    return LintService.get().lint(code_string)
 
 
 def read_file(ctx, file_path: str) -> str:
@@ -236,10 +210,13 @@ def _list_files_recursive(ctx, files: list[str]) -> dict:
         add_to_tree(directory_path, directory_tree)
         add_to_tree(file_path, file_tree)
 
-        if file_path in files:
-            # Read file content from container
-            result = ctx["environment"].execute(f"cat '{file_path}'")
-            files_content[file_path] = result
+    # Read the requested files from the container in one go
+    requested = [file_path for file_path in all_files if file_path in files]
+    for file_path, read in ctx["environment"].read_files(requested).items():
+        if "error" in read:
+            files_content[file_path] = (read["error"], 1)
+        else:
+            files_content[file_path] = (read["content"], 0)
 
     return {
         "directory_tree": directory_tree,
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+MAX_ENTRIES = 10000
+
+# Arguments that identify the provider account rather than the completion
+UNKEYED_ARGS = {"api_key"}
+
+_completion_cache = None
+
+
+class CompletionCache:
+    """
+    On-disk cache of deterministic completions, keyed by a hash of the model,
+    parameters, system prompt and messages. Least recently used entries are
+    evicted once more than max_entries are stored.
+    """
+
+    def __init__(self, path: str, max_entries: int = MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, content TEXT, finish_reason TEXT, accessed REAL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed)"
+        )
+        self.connection.commit()
+        self.size = self.connection.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+
+    @staticmethod
+    def key(**kwargs) -> str:
+        keyed = {k: v for k, v in kwargs.items() if k not in UNKEYED_ARGS}
+        return hashlib.sha256(
+            json.dumps(keyed, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, str]]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT content, finish_reason FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.connection.execute(
+                "UPDATE completions SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+            self.connection.commit()
+            return row[0], row[1]
+
+    def put(self, key: str, content: str, finish_reason: str):
+        with self.lock:
+            exists = self.connection.execute(
+                "SELECT 1 FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)",
+                (key, content, finish_reason, time.time()),
+            )
+            if not exists:
+                self.size += 1
+            if self.size > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM completions WHERE key IN ("
+                    "SELECT key FROM completions ORDER BY accessed LIMIT ?)",
+                    (self.size - self.max_entries,),
+                )
+                self.size = self.max_entries
+            self.connection.commit()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "entries": self.size}
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def set_completion_cache(path: Optional[str], max_entries: int = MAX_ENTRIES):
+    """Enable the process-wide completion cache at path, or disable it with None."""
+    global _completion_cache
+    if _completion_cache is not None:
+        _completion_cache.close()
+    _completion_cache = CompletionCache(path, max_entries) if path else None
+    return _completion_cache
+
+
+def get_completion_cache() -> Optional[CompletionCache]:
+    return _completion_cache
@@ -0,0 +1,151 @@
+import asyncio
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+class EventLog(list):
+    """
+    List of session events that wakes up waiting consumers whenever it grows.
+
+    The session loop, git prompts and user tools block on the shared condition
+    instead of polling the log, so appends from the server or from tools are
+    picked up immediately. Listeners are plain callbacks run after every change,
+    used to push events to other threads or event loops. Stream listeners get
+    the events passed to publish, which are shown live but never recorded.
+    """
+
+    def __init__(
+        self,
+        events: Iterable[Dict] = (),
+        condition: Optional[threading.Condition] = None,
+        listeners: Optional[List[Callable[[], None]]] = None,
+        stream_listeners: Optional[List[Callable[[Dict], None]]] = None,
+    ):
+        super().__init__(events)
+        self.condition = condition or threading.Condition()
+        self.listeners = listeners if listeners is not None else []
+        self.stream_listeners = stream_listeners if stream_listeners is not None else []
+
+    def append(self, event: Dict):
+        with self.condition:
+            super().append(event)
+            self.condition.notify_all()
+        self._notify_listeners()
+
+    def extend(self, events: Iterable[Dict]):
+        with self.condition:
+            super().extend(events)
+            self.condition.notify_all()
+        self._notify_listeners()
+
+    def notify(self):
+        """Wake up every waiter so it can re-check its predicate."""
+        with self.condition:
+            self.condition.notify_all()
+        self._notify_listeners()
+
+    def publish(self, event: Dict):
+        """
+        Send an event to the stream listeners without appending it, for partial
+        output that is only of interest while it is being produced.
+        """
+        for listener in list(self.stream_listeners):
+            listener(event)
+
+    def _notify_listeners(self):
+        for listener in list(self.listeners):
+            listener()
+
+    def wait_for(self, predicate: Callable[[], bool], timeout: Optional[float] = None):
+        with self.condition:
+            return self.condition.wait_for(predicate, timeout)
+
+    def wait_for_event(
+        self,
+        predicate: Callable[[Dict], bool],
+        start: Optional[int] = None,
+        timeout: Optional[float] = None,
+    ) -> Optional[Dict]:
+        """
+        Block until an event matching predicate is appended at or after start.
+
+        Returns the matching event, or None if the timeout expired.
+        """
+        cursor = len(self) if start is None else start
+        found = None
+
+        def _check():
+            nonlocal cursor, found
+            while cursor < len(self):
+                event = self[cursor]
+                cursor += 1
+                if predicate(event):
+                    found = event
+                    return True
+            return False
+
+        self.wait_for(_check, timeout)
+        return found
+
+
+class EventBroadcaster:
+    """
+    Fans out event log changes to async subscribers on one event loop.
+
+    notify and publish may be called from any thread; each subscriber gets its
+    own asyncio.Event that is set when the log changed, and its own queue of
+    published events.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.subscribers: Dict[asyncio.Event, List[Dict]] = {}
+
+    def notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self._wake)
+        except RuntimeError:
+            # Loop already closed, nobody left to wake
+            pass
+
+    def publish(self, event: Dict):
+        try:
+            self.loop.call_soon_threadsafe(self._deliver, event)
+        except RuntimeError:
+            pass
+
+    def _wake(self):
+        for subscriber in self.subscribers:
+            subscriber.set()
+
+    def _deliver(self, event: Dict):
+        for subscriber, published in self.subscribers.items():
+            published.append(event)
+            subscriber.set()
+
+    async def stream(self, get_event_log: Callable[[], List[Dict]], start: int):
+        """
+        Yield (index, event) for every event at or after start, then for each
+        event appended afterwards, and (None, event) for each event published
+        while streaming. get_event_log is re-read on every wake-up since
+        sessions swap their log on revert and reset.
+        """
+        wake = asyncio.Event()
+        published = self.subscribers[wake] = []
+        cursor = start
+        try:
+            while True:
+                wake.clear()
+                # Published events are partial output of the events appended next
+                while published:
+                    yield None, published.pop(0)
+                event_log = get_event_log()
+                end = len(event_log)
+                # The log was truncated by a revert, continue from its new end
+                cursor = min(cursor, end)
+                for index in range(cursor, end):
+                    yield index, event_log[index]
+                cursor = end
+                await wake.wait()
+        finally:
+            self.subscribers.pop(wake, None)
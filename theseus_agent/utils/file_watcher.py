@@ -0,0 +1,276 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+# Seconds between stat sweeps when inotify is not available
+POLL_INTERVAL = 0.5
+
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_inotify():
+    if not hasattr(os, "O_NONBLOCK"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        libc.inotify_rm_watch
+    except (OSError, AttributeError, TypeError):
+        return None
+    return libc
+
+
+class FileWatcher:
+    """
+    Tracks which of a set of files changed on disk since they were last
+    popped. Uses inotify on the files' directories where available, so
+    editors that replace files by rename are caught too, and otherwise polls
+    the files' stat from a background thread. pop_unverified tells which
+    files it cannot vouch for, those have to be checked some other way.
+
+    listeners are called with the path from the watcher thread on every change.
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL, use_inotify: bool = True):
+        self.lock = threading.Lock()
+        self.paths: Set[str] = set()
+        self.dirty: Set[str] = set()
+        self.listeners: List[Callable[[str], None]] = []
+        self.poll_interval = poll_interval
+        self.closed = threading.Event()
+        # Paths inotify does not cover: their directory could not be watched or they are symlinks
+        self.unwatched: Set[str] = set()
+        self.overflowed = False
+        self.failed = False
+        self.read_lock = threading.Lock()
+
+        self.libc = _load_inotify() if use_inotify else None
+        self.fd = -1
+        if self.libc is not None:
+            self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if self.fd < 0:
+                self.libc = None
+        self.directories: Dict[str, int] = {}
+        self.watch_dirs: Dict[int, str] = {}
+        self.stats: Dict[str, Optional[tuple]] = {}
+
+        if self.libc is not None:
+            self.wake_read, self.wake_write = os.pipe()
+            target = self._read_events
+        else:
+            target = self._poll
+        self.thread = threading.Thread(target=target, daemon=True)
+        self.thread.start()
+
+    @property
+    def uses_inotify(self) -> bool:
+        return self.libc is not None
+
+    def _stat(self, path: str) -> Optional[tuple]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _mark(self, paths: Iterable[str]):
+        with self.lock:
+            paths = [path for path in paths if path in self.paths]
+            self.dirty.update(paths)
+        for path in paths:
+            for listener in list(self.listeners):
+                listener(path)
+
+    def watch(self, path: str):
+        """Start watching path. A newly watched path starts out dirty."""
+        path = os.path.abspath(path)
+        with self.lock:
+            if path in self.paths:
+                return
+            self.paths.add(path)
+            self.dirty.add(path)
+            if self.libc is None:
+                self.stats[path] = self._stat(path)
+                return
+            if not self._watch_directory(path):
+                self.unwatched.add(path)
+
+    def _watch_directory(self, path: str) -> bool:
+        # Events name the link, changes to the file it points to would be missed
+        if os.path.realpath(path) != path:
+            return False
+        directory = os.path.dirname(path)
+        if directory not in self.directories:
+            wd = self.libc.inotify_add_watch(self.fd, directory.encode(), WATCH_MASK)
+            if wd < 0:
+                # Directory does not exist (yet)
+                return False
+            self.directories[directory] = wd
+            self.watch_dirs[wd] = directory
+        return True
+
+    def unwatch(self, path: str):
+        path = os.path.abspath(path)
+        with self.lock:
+            self.paths.discard(path)
+            self.dirty.discard(path)
+            self.unwatched.discard(path)
+            self.stats.pop(path, None)
+            if self.libc is None:
+                return
+            directory = os.path.dirname(path)
+            still_watched = any(os.path.dirname(p) == directory for p in self.paths)
+            if directory in self.directories and not still_watched:
+                wd = self.directories.pop(directory)
+                del self.watch_dirs[wd]
+                self.libc.inotify_rm_watch(self.fd, wd)
+
+    def sync(self, paths: Iterable[str]):
+        """Watch exactly the given paths."""
+        wanted = {os.path.abspath(path) for path in paths}
+        for path in self.paths - wanted:
+            self.unwatch(path)
+        for path in wanted - self.paths:
+            self.watch(path)
+        if self.libc is not None:
+            with self.lock:
+                self.unwatched = {
+                    path for path in self.unwatched if not self._watch_directory(path)
+                }
+
+    @property
+    def changed(self) -> Set[str]:
+        with self.lock:
+            return set(self.dirty)
+
+    def pop_changed(self) -> Set[str]:
+        """
+        Return the paths that changed since the last call and clear them.
+        Queued inotify events are read first, so changes made right before
+        the call are included.
+        """
+        if self.libc is not None and not self.closed.is_set():
+            self._drain()
+        with self.lock:
+            changed = self.dirty
+            self.dirty = set()
+            return changed
+
+    def pop_unverified(self) -> Set[str]:
+        """
+        Return the paths whose changes pop_changed may have missed since the
+        last call: every path when polling, after the inotify queue overflowed
+        or once reading it failed, otherwise the paths inotify does not cover.
+        """
+        with self.lock:
+            if self.libc is None or self.overflowed or self.failed:
+                self.overflowed = False
+                return set(self.paths)
+            return set(self.unwatched)
+
+    def _read_events(self):
+        while not self.closed.is_set():
+            try:
+                ready, _, _ = select.select([self.fd, self.wake_read], [], [])
+            except (OSError, ValueError):
+                self.failed = True
+                return
+            if self.wake_read in ready:
+                return
+            if not self._drain():
+                return
+
+    def _drain(self) -> bool:
+        """Apply every queued inotify event, False if the queue can no longer be read."""
+        with self.read_lock:
+            while True:
+                try:
+                    data = os.read(self.fd, 64 * 1024)
+                except BlockingIOError:
+                    return True
+                except OSError:
+                    self.failed = True
+                    return False
+                self._apply_events(data)
+
+    def _apply_events(self, data: bytes):
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0").decode(errors="replace")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, pop_unverified hands every path to a stat check
+                with self.lock:
+                    self.overflowed = True
+                continue
+            directory = self.watch_dirs.get(wd)
+            if directory is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                in_directory = [p for p in self.paths if os.path.dirname(p) == directory]
+                changed.update(in_directory)
+                if mask & IN_IGNORED:
+                    # The kernel dropped the watch, sync tries to add it again
+                    with self.lock:
+                        del self.watch_dirs[wd]
+                        self.directories.pop(directory, None)
+                        self.unwatched.update(in_directory)
+            elif name:
+                changed.add(os.path.join(directory, name))
+        self._mark(changed)
+
+    def _poll(self):
+        while not self.closed.wait(self.poll_interval):
+            with self.lock:
+                paths = list(self.paths)
+            changed = []
+            for path in paths:
+                stat = self._stat(path)
+                with self.lock:
+                    if path in self.stats and self.stats[path] != stat:
+                        self.stats[path] = stat
+                        changed.append(path)
+            self._mark(changed)
+
+    def close(self):
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        if self.libc is not None:
+            os.write(self.wake_write, b"x")
+            self.thread.join(timeout=1)
+            os.close(self.fd)
+            os.close(self.wake_read)
+            os.close(self.wake_write)
@@ -0,0 +1,209 @@
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+# Backoff when a provider rate limits without saying how long to wait
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 60.0
+
+# Waiters sharing a key wake up spread over this fraction of their delay
+JITTER = 0.25
+
+PREFIX = "llm_provider-"
+
+UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION = re.compile(r"(?:\d+(?:\.\d+)?(?:ms|h|m|s))+")
+
+
+def parse_duration(value) -> Optional[float]:
+    """
+    Seconds from a retry-after or ratelimit-reset header. Accepts plain
+    seconds ("20"), OpenAI durations ("1m30s", "250ms") and timestamps
+    ("2024-07-01T12:00:00Z" or an HTTP date).
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    if DURATION.fullmatch(value):
+        return sum(
+            float(number) * UNITS[unit] for number, unit in DURATION_PART.findall(value)
+        )
+
+    try:
+        reset = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            reset = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    return max(reset.timestamp() - time.time(), 0.0)
+
+
+def normalize_headers(headers) -> Dict[str, str]:
+    if not headers:
+        return {}
+    return {
+        key.lower().removeprefix(PREFIX): value for key, value in dict(headers).items()
+    }
+
+
+class RateLimited(Exception):
+    """Raised when a request would have to wait on the rate limiter for too long."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class Bucket:
+    def __init__(self):
+        self.capacity: Optional[float] = None
+        self.tokens: float = 0.0
+        self.refill_rate: float = 0.0
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.failures = 0
+
+    def refill(self, now: float):
+        if self.capacity is not None:
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.refill_rate
+            )
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        self.refill(now)
+        wait = max(self.blocked_until - now, 0.0)
+        if self.capacity is not None and self.tokens < 1 and self.refill_rate > 0:
+            wait = max(wait, (1 - self.tokens) / self.refill_rate)
+        return wait
+
+
+class RateLimiter:
+    """
+    Token bucket per provider and API key, shared by every session in the
+    process. Buckets learn their size from the provider's ratelimit headers,
+    are paused until reset when a limit is exhausted, and back off
+    exponentially with jitter on a rate limit error that has no retry-after.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets: Dict[tuple, Bucket] = {}
+
+    @classmethod
+    def get(cls) -> "RateLimiter":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def _bucket(self, key) -> Bucket:
+        if key not in self.buckets:
+            self.buckets[key] = Bucket()
+        return self.buckets[key]
+
+    def delay(self, key) -> float:
+        """Seconds to wait before the next request for key, with jitter when non-zero."""
+        with self.lock:
+            wait = self._bucket(key).delay(time.monotonic())
+        if wait:
+            wait += random.uniform(0, wait * JITTER)
+        return wait
+
+    def acquire(self, key, timeout: Optional[float] = None) -> bool:
+        """Block until a request for key may be sent and take a token for it."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.delay(key)
+            if not wait:
+                with self.lock:
+                    bucket = self._bucket(key)
+                    now = time.monotonic()
+                    if not bucket.delay(now):
+                        if bucket.capacity is not None:
+                            bucket.tokens -= 1
+                        return True
+                continue
+            if deadline is not None:
+                if time.monotonic() + wait > deadline:
+                    return False
+            time.sleep(wait)
+
+    def _update_from_headers(self, bucket: Bucket, headers: Dict[str, str], now: float):
+        limit = headers.get("x-ratelimit-limit-requests") or headers.get(
+            "anthropic-ratelimit-requests-limit"
+        )
+        remaining = headers.get("x-ratelimit-remaining-requests") or headers.get(
+            "anthropic-ratelimit-requests-remaining"
+        )
+        if limit is not None:
+            try:
+                if bucket.capacity is None:
+                    bucket.tokens = float(limit)
+                bucket.capacity = float(limit)
+                # Provider request limits are per minute
+                bucket.refill_rate = bucket.capacity / 60
+            except ValueError:
+                pass
+        if remaining is not None and bucket.capacity is not None:
+            try:
+                bucket.tokens = min(float(remaining), bucket.capacity)
+            except ValueError:
+                pass
+
+        for kind in ("requests", "tokens"):
+            left = headers.get(f"x-ratelimit-remaining-{kind}") or headers.get(
+                f"anthropic-ratelimit-{kind}-remaining"
+            )
+            if left is not None and left.strip() in ("0", "0.0"):
+                reset = parse_duration(
+                    headers.get(f"x-ratelimit-reset-{kind}")
+                    or headers.get(f"anthropic-ratelimit-{kind}-reset")
+                )
+                if reset:
+                    bucket.blocked_until = max(bucket.blocked_until, now + reset)
+
+    def record_success(self, key, headers=None):
+        now = time.monotonic()
+        with self.lock:
+            bucket = self._bucket(key)
+            bucket.refill(now)
+            bucket.failures = 0
+            self._update_from_headers(bucket, normalize_headers(headers), now)
+
+    def record_limited(self, key, headers=None) -> float:
+        """Pause key after a rate limit error and return the pause in seconds."""
+        headers = normalize_headers(headers)
+        now = time.monotonic()
+        with self.lock:
+            bucket = self._bucket(key)
+            bucket.refill(now)
+            bucket.failures += 1
+            self._update_from_headers(bucket, headers, now)
+            retry_after = parse_duration(headers.get("retry-after-ms"))
+            if retry_after is not None:
+                retry_after /= 1000
+            else:
+                retry_after = parse_duration(headers.get("retry-after"))
+            if retry_after is None:
+                retry_after = min(
+                    BACKOFF_BASE * 2 ** (bucket.failures - 1), BACKOFF_MAX
+                ) * random.uniform(0.5, 1)
+            bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+            if bucket.capacity is not None:
+                bucket.tokens = min(bucket.tokens, 0)
+            return bucket.blocked_until - now
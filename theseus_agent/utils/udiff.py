@@ -5,8 +5,7 @@ from typing import List, Optional
 
 from pydantic import BaseModel
 
-from theseus_agent.utils import LOGGER_NAME
-from theseus_agent.utils.utils import Hallucination
+from theseus_agent.utils.utils import LOGGER_NAME, Hallucination
 
 logger = logging.getLogger(LOGGER_NAME)
 DATA_LOGGER_NAME = "udiff_data"
@@ -220,10 +219,53 @@ def levenshtein_distance(s1, s2):
     return dp[m][n]
 
 
+def within_distance(s1, s2, k=1):
+    """
+    Whether the Levenshtein distance between s1 and s2 is at most k. Only the
+    diagonal band of width 2k + 1 is computed, and the scan stops as soon as
+    every cell in a row exceeds k.
+    """
+    if s1 == s2:
+        return True
+    m, n = len(s1), len(s2)
+    if k <= 0 or abs(m - n) > k:
+        return False
+
+    if k == 1:
+        i = 0
+        while i < m and i < n and s1[i] == s2[i]:
+            i += 1
+        if m == n:
+            return s1[i + 1 :] == s2[i + 1 :]
+        if m > n:
+            return s1[i + 1 :] == s2[i:]
+        return s1[i:] == s2[i + 1 :]
+
+    # Cells outside the band are treated as k + 1, i.e. "too far"
+    too_far = k + 1
+    previous = [j if j <= k else too_far for j in range(n + 1)]
+    for i in range(1, m + 1):
+        low, high = max(1, i - k), min(n, i + k)
+        current = [too_far] * (n + 1)
+        current[0] = i if i <= k else too_far
+        row_min = current[0]
+        for j in range(low, high + 1):
+            if s1[i - 1] == s2[j - 1]:
+                cell = previous[j - 1]
+            else:
+                cell = min(previous[j - 1], previous[j], current[j - 1]) + 1
+            current[j] = cell if cell <= k else too_far
+            row_min = min(row_min, current[j])
+        if row_min > k:
+            return False
+        previous = current
+
+    return previous[n] <= k
+
+
 def is_fuzzy_match(s1, s2, threshold=1):
     for a, b in zip(s1, s2):
-        distance = levenshtein_distance(a, b)
-        if distance > threshold:
+        if not within_distance(a, b, threshold):
             return False
     return True
 
@@ -241,18 +283,57 @@ def match_fence(lines, fence, start_index=0):
     return None, None, None
 
 
-def match_fence_all(stripped_file_lines, fence):
-    matches = []
-    src_idx = 0
-    while src_idx < len(stripped_file_lines):
-        start, end, src_idx = match_fence(stripped_file_lines, fence, src_idx)
-        if src_idx is not None:
-            matches.append((start, end, src_idx))
-            src_idx += 1
-        else:
-            break
+class FenceIndex:
+    """
+    Positions of stripped file lines by content and by length. A fence line
+    can only fuzzy match file lines whose length is within one of its own, so
+    candidate windows come from the exact hits plus a check of those lengths
+    instead of a distance computation against every line of the file.
+    """
+
+    def __init__(self, stripped_file_lines):
+        self.lines = stripped_file_lines
+        self.by_content = {}
+        self.by_length = {}
+        for i, (_, line) in enumerate(stripped_file_lines):
+            self.by_content.setdefault(line, []).append(i)
+            self.by_length.setdefault(len(line), []).append(i)
+
+    def line_matches(self, fence_line):
+        """Indices of the lines within distance 1 of fence_line."""
+        matches = set(self.by_content.get(fence_line, []))
+        for length in (len(fence_line) - 1, len(fence_line), len(fence_line) + 1):
+            for i in self.by_length.get(length, []):
+                if i not in matches and within_distance(self.lines[i][1], fence_line, 1):
+                    matches.add(i)
+        return matches
+
+    def match_fence_all(self, fence):
+        if not fence:
+            return []
+        last_start = len(self.lines) - len(fence)
+
+        # Anchor on the fence line with the fewest exact hits, then verify the
+        # remaining lines of each window it proposes
+        anchor = min(range(len(fence)), key=lambda j: len(self.by_content.get(fence[j], [])))
+        starts = sorted(
+            i - anchor
+            for i in self.line_matches(fence[anchor])
+            if 0 <= i - anchor <= last_start
+        )
+
+        matches = []
+        for start in starts:
+            window = [line for _, line in self.lines[start : start + len(fence)]]
+            if is_fuzzy_match(window, fence, 1):
+                matches.append((self.lines[start][0], self.lines[start + len(fence) - 1][0], start))
+        return matches
+
 
-    return matches
+def match_fence_all(stripped_file_lines, fence, index=None):
+    if index is None:
+        index = FenceIndex(stripped_file_lines)
+    return index.match_fence_all(fence)
 
 
 def strip_comment_from_line(line):
@@ -270,12 +351,13 @@ def match_stripped_lines_context_with_fence_len(
     stripped_file_lines, stripped_old_lines, old_lines, fence_len
 ):
     # create code fence based on lines. i.e. first N content lines
+    index = FenceIndex(stripped_file_lines)
 
     # Match single line changes
     if len(stripped_old_lines) == 1:
         begin_fence = stripped_old_lines
         stop_fence = stripped_old_lines
-        begin_matches = match_fence_all(stripped_file_lines, begin_fence)
+        begin_matches = match_fence_all(stripped_file_lines, begin_fence, index)
 
         # If we allowed a single line match, but the match is not unique, bail
         if len(stripped_old_lines) == 1 and len(begin_matches) > 1:
@@ -295,8 +377,8 @@ def match_stripped_lines_context_with_fence_len(
         )
 
     # Match N content lines. This means that the first N content lines will be matched on and the last N content lines will be matched on.
-    begin_matches = match_fence_all(stripped_file_lines, begin_fence)
-    end_matches = match_fence_all(stripped_file_lines, stop_fence)
+    begin_matches = match_fence_all(stripped_file_lines, begin_fence, index)
+    end_matches = match_fence_all(stripped_file_lines, stop_fence, index)
 
     # for each begin match, find first end match
     valid_pairs = []
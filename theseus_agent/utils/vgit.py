@@ -53,7 +53,7 @@ def find_gitignore_files(ctx: ToolContext):
     git_root = get_git_root(ctx)
 
     if git_root:
-        current_dir = ctx["environment"].execute("pwd")[0].strip()
+        current_dir = ctx["environment"].get_cwd()
 
         while current_dir.startswith(git_root):
             gitignore_path = os.path.join(current_dir, ".gitignore")
@@ -209,7 +209,7 @@ def get_all_commits_in_branch(env: EnvironmentModule, repo_path: str, branch_nam
     list: A list of commit hashes from the specified branch.
     """
     # Navigate to the repository path and list all commits in the branch
-    original_path = env.execute("pwd")[0].strip()
+    original_path = env.get_cwd()
     env.execute(f"cd {repo_path}")
     commit_list = env.execute(f'git log {branch_name} --pretty=format:"%H"')[
         0
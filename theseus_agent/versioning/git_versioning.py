@@ -1,7 +1,19 @@
 import subprocess
+from collections import OrderedDict
 
 from theseus_agent.config import Config
 
+# Checkpoint diffs kept per (commit1, commit2); commits never change, so entries never go stale
+DIFF_CACHE_SIZE = 32
+
+
+def null_object_id(object_id: str) -> str:
+    """
+    Object id git uses for "no file" in raw diff output. It is as long as the
+    repository's object ids, 40 hex digits with SHA-1 and 64 with SHA-256.
+    """
+    return "0" * len(object_id)
+
 
 
 # States
@@ -242,6 +254,7 @@ class GitVersioning:
     def __init__(self, project_path, config : Config):
         self.project_path = project_path
         self.config = config
+        self.diff_cache = OrderedDict()
 
     def check_git_installation(self):
         if self.config.versioning_type == "none":
@@ -511,33 +524,95 @@ class GitVersioning:
             # Any other unexpected error
             return 1, f"Unexpected error: {result.stderr}"
 
+    def resolve_commits(self, *commits):
+        """Full hashes for commits, or an error naming the first invalid one."""
+        result = subprocess.run(
+            ["git", "rev-parse", *[f"{commit}^{{commit}}" for commit in commits]],
+            cwd=self.project_path,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode == 0:
+            return result.stdout.split(), None
+        for commit in commits:
+            check = subprocess.run(["git", "rev-parse", "--verify", f"{commit}^{{commit}}"], cwd=self.project_path, capture_output=True, text=True)
+            if check.returncode != 0:
+                return None, f"Error: Invalid commit '{commit}'"
+        return None, f"Error resolving commits: {result.stderr}"
+
+    def read_blobs(self, object_ids):
+        """Contents of many blobs from one git cat-file --batch. Missing objects read as ""."""
+        if not object_ids:
+            return {}
+        result = subprocess.run(
+            ["git", "cat-file", "--batch"],
+            cwd=self.project_path,
+            input="".join(f"{object_id}\n" for object_id in object_ids).encode(),
+            capture_output=True,
+        )
+        output = result.stdout
+        blobs = {}
+        offset = 0
+        for object_id in object_ids:
+            header_end = output.find(b"\n", offset)
+            if header_end == -1:
+                break
+            header = output[offset:header_end].split()
+            offset = header_end + 1
+            if len(header) != 3:
+                # "<object> missing" or "<object> ambiguous"
+                blobs[object_id] = ""
+                continue
+            size = int(header[2])
+            content = output[offset : offset + size]
+            blobs[object_id] = content.decode("utf-8", errors="replace") if header[1] == b"blob" else ""
+            offset += size + 1
+        return blobs
+
     def get_diff_list(self, commit1, commit2):
-        # Check if commits are valid
-        for commit in [commit1, commit2]:
-            result = subprocess.run(["git", "rev-parse", "--verify", commit], cwd=self.project_path, capture_output=True, text=True)
-            if result.returncode != 0:
-                return [], f"Error: Invalid commit '{commit}'"
-
-        # Get the list of files that differ between the two commits
-        diff_command = ["git", "diff", "--name-only", commit1, commit2]
-        result = subprocess.run(diff_command, cwd=self.project_path, capture_output=True, text=True)
-        
-        if result.returncode != 0:
-            return [], f"Error getting diff: {result.stderr}"
+        """
+        (file, before, after) for every file that differs between two commits.
+        Takes three git processes however many files changed: one to resolve
+        the commits, one raw diff for the changed paths and their blob ids and
+        one cat-file for all of the contents. Results are cached per pair of
+        resolved commits.
+        """
+        commits, error = self.resolve_commits(commit1, commit2)
+        if error:
+            return [], error
+        key = tuple(commits)
+        if key in self.diff_cache:
+            self.diff_cache.move_to_end(key)
+            return self.diff_cache[key], None
+
+        # Get the files that differ between the two commits with their blob ids
+        diff_command = ["git", "diff", "--raw", "-z", "--no-abbrev", "--no-renames", *commits]
+        result = subprocess.run(diff_command, cwd=self.project_path, capture_output=True)
 
-        files = result.stdout.split('\n')
-        
-        diff_list = []
-        for file in files:
-            if not file:
-                continue
-            status1, before_content = self.get_file_content(commit1, file)
-            status2, after_content = self.get_file_content(commit2, file)
-            
-            if status1 == 1 or status2 == 1:
-                # If there was an error getting the content, return the error
-                return [], before_content if status1 == 1 else after_content
-            
-            diff_list.append((file, before_content, after_content))
-        
+        if result.returncode != 0:
+            return [], f"Error getting diff: {result.stderr.decode(errors='replace')}"
+
+        null_object = null_object_id(commits[0])
+        fields = result.stdout.decode("utf-8", errors="replace").split("\0")
+        changes = []
+        for status, file in zip(fields[0::2], fields[1::2]):
+            # :<mode before> <mode after> <blob before> <blob after> <status>
+            _, _, before_id, after_id, _ = status.split(" ")
+            changes.append((file, before_id, after_id))
+
+        object_ids = list({
+            object_id
+            for _, before_id, after_id in changes
+            for object_id in (before_id, after_id)
+            if object_id != null_object
+        })
+        blobs = self.read_blobs(object_ids)
+        diff_list = [
+            (file, blobs.get(before_id, ""), blobs.get(after_id, ""))
+            for file, before_id, after_id in changes
+        ]
+
+        self.diff_cache[key] = diff_list
+        if len(self.diff_cache) > DIFF_CACHE_SIZE:
+            self.diff_cache.popitem(last=False)
         return diff_list, None  # Return None as the second item if there's no error